@@ -8,23 +8,34 @@
     :license: GPLv3, see LICENSE for more details.
 """
 from trytond.pool import Pool
-from .country import Subdivision
+from .country import Country, Subdivision
+from .currency import Currency
 from .party import Party, Address
-from .product import Product
+from .product import Product, Uom
 from .sale import Sale
+from .import_run import EbayImportRun, EbayImportRunStage
+from .listing import EbayListing
 from channel import (
-    SaleChannel, CheckEbayTokenStatusView, CheckEbayTokenStatus,
+    SaleChannel, EbayOrderCheckpoint, CheckEbayTokenStatusView,
+    CheckEbayTokenStatus,
 )
 
 
 def register():
     "Register classes with pool"
     Pool.register(
+        Country,
         Subdivision,
+        Currency,
         Party,
         Address,
         SaleChannel,
+        EbayOrderCheckpoint,
+        EbayImportRun,
+        EbayImportRunStage,
+        EbayListing,
         Product,
+        Uom,
         Sale,
         CheckEbayTokenStatusView,
         module='ebay', type_='model'
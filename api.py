@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+    api
+
+    Helpers to talk to the eBay trading API
+
+    :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
+    :license: GPLv3, see LICENSE for more details.
+"""
+import time
+import types
+import threading
+from io import BytesIO
+from contextlib import contextmanager
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait, \
+    FIRST_COMPLETED
+from ebaysdk.trading import Connection as trading
+from ebaysdk.exception import ConnectionError
+
+from .cassette import get_cassette
+
+
+# Default maximum number of calls made to eBay at the same time, by channel
+MAX_PARALLEL_CALLS = 32
+
+# Number of seconds of the daily call limit which can be used at once
+EBAY_CALL_BURST_SECONDS = 3600
+
+# Call executors of the process, by key of the channel
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+class TradingConnection(trading):
+    """
+    Trading API connection which asks eBay for gzip encoded responses.
+
+    The connection keeps its HTTP session, so the TLS connection to eBay is
+    kept alive between the calls made with the same connection.
+
+    When a cassette is configured, the calls are recorded to it or replayed
+    from it, see `cassette.Cassette`.
+    """
+
+    def build_request_headers(self, verb):
+        headers = super(TradingConnection, self).build_request_headers(verb)
+        headers['Accept-Encoding'] = 'gzip'
+        return headers
+
+    def execute_request(self):
+        cassette = get_cassette()
+        if cassette is None:
+            return super(TradingConnection, self).execute_request()
+
+        if cassette.mode == 'replay':
+            self.response = cassette.replay(self.verb, self.request.body)
+        else:
+            super(TradingConnection, self).execute_request()
+            cassette.record(self.verb, self.request.body, self.response)
+
+    @contextmanager
+    def stream(self, verb, data=None):
+        """
+        Send a call and give the raw XML response as a file object which is
+        read from the network as it is consumed. The response is not parsed
+        nor checked for errors by ebaysdk.
+
+        :param verb: Name of the API call
+        :param data: Data of the call
+        """
+        self._reset()
+        self.build_request(verb, data, None)
+
+        if get_cassette() is not None:
+            self.execute_request()
+            yield BytesIO(self.response.content)
+            return
+
+        response = self.session.send(
+            self.request, verify=True, proxies=self.proxies,
+            timeout=self.timeout, allow_redirects=True, stream=True
+        )
+        try:
+            if response.status_code != 200:
+                raise ConnectionError(
+                    '%s: %s %s' % (verb, response.status_code,
+                                   response.reason), response
+                )
+            # Let urllib3 decompress the gzip encoded response
+            response.raw.decode_content = True
+            yield response.raw
+        finally:
+            response.close()
+
+
+class ConnectionPool(object):
+    """
+    Pool of trading API connections sharing the same credentials.
+
+    Connections are not thread safe, so a connection is used by one thread
+    at a time and put back in the pool once the call is done.
+
+    :param factory: Callable returning a new trading api connection. It
+                    must not use the ORM as it may be called from threads
+                    which do not have a transaction.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.idle = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection from the pool, creating one if all the
+        connections are in use
+        """
+        with self.lock:
+            api = self.idle.pop() if self.idle else None
+        if api is None:
+            api = self.factory()
+        try:
+            yield api
+        finally:
+            with self.lock:
+                self.idle.append(api)
+
+    def execute(self, verb, data=None):
+        """
+        Execute a call with a connection of the pool
+
+        :return: Response dictionary
+        """
+        with self.connection() as api:
+            return api.execute(verb, data).dict()
+
+    @contextmanager
+    def stream(self, verb, data=None):
+        """
+        Execute a call with a connection of the pool and give its raw
+        response as a file object, see `TradingConnection.stream`. The
+        connection is put back in the pool once the block is done.
+        """
+        with self.connection() as api:
+            with api.stream(verb, data) as response:
+                yield response
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter, safe to share between threads.
+
+    :param rate: Number of tokens added to the bucket per second
+    :param capacity: Maximum number of tokens in the bucket, which is the
+                     number of calls that can be made in a burst
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = max(float(capacity), 1.0)
+        self.tokens = self.capacity
+        self.timestamp = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token from the bucket, waiting until one is available
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.timestamp) * self.rate
+                )
+                self.timestamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CallExecutor(object):
+    """
+    Execute calls to the trading API on a bounded pool of threads, within
+    the rate allowed by a token bucket.
+
+    :param pool: Connection pool used to make the calls
+    :param fingerprint: Fingerprint of the settings the executor is built
+                        from, see `get_call_executor`
+    :param max_workers: Maximum number of calls in flight
+    :param daily_limit: Number of calls per day the calls are spread to.
+                        The bucket is local to the executor, so the limit
+                        is not shared with the other processes and starts
+                        full again when the process restarts. The calls
+                        are not rate limited if it is not set.
+    """
+
+    def __init__(
+        self, pool, fingerprint, max_workers=MAX_PARALLEL_CALLS,
+        daily_limit=None
+    ):
+        self.pool = pool
+        self.fingerprint = fingerprint
+        self.executor = ThreadPoolExecutor(max_workers=max(max_workers, 1))
+        self.bucket = None
+        if daily_limit:
+            rate = daily_limit / 86400.0
+            self.bucket = TokenBucket(rate, rate * EBAY_CALL_BURST_SECONDS)
+
+    def _execute(self, verb, data):
+        if self.bucket is not None:
+            self.bucket.acquire()
+        return self.pool.execute(verb, data)
+
+    def submit(self, verb, data=None):
+        """
+        Schedule a call to eBay
+
+        :return: Future of the response dictionary
+        """
+        return self.executor.submit(self._execute, verb, data)
+
+    @contextmanager
+    def stream(self, verb, data=None):
+        """
+        Execute a call in the current thread, within the rate of the
+        executor, and give its raw response as a file object so that it can
+        be parsed while it is received.
+        """
+        if self.bucket is not None:
+            self.bucket.acquire()
+        with self.pool.stream(verb, data) as response:
+            yield response
+
+    def shutdown(self):
+        """
+        Stop the threads once the scheduled calls are done
+        """
+        self.executor.shutdown(wait=False)
+
+
+def get_call_executor(key, fingerprint, build_executor):
+    """
+    Return the call executor registered for `key`.
+
+    A new executor is registered if there is none yet or if the settings
+    of the channel changed since the executor was built.
+
+    :param key: Key of the channel in the process, e.g. database and id
+    :param fingerprint: Fingerprint of the current settings of the channel
+    :param build_executor: Callable returning a new executor, only called
+                           when one has to be built
+    """
+    with _executors_lock:
+        executor = _executors.get(key)
+        if executor is None or executor.fingerprint != fingerprint:
+            if executor is not None:
+                executor.shutdown()
+            executor = _executors[key] = build_executor()
+        return executor
+
+
+def invalidate_call_executor(key):
+    """
+    Drop the call executor registered for `key`
+    """
+    with _executors_lock:
+        executor = _executors.pop(key, None)
+    if executor is not None:
+        executor.shutdown()
+
+
+def clear_call_executors():
+    """
+    Drop all the call executors of the process
+    """
+    with _executors_lock:
+        executors = _executors.values()
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown()
+
+
+class Return(Exception):
+    """
+    Raised by a coroutine to return a value, see `run_coroutines`
+    """
+
+    def __init__(self, value=None):
+        super(Return, self).__init__(value)
+        self.value = value
+
+
+def gather(futures):
+    """
+    Return a future of the list of the results of `futures`, which fails
+    with the exception of the first of them which fails
+    """
+    futures = list(futures)
+    result = Future()
+    if not futures:
+        result.set_result([])
+        return result
+
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(future):
+        with lock:
+            remaining[0] -= 1
+            if result.done():
+                return
+            if future.exception() is not None:
+                result.set_exception(future.exception())
+            elif not remaining[0]:
+                result.set_result([f.result() for f in futures])
+
+    for future in futures:
+        future.add_done_callback(done)
+    return result
+
+
+def run_coroutines(coroutines):
+    """
+    Run coroutines in the current thread until they are all done, and
+    return their values in the same order.
+
+    A coroutine is a generator which yields the futures of the calls to
+    eBay it waits for, e.g. from `CallExecutor.submit` or `gather`, and
+    is resumed with their result once they are done. It can also yield
+    another coroutine to wait for its value. It returns a value by raising
+    `Return`.
+
+    The coroutines run their code in the current thread, so they can use
+    the transaction, while the calls they wait for are in flight together.
+    The first exception raised by a coroutine or a call is raised.
+    """
+    results = [None] * len(coroutines)
+    # Stack of the coroutines waiting for each other, by coroutine
+    stacks = [[coroutine] for coroutine in coroutines]
+    waiting = {}
+
+    def step(index, value=None, exception=None):
+        stack = stacks[index]
+        while stack:
+            try:
+                if exception is not None:
+                    yielded = stack[-1].throw(exception)
+                else:
+                    yielded = stack[-1].send(value)
+            except Return as result:
+                stack.pop()
+                value, exception = result.value, None
+                continue
+            except StopIteration:
+                stack.pop()
+                value, exception = None, None
+                continue
+            except Exception as error:
+                # Raise in the coroutine waiting for this one, if any
+                stack.pop()
+                if not stack:
+                    raise
+                value, exception = None, error
+                continue
+            if isinstance(yielded, types.GeneratorType):
+                stack.append(yielded)
+                value, exception = None, None
+                continue
+            waiting[yielded] = index
+            return
+        results[index] = value
+
+    for index in range(len(coroutines)):
+        step(index)
+    while waiting:
+        done, _ = wait(waiting.keys(), return_when=FIRST_COMPLETED)
+        for future in done:
+            index = waiting.pop(future)
+            if future.exception() is not None:
+                step(index, exception=future.exception())
+            else:
+                step(index, future.result())
+    return results
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+    cassette
+
+    Record and replay of the traffic with the eBay trading API
+
+    :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
+    :license: GPLv3, see LICENSE for more details.
+"""
+import re
+import json
+import threading
+from collections import defaultdict
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from trytond.config import config
+
+# The token of the channel is never written to a cassette
+TOKEN_PATTERN = re.compile(r'<eBayAuthToken>.*?</eBayAuthToken>', re.S)
+TOKEN_PLACEHOLDER = '<eBayAuthToken>***</eBayAuthToken>'
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+class Cassette(object):
+    """
+    File of the raw XML requests and responses of the calls to eBay.
+
+    In `record` mode the calls are sent to eBay and each request and
+    response is appended to the file, one JSON object per line. In `replay`
+    mode no call is sent to eBay: each call is answered with the recorded
+    response of the same call name and request, or else with the next
+    recorded response of the same call name which was not replayed yet.
+
+    :param path: Path of the cassette file
+    :param mode: `record` or `replay`
+    """
+
+    def __init__(self, path, mode='replay'):
+        assert mode in ('record', 'replay'), mode
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.recordings = None
+
+    @staticmethod
+    def clean_request(body):
+        """
+        Return the request body as text, without the token
+        """
+        if body is None:
+            return u''
+        if isinstance(body, str):
+            body = body.decode('utf-8')
+        return TOKEN_PATTERN.sub(TOKEN_PLACEHOLDER, body)
+
+    def record(self, verb, request_body, response):
+        """
+        Append a call to the cassette
+
+        :param verb: Name of the API call
+        :param request_body: Body of the request sent to eBay
+        :param response: `requests` response received from eBay
+        """
+        line = json.dumps({
+            'verb': verb,
+            'request': self.clean_request(request_body),
+            'status_code': response.status_code,
+            'reason': response.reason,
+            'headers': dict(response.headers),
+            'response': response.content.decode('utf-8'),
+        })
+        with self.lock:
+            with open(self.path, 'a') as cassette_file:
+                cassette_file.write(line + '\n')
+
+    def load(self):
+        """
+        Read the recorded calls, grouped by call name
+        """
+        recordings = defaultdict(list)
+        with open(self.path) as cassette_file:
+            for line in cassette_file:
+                if line.strip():
+                    recording = json.loads(line)
+                    recordings[recording['verb']].append(recording)
+        return recordings
+
+    def replay(self, verb, request_body):
+        """
+        Return the recorded response of a call
+
+        :param verb: Name of the API call
+        :param request_body: Body of the request which would be sent to eBay
+        :return: `requests` response built from the recording
+        """
+        request = self.clean_request(request_body)
+        with self.lock:
+            if self.recordings is None:
+                self.recordings = self.load()
+            recordings = self.recordings.get(verb)
+            if not recordings:
+                raise LookupError(
+                    'No recorded response left for %s in %s'
+                    % (verb, self.path)
+                )
+            for index, recording in enumerate(recordings):
+                if recording['request'] == request:
+                    break
+            else:
+                index = 0
+            recording = recordings.pop(index)
+
+        response = Response()
+        response.status_code = recording['status_code']
+        response.reason = recording['reason']
+        response.headers = CaseInsensitiveDict(recording['headers'])
+        # The recorded content is already decoded
+        response.headers.pop('Content-Encoding', None)
+        response.encoding = 'utf-8'
+        response._content = recording['response'].encode('utf-8')
+        return response
+
+
+def get_cassette():
+    """
+    Return the cassette of the process, or None if the calls are not
+    recorded or replayed.
+
+    The cassette is read from the `cassette` option of the `ebay` section of
+    the configuration, and its mode from the `cassette_mode` option.
+    """
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            path = config.get('ebay', 'cassette')
+            _cassette = path and Cassette(
+                path, config.get('ebay', 'cassette_mode', default='replay')
+            ) or False
+        return _cassette or None
+
+
+def set_cassette(cassette):
+    """
+    Replace the cassette of the process
+
+    :param cassette: Instance of Cassette, False to disable recording and
+                     replay or None to use the configured one
+    """
+    global _cassette
+    with _cassette_lock:
+        _cassette = cassette
@@ -5,27 +5,99 @@
     :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
     :license: GPLv3, see LICENSE for more details.
 """
+import hashlib
+import logging
 import dateutil.parser
-from datetime import datetime
+from decimal import Decimal
+from datetime import datetime, timedelta
+from functools import partial
+from contextlib import contextmanager
 
-from ebaysdk.trading import Connection as trading
+from concurrent.futures import ThreadPoolExecutor
+from sql import Literal, Null
+from sql.aggregate import Count
+from ebaysdk.exception import ConnectionError
+from trytond import backend
+from trytond.tools import grouped_slice
 from trytond.transaction import Transaction
 from trytond.wizard import Wizard, StateView, Button
-from trytond.model import ModelView, fields
+from trytond.model import ModelView, ModelSQL, fields
 from trytond.pool import Pool, PoolMeta
 from trytond.pyson import Eval
 
+from .response_cache import get_response_cache
+from .order_stream import OrderStream
+from .records import EbayOrder, as_list
+from .instrumentation import ImportRecorder, count_api_call, instrumented, \
+    instrumented_coroutine, stage
+from .api import CallExecutor, ConnectionPool, TradingConnection, Return, \
+    gather, get_call_executor, invalidate_call_executor, run_coroutines, \
+    MAX_PARALLEL_CALLS
+
 
 __all__ = [
-    'SaleChannel', 'CheckEbayTokenStatusView', 'CheckEbayTokenStatus',
+    'SaleChannel', 'EbayOrderCheckpoint', 'CheckEbayTokenStatusView',
+    'CheckEbayTokenStatus',
 ]
 __metaclass__ = PoolMeta
 
-EBAY_STATES = {
-    'required': Eval('source') == 'ebay',
+logger = logging.getLogger(__name__)
+
+INVISIBLE_IF_NOT_EBAY = {
     'invisible': ~(Eval('source') == 'ebay')
 }
 
+EBAY_STATES = dict(INVISIBLE_IF_NOT_EBAY, required=Eval('source') == 'ebay')
+
+# Fields of the channel used to connect and make calls to eBay
+EBAY_CONNECTION_FIELDS = [
+    'ebay_app_id', 'ebay_dev_id', 'ebay_cert_id', 'ebay_token',
+    'is_ebay_sandbox', 'ebay_max_concurrent_calls', 'ebay_daily_call_limit',
+]
+
+# Maximum value of EntriesPerPage accepted by GetOrders
+EBAY_MAX_ORDERS_PER_PAGE = 100
+
+# Default bounds of the interval between scheduled imports, in minutes
+EBAY_MIN_POLL_INTERVAL = 5
+EBAY_MAX_POLL_INTERVAL = 240
+
+# Number of channels imported at the same time by the scheduler
+EBAY_SCHEDULER_WORKERS = 4
+
+# Default time to live of the cached GetItem and GetUser responses, in hours
+EBAY_CACHE_TTL = 24
+
+# Default maximum number of cached responses of a channel
+EBAY_CACHE_SIZE = 10000
+
+# Time after which the lease of a scheduled import is considered stale
+EBAY_IMPORT_LEASE = timedelta(hours=2)
+
+# Maximum value of EntriesPerPage accepted by GetSellerList with all details
+EBAY_MAX_ITEMS_PER_PAGE = 200
+
+# Range of the end times of the listings fetched by a GetSellerList call.
+# eBay accepts at most 120 days and counts both bounds, so a day is kept as
+# a margin.
+EBAY_SELLER_LIST_RANGE = timedelta(days=119)
+
+# Default number of days the ended listings are still synced
+EBAY_CATALOG_ENDED_DAYS = 30
+
+# Maximum number of InventoryStatus accepted by ReviseInventoryStatus
+EBAY_MAX_INVENTORY_PER_CALL = 4
+
+
+def get_transient_errors():
+    """
+    Return the tuple of the exceptions raised by errors which may not happen
+    again, e.g. when eBay or the database can not be reached
+    """
+    return (
+        ConnectionError, IOError, backend.get('DatabaseOperationalError'),
+    )
+
 
 class SaleChannel:
     "Sale Channel"
@@ -52,14 +124,186 @@ class SaleChannel:
         "developer home. If it expirees, then a new one should be generated",
     )
 
+    ebay_token_hash = fields.Char(
+        'eBay Token Hash', readonly=True, select=True,
+        help="SHA-256 of the eBay token, used to compare tokens",
+    )
+
     is_ebay_sandbox = fields.Boolean(
         'Is eBay sandbox ?',
         help="Select this if this account is a sandbox account",
-        states={
-            'invisible': ~(Eval('source') == 'ebay')
-        }, depends=['source']
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_orders_per_page = fields.Integer(
+        'eBay Orders Per Page', help="Number of orders fetched from eBay in "
+        "each GetOrders call (maximum 100)",
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_max_concurrent_calls = fields.Integer(
+        'eBay Concurrent Calls', help="Maximum number of calls made to eBay "
+        "at the same time",
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_daily_call_limit = fields.Integer(
+        'eBay Daily Call Limit', help="Number of calls to the trading API "
+        "per day the calls of this channel are spread to, e.g. the calls "
+        "allowed by eBay for this application. The limit is applied by each "
+        "Tryton process on its own and starts over when the process "
+        "restarts, so it does not guarantee the daily quota of eBay. Leave "
+        "empty to not limit the calls.",
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_order_sync_mode = fields.Selection([
+        ('create', 'Creation Time'),
+        ('modified', 'Modification Time'),
+    ], 'eBay Order Sync Mode', help="Import the orders created on eBay since "
+        "the last import, or the orders modified since the last import. "
+        "Orders which are completed some time after their creation are only "
+        "imported when using the modification time.",
+        states=EBAY_STATES, depends=['source']
+    )
+
+    ebay_import_runs = fields.One2Many(
+        'sale.channel.ebay.import_run', 'channel', 'eBay Import Runs',
+        readonly=True, states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_listings = fields.One2Many(
+        'sale.channel.ebay.listing', 'channel', 'eBay Listings',
+        readonly=True, states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_order_checkpoints = fields.One2Many(
+        'sale.channel.ebay.checkpoint', 'channel', 'eBay Order Checkpoints',
+        readonly=True, states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_min_poll_interval = fields.Integer(
+        'eBay Minimum Poll Interval', help="Minimum number of minutes "
+        "between two scheduled order imports",
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_max_poll_interval = fields.Integer(
+        'eBay Maximum Poll Interval', help="Maximum number of minutes "
+        "between two scheduled order imports",
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_poll_interval = fields.Integer(
+        'eBay Poll Interval', readonly=True, help="Current number of "
+        "minutes between two scheduled order imports. It is adapted to the "
+        "number of orders found by the recent imports.",
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_next_order_import = fields.DateTime(
+        'eBay Next Order Import', readonly=True,
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_import_lease_until = fields.DateTime(
+        'eBay Import Running Until', readonly=True, help="Set while an "
+        "order import or a catalog sync is running for this channel",
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_item_cache_ttl = fields.Integer(
+        'eBay Item Cache TTL', help="Number of hours the items fetched from "
+        "eBay are kept in cache. Set 0 to not cache the items.",
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_user_cache_ttl = fields.Integer(
+        'eBay User Cache TTL', help="Number of hours the users fetched from "
+        "eBay are kept in cache. Set 0 to not cache the users.",
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_cache_size = fields.Integer(
+        'eBay Cache Size', help="Maximum number of responses of eBay kept "
+        "in cache for this channel. The least recently used ones are "
+        "removed first.",
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_cache_hits = fields.Function(
+        fields.Integer(
+            'eBay Cache Hits',
+            states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+        ), 'get_ebay_cache_stats'
+    )
+
+    ebay_cache_misses = fields.Function(
+        fields.Integer(
+            'eBay Cache Misses',
+            states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+        ), 'get_ebay_cache_stats'
+    )
+
+    ebay_catalog_ended_days = fields.Integer(
+        'eBay Ended Listings Days', help="Number of days the listings which "
+        "ended are still synced to the catalog",
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
     )
 
+    ebay_last_catalog_sync = fields.DateTime(
+        'eBay Last Catalog Sync', readonly=True,
+        states=INVISIBLE_IF_NOT_EBAY, depends=['source']
+    )
+
+    ebay_unknown_state = fields.Selection([
+        ('error', 'Raise Error'),
+        ('empty', 'Leave State Empty'),
+    ], 'Unknown eBay State', help="What to do when the state of an address "
+        "from eBay does not match any subdivision of its country",
+        states=EBAY_STATES, depends=['source']
+    )
+
+    @staticmethod
+    def default_ebay_min_poll_interval():
+        return EBAY_MIN_POLL_INTERVAL
+
+    @staticmethod
+    def default_ebay_max_poll_interval():
+        return EBAY_MAX_POLL_INTERVAL
+
+    @staticmethod
+    def default_ebay_item_cache_ttl():
+        return EBAY_CACHE_TTL
+
+    @staticmethod
+    def default_ebay_user_cache_ttl():
+        return EBAY_CACHE_TTL
+
+    @staticmethod
+    def default_ebay_cache_size():
+        return EBAY_CACHE_SIZE
+
+    @staticmethod
+    def default_ebay_catalog_ended_days():
+        return EBAY_CATALOG_ENDED_DAYS
+
+    @staticmethod
+    def default_ebay_order_sync_mode():
+        return 'create'
+
+    @staticmethod
+    def default_ebay_unknown_state():
+        return 'error'
+
+    @staticmethod
+    def default_ebay_orders_per_page():
+        return EBAY_MAX_ORDERS_PER_PAGE
+
+    @staticmethod
+    def default_ebay_max_concurrent_calls():
+        return MAX_PARALLEL_CALLS
+
     @classmethod
     def get_source(cls):
         """
@@ -94,13 +338,87 @@ class SaleChannel:
                 'No new orders have been placed on eBay for this '
                 'Channel after %s',
             "invalid_channel": "Current channel does not belong to eBay!",
+            "import_running":
+                'An import of the orders or a sync of the catalog of this '
+                'channel is already running',
             'same_ebay_credentials':
-                'All the ebay credentials should be unique.'
+                'All the ebay credentials should be unique. '
+                'Duplicated for eBay AppID(s): %s'
         })
         cls._buttons.update({
             'check_ebay_token_status': {},
         })
 
+    @classmethod
+    def __register__(cls, module_name):
+        TableHandler = backend.get('TableHandler')
+        cursor = Transaction().cursor
+        table = TableHandler(cursor, cls, module_name)
+
+        token_hash_exists = table.column_exist('ebay_token_hash')
+
+        super(SaleChannel, cls).__register__(module_name)
+
+        # Migration: Fill the hash of existing tokens
+        if not token_hash_exists:
+            sql_table = cls.__table__()
+            cursor.execute(*sql_table.select(
+                sql_table.id, sql_table.ebay_token,
+                where=sql_table.ebay_token != Null
+            ))
+            for channel_id, token in cursor.fetchall():
+                cursor.execute(*sql_table.update(
+                    columns=[sql_table.ebay_token_hash],
+                    values=[cls.get_ebay_token_hash(token)],
+                    where=sql_table.id == channel_id
+                ))
+
+    @staticmethod
+    def get_ebay_token_hash(token):
+        """
+        Return the hash stored in `ebay_token_hash` for the given token
+        """
+        if not token:
+            return None
+        if isinstance(token, unicode):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).hexdigest()
+
+    @classmethod
+    def create(cls, vlist):
+        """
+        Store the hash of the eBay token
+        """
+        vlist = [values.copy() for values in vlist]
+        for values in vlist:
+            if 'ebay_token' in values:
+                values['ebay_token_hash'] = cls.get_ebay_token_hash(
+                    values['ebay_token']
+                )
+        return super(SaleChannel, cls).create(vlist)
+
+    @classmethod
+    def write(cls, *args):
+        """
+        Update the hash of the eBay token
+        """
+        args = list(args)
+        reconnect = []
+        for i in range(0, len(args), 2):
+            channels, values = args[i:i + 2]
+            if 'ebay_token' in values:
+                args[i + 1] = values = values.copy()
+                values['ebay_token_hash'] = cls.get_ebay_token_hash(
+                    values['ebay_token']
+                )
+            if any(name in values for name in EBAY_CONNECTION_FIELDS):
+                reconnect.extend(channels)
+        super(SaleChannel, cls).write(*args)
+
+        # Connections made with the old credentials must not be reused
+        for channel in reconnect:
+            invalidate_call_executor(channel.get_ebay_connection_key())
+
     @classmethod
     def validate(cls, channels):
         """
@@ -108,35 +426,65 @@ class SaleChannel:
         """
         super(SaleChannel, cls).validate(channels)
 
-        for channel in channels:
-            channel.check_unique_app_dev_cert_token()
+        cls.check_unique_ebay_credentials(channels)
 
     def check_unique_app_dev_cert_token(self):
         """
         App ID, Dev ID, Cert ID and Token must be unique
         """
-        if not all([
-            self.ebay_app_id, self.ebay_dev_id,
-            self.ebay_cert_id, self.ebay_token
-        ]):
+        self.check_unique_ebay_credentials([self])
+
+    @classmethod
+    def check_unique_ebay_credentials(cls, channels):
+        """
+        App ID, Dev ID, Cert ID and Token must be unique for all the channels
+
+        Tokens are compared using their hash, and all the channels are
+        checked with one grouped query.
+        """
+        token_hashes = list(set(
+            channel.ebay_token_hash for channel in channels
+            if all([
+                channel.ebay_app_id, channel.ebay_dev_id,
+                channel.ebay_cert_id, channel.ebay_token_hash
+            ])
+        ))
+        if not token_hashes:
             return
-        if self.search([
-            ('ebay_app_id', '=', self.ebay_app_id),
-            ('ebay_dev_id', '=', self.ebay_dev_id),
-            ('ebay_cert_id', '=', self.ebay_cert_id),
-            ('ebay_token', '=', self.ebay_token),
-            ('id', '!=', self.id)
-        ]):
-            self.raise_user_error("same_ebay_credentials")
 
-    def get_ebay_trading_api(self):
-        """Create an instance of ebay trading api
+        table = cls.__table__()
+        cursor = Transaction().cursor
 
-        :return: ebay trading api instance
+        duplicates = set()
+        for sub_hashes in grouped_slice(token_hashes):
+            cursor.execute(*table.select(
+                table.ebay_app_id,
+                where=table.ebay_token_hash.in_(list(sub_hashes)) &
+                (table.ebay_app_id != Null) & (table.ebay_dev_id != Null) &
+                (table.ebay_cert_id != Null),
+                group_by=[
+                    table.ebay_app_id, table.ebay_dev_id,
+                    table.ebay_cert_id, table.ebay_token_hash,
+                ],
+                having=Count(Literal(1)) > 1
+            ))
+            duplicates.update(app_id for app_id, in cursor.fetchall())
+        if duplicates:
+            cls.raise_user_error(
+                "same_ebay_credentials", (', '.join(sorted(duplicates)),)
+            )
+
+    def get_ebay_api_factory(self):
+        """
+        Return a callable which creates an instance of ebay trading api.
+
+        The credentials are read when the factory is built, so the factory
+        can be called from threads which do not have a transaction.
         """
         domain = 'api.sandbox.ebay.com' if \
             self.is_ebay_sandbox else 'api.ebay.com'
-        return trading(
+        return partial(
+            TradingConnection,
             appid=self.ebay_app_id,
             certid=self.ebay_cert_id,
             devid=self.ebay_dev_id,
@@ -145,6 +493,178 @@ class SaleChannel:
             config_file=None,
         )
 
+    def get_ebay_trading_api(self):
+        """Create an instance of ebay trading api
+
+        :return: ebay trading api instance
+        """
+        return self.get_ebay_api_factory()()
+
+    def get_ebay_connection_key(self):
+        """
+        Return the key of the call executor of this channel in the process
+        """
+        return (Transaction().cursor.database_name, self.id)
+
+    def get_ebay_connection_fingerprint(self):
+        """
+        Return a fingerprint of the values used to connect to eBay, which
+        changes when the credentials, the sandbox flag or the call limits
+        change
+        """
+        return hashlib.sha256(repr(tuple(
+            getattr(self, name) for name in EBAY_CONNECTION_FIELDS
+        ))).hexdigest()
+
+    def get_ebay_call_executor(self):
+        """
+        Return the executor of the calls to eBay of this channel.
+
+        The executor and its connections are shared by all the transactions
+        of the process, so the connections to eBay are reused from one call
+        to the next and the call limits apply to all of them.
+        """
+        fingerprint = self.get_ebay_connection_fingerprint()
+        return get_call_executor(
+            self.get_ebay_connection_key(), fingerprint,
+            lambda: CallExecutor(
+                ConnectionPool(self.get_ebay_api_factory()), fingerprint,
+                max_workers=(
+                    self.ebay_max_concurrent_calls or MAX_PARALLEL_CALLS
+                ),
+                daily_limit=self.ebay_daily_call_limit,
+            )
+        )
+
+    def submit_ebay_call(self, verb, data=None):
+        """
+        Schedule a call to eBay on the executor of this channel
+
+        :param verb: Name of the API call
+        :param data: Data of the call
+        :return: Future of the response dictionary
+        """
+        self.validate_ebay_channel()
+
+        count_api_call()
+        return self.get_ebay_call_executor().submit(verb, data)
+
+    def call_ebay_api(self, verb, data=None):
+        """
+        Execute a call to eBay and wait for its response
+
+        :param verb: Name of the API call
+        :param data: Data of the call
+        :return: Response dictionary
+        """
+        return self.submit_ebay_call(verb, data).result()
+
+    def execute_ebay_calls(self, calls):
+        """
+        Execute several calls to eBay concurrently
+
+        :param calls: List of tuples of call name and call data
+        :return: List of response dictionaries, in the same order as `calls`
+        """
+        futures = [self.submit_ebay_call(verb, data) for verb, data in calls]
+        return [future.result() for future in futures]
+
+    @contextmanager
+    def stream_ebay_orders(self, data):
+        """
+        Execute a GetOrders call and give an iterator over its orders, which
+        are parsed one by one while the response is received.
+
+        The call is made in the current thread, within the call limits of
+        the channel. Once the orders are consumed, the other elements of the
+        response are in the `response` attribute of the iterator.
+
+        :param data: Data of the GetOrders call
+        :return: Instance of OrderStream
+        """
+        self.validate_ebay_channel()
+
+        count_api_call()
+        with self.get_ebay_call_executor().stream('GetOrders', data) as raw:
+            yield OrderStream(raw)
+
+    def get_ebay_cache_scope(self):
+        """
+        Return the scope of the cached responses of this channel
+        """
+        return '%s:%s' % self.get_ebay_connection_key()
+
+    def get_ebay_cache_ttl(self, verb):
+        """
+        Return the number of seconds the responses of a call are cached,
+        0 if the call is not cached
+        """
+        ttl = {
+            'GetItem': self.ebay_item_cache_ttl,
+            'GetUser': self.ebay_user_cache_ttl,
+        }.get(verb)
+        return (ttl or 0) * 3600
+
+    @classmethod
+    def get_ebay_cache_stats(cls, channels, names):
+        """
+        Return the hits and misses of the response cache of the channels
+        """
+        cache = get_response_cache()
+
+        result = dict((name, {}) for name in names)
+        for channel in channels:
+            hits, misses = (0, 0)
+            if cache and channel.source == 'ebay':
+                hits, misses = cache.get_stats(channel.get_ebay_cache_scope())
+            if 'ebay_cache_hits' in result:
+                result['ebay_cache_hits'][channel.id] = hits
+            if 'ebay_cache_misses' in result:
+                result['ebay_cache_misses'][channel.id] = misses
+        return result
+
+    def get_ebay_cached_responses(self, verb, calls):
+        """
+        Return the responses of calls to eBay identified by a key, using
+        the response cache for the calls which are cached.
+
+        The calls which are not in the cache are executed concurrently and
+        their responses are stored in the cache.
+
+        :param verb: Name of the API call
+        :param calls: Dictionary of key, e.g. the item ID, to call data
+        :return: Dictionary of key to response dictionary
+        """
+        return run_coroutines([
+            self.fetch_ebay_cached_responses(verb, calls)
+        ])[0]
+
+    def fetch_ebay_cached_responses(self, verb, calls):
+        """
+        Coroutine of `get_ebay_cached_responses`, see `api.run_coroutines`
+        """
+        cache = get_response_cache()
+        ttl = self.get_ebay_cache_ttl(verb)
+        scope = self.get_ebay_cache_scope()
+
+        responses = {}
+        if cache and ttl:
+            responses = cache.get_many(scope, verb, calls.keys())
+
+        keys, futures = [], []
+        for key, data in calls.iteritems():
+            if key not in responses:
+                keys.append(key)
+                futures.append(self.submit_ebay_call(verb, data))
+        fetched = dict(zip(keys, (yield gather(futures))))
+
+        if cache and ttl:
+            cache.set_many(
+                scope, verb, fetched, ttl, max_size=self.ebay_cache_size
+            )
+        responses.update(fetched)
+        raise Return(responses)
+
     @classmethod
     @ModelView.button_action('ebay.wizard_check_ebay_token_status')
     def check_ebay_token_status(cls, channels):
@@ -163,46 +683,489 @@ class SaleChannel:
     def import_orders(self):
         """
         Downstream implementation of channel.import_orders
-        :return: List of active record of sale imported
+
+        Orders are fetched and imported one page at a time, so memory usage
+        does not depend on the number of orders in the import window.
+
+        The progress is saved in a checkpoint which is committed with each
+        page, so an import which fails resumes from the page after the last
+        imported one. The last order import time is only updated once all
+        the pages of the window are imported.
+
+        The import holds the lease of the channel, see
+        `acquire_ebay_import_lease`, so it never runs at the same time as
+        another import of the channel, scheduled or not. The lease is
+        renewed with each page imported.
+
+        :return: Dictionary with the list of eBay order IDs `created`,
+                 `updated` (changed on eBay since imported) and `skipped`
+                 (already imported and unchanged), and the list of tuples
+                 of eBay order ID and error message of the orders which
+                 `failed`, see `import_ebay_orders_one_by_one`
         """
         if self.source != 'ebay':
             return super(SaleChannel, self).import_orders()
 
         self.validate_ebay_channel()
 
-        sales = []
-        api = self.get_ebay_trading_api()
+        # The scheduled imports take the lease before probing eBay
+        if Transaction().context.get('ebay_import_lease_held'):
+            return self.import_ebay_order_window()
+
+        if not self.acquire_ebay_import_lease():
+            self.raise_user_error('import_running')
+        time_from = self.last_order_import_time
+        try:
+            summary = self.import_ebay_order_window()
+        except Exception:
+            self.rollback_ebay_order_import()
+            self.release_ebay_import_lease()
+            raise
+        self.release_ebay_import_lease()
+
+        if not (
+            summary['created'] or summary['updated'] or
+            summary['skipped'] or summary['failed']
+        ) and not summary['resumed']:
+            self.raise_user_error(
+                'no_orders', (time_from, )
+            )
+        return summary
+
+    def import_ebay_order_window(self):
+        """
+        Import the orders of the window of the checkpoint of the channel,
+        from the page after the last imported one, see
+        `sale.channel.ebay.checkpoint.get_first_page`. The caller must hold
+        the lease of the channel.
+
+        :return: Dictionary like the one of `import_orders`, with `resumed`
+                 set if the import resumed a window which failed
+        """
+        Checkpoint = Pool().get('sale.channel.ebay.checkpoint')
+        ImportRun = Pool().get('sale.channel.ebay.import_run')
+
+        checkpoint = Checkpoint.get_or_create(self)
+
+        summary = {
+            'created': [],
+            'updated': [],
+            'skipped': [],
+            'failed': [],
+            'resumed': checkpoint.last_page > 0,
+        }
+        recorder = ImportRecorder()
+        with recorder.record(), \
+                Transaction().set_context({'current_channel': self.id}):
+            for page_number, orders in self.iter_ebay_orders(
+                checkpoint.time_from, checkpoint.time_to,
+                first_page=checkpoint.get_first_page(),
+                time_filter=checkpoint.time_filter,
+                entries_per_page=checkpoint.entries_per_page,
+            ):
+                try:
+                    created, updated, skipped = \
+                        self.import_ebay_order_page(orders)
+                    failed = []
+                except get_transient_errors():
+                    raise
+                except Exception:
+                    self.rollback_ebay_order_import()
+                    created, updated, skipped, failed = \
+                        self.import_ebay_orders_one_by_one(orders)
+                summary['created'].extend(created)
+                summary['updated'].extend(updated)
+                summary['skipped'].extend(skipped)
+                summary['failed'].extend(failed)
+
+                checkpoint.page_done(page_number, orders)
+                self.renew_ebay_import_lease()
+                self.commit_ebay_order_import()
+
+        # The whole window is imported
+        self.write([self], {'last_order_import_time': checkpoint.time_to})
+        Checkpoint.delete([checkpoint])
+        ImportRun.create_from_recorder(self, recorder, summary)
+        self.commit_ebay_order_import()
+
+        return summary
+
+    def import_ebay_orders_one_by_one(self, orders):
+        """
+        Import the orders of a page which failed one at a time, so an order
+        which can not be imported, e.g. because of its address or its
+        product, does not block the import of the channel.
+
+        Each order is committed on its own. The orders which fail are
+        logged and reported, and the import moves on. An error which may
+        not happen again, e.g. a connection error, is raised so that the
+        page is imported again by the next import.
+
+        :param orders: List of order data from eBay
+        :return: Tuple of lists of eBay order IDs created, updated and
+                 skipped, and list of tuples of eBay order ID and error
+                 message of the orders which failed
+        """
+        created, updated, skipped, failed = [], [], [], []
+        for order_data in orders:
+            try:
+                order_created, order_updated, order_skipped = \
+                    self.import_ebay_order_page([order_data])
+            except get_transient_errors():
+                raise
+            except Exception as error:
+                self.rollback_ebay_order_import()
+                logger.exception(
+                    'eBay order %s could not be imported for channel %s',
+                    order_data['OrderID'], self.id
+                )
+                failed.append((
+                    order_data['OrderID'],
+                    unicode(error) or error.__class__.__name__,
+                ))
+                continue
+            self.commit_ebay_order_import()
+            created.extend(order_created)
+            updated.extend(order_updated)
+            skipped.extend(order_skipped)
+        return created, updated, skipped, failed
+
+    def commit_ebay_order_import(self):
+        """
+        Commit the orders imported so far with the checkpoint of the import.
+
+        The commit can be disabled by setting `ebay_order_import_commit` to
+        False in the context, e.g. to import the orders in the transaction
+        of the caller.
+        """
+        if Transaction().context.get('ebay_order_import_commit', True):
+            Transaction().cursor.commit()
+
+    def rollback_ebay_order_import(self):
+        """
+        Rollback the changes of an import since its last commit, see
+        `commit_ebay_order_import`
+        """
+        if Transaction().context.get('ebay_order_import_commit', True):
+            Transaction().cursor.rollback()
+
+    def iter_ebay_orders(
+        self, time_from, time_to, first_page=1, time_filter='create',
+        entries_per_page=None
+    ):
+        """
+        Fetch the orders of eBay in the given window, page by page.
+
+        A page is only requested from eBay once the previous one has been
+        consumed, so only one page of orders is held in memory at a time.
+        The orders of a page are parsed one by one while the page is
+        received, see `stream_ebay_orders`.
+
+        :param time_from: Datetime from which orders are fetched
+        :param time_to: Datetime upto which orders are fetched
+        :param first_page: Number of the first page to fetch
+        :param time_filter: `create` to fetch the orders created in the
+                            window, `modified` to fetch the orders modified
+                            in the window
+        :param entries_per_page: Number of orders per page, the one of the
+                                 channel if not given
+        :return: Generator yielding tuples of page number and list of order
+                 data of the page
+        """
+        page_number = first_page
+        prefix = 'ModTime' if time_filter == 'modified' else 'CreateTime'
+        if not entries_per_page:
+            entries_per_page = self.get_ebay_orders_per_page()
+
+        while True:
+            with stage('fetch_orders'):
+                with self.stream_ebay_orders({
+                    prefix + 'From': time_from,
+                    prefix + 'To': time_to,
+                    'Pagination': {
+                        'EntriesPerPage': entries_per_page,
+                        'PageNumber': page_number,
+                    },
+                }) as stream:
+                    orders = list(stream)
+            yield page_number, orders
+
+            if stream.response.get('HasMoreOrders') != 'true':
+                break
+            page_number += 1
+
+    @classmethod
+    def schedule_ebay_order_imports(cls, max_workers=EBAY_SCHEDULER_WORKERS):
+        """
+        Cron method to import the orders of the eBay channels which are due.
+
+        The channels are imported in parallel, each one in a worker thread
+        with its own transaction.
+
+        :param max_workers: Maximum number of channels imported at a time
+        """
+        channels = cls.search([
+            ('source', '=', 'ebay'),
+            [
+                'OR',
+                ('ebay_next_order_import', '=', None),
+                ('ebay_next_order_import', '<=', datetime.utcnow()),
+            ],
+        ])
+        if not channels:
+            return
+
+        transaction = Transaction()
+        run = partial(
+            cls.run_scheduled_ebay_order_import,
+            transaction.cursor.database_name, transaction.user,
+            dict(transaction.context),
+        )
+        executor = ThreadPoolExecutor(
+            max_workers=max(min(max_workers, len(channels)), 1)
+        )
+        try:
+            list(executor.map(run, [channel.id for channel in channels]))
+        finally:
+            executor.shutdown()
+
+    @classmethod
+    def run_scheduled_ebay_order_import(
+        cls, database_name, user, context, channel_id
+    ):
+        """
+        Run the scheduled order import of a channel in a new transaction
+        """
+        with Transaction().start(database_name, user, context=context):
+            try:
+                cls(channel_id).import_ebay_orders_if_due()
+            except Exception:
+                logger.exception(
+                    'Scheduled import of eBay orders failed for channel %s',
+                    channel_id
+                )
+
+    def import_ebay_orders_if_due(self):
+        """
+        Import the orders of the channel, if eBay has any, and schedule the
+        next import.
+
+        The import is skipped if another run holds the lease of the channel.
+        """
+        if not self.acquire_ebay_import_lease():
+            return
+
+        try:
+            order_count = self.probe_ebay_orders()
+            if order_count != 0:
+                with Transaction().set_context(ebay_import_lease_held=True):
+                    summary = self.import_orders()
+                order_count = len(summary['created']) + \
+                    len(summary['updated']) + len(summary['skipped']) + \
+                    len(summary['failed'])
+        except Exception:
+            self.rollback_ebay_order_import()
+            logger.exception(
+                'Scheduled import of eBay orders failed for channel %s',
+                self.id
+            )
+            order_count = None
+
+        interval = self.get_next_ebay_poll_interval(order_count)
+        self.write([self], {
+            'ebay_poll_interval': interval,
+            'ebay_next_order_import':
+                datetime.utcnow() + timedelta(minutes=interval),
+            'ebay_import_lease_until': None,
+        })
+        self.commit_ebay_order_import()
+
+    def acquire_ebay_import_lease(self):
+        """
+        Take the lease of the scheduled import of the channel.
+
+        The lease is taken with a single conditional UPDATE, so only one run
+        can take it. A lease which is not renewed, see
+        `renew_ebay_import_lease`, or released expires after
+        EBAY_IMPORT_LEASE.
+
+        :return: True if the lease is taken
+        """
+        table = self.__table__()
+        cursor = Transaction().cursor
         now = datetime.utcnow()
 
-        last_import_time = self.last_order_import_time
+        cursor.execute(*table.update(
+            columns=[table.ebay_import_lease_until],
+            values=[now + EBAY_IMPORT_LEASE],
+            where=(table.id == self.id) & (
+                (table.ebay_import_lease_until == Null) |
+                (table.ebay_import_lease_until < now)
+            )
+        ))
+        if cursor.rowcount != 1:
+            return False
+
+        # The lease is not written with the ORM, so clean the cursor cache
+        for cache in cursor.cache.values():
+            if self.__name__ in cache:
+                cache[self.__name__].pop(self.id, None)
+
+        self.commit_ebay_order_import()
+        return True
+
+    def renew_ebay_import_lease(self):
+        """
+        Extend the lease of the channel held by the current run by
+        EBAY_IMPORT_LEASE, so a long import does not lose it while running
+        """
+        self.write([self], {
+            'ebay_import_lease_until': datetime.utcnow() + EBAY_IMPORT_LEASE,
+        })
+
+    def release_ebay_import_lease(self):
+        """
+        Release the lease of the channel taken by `acquire_ebay_import_lease`
+        """
+        self.write([self], {'ebay_import_lease_until': None})
+        self.commit_ebay_order_import()
+
+    def probe_ebay_orders(self):
+        """
+        Return the number of orders waiting to be imported, with a single
+        call to eBay which fetches at most one order.
+
+        When there is no order, the last order import time is moved to the
+        end of the probed window, so the window of the next probe stays
+        within the range accepted by GetOrders.
+
+        :return: Number of orders, or None if an interrupted import has to
+                 be resumed
+        """
+        Checkpoint = Pool().get('sale.channel.ebay.checkpoint')
 
-        # Update current time for order update
-        self.write([self], {'last_order_import_time': now})
+        if Checkpoint.search([('channel', '=', self.id)], count=True):
+            return None
 
-        response = api.execute(
+        prefix = 'ModTime' if self.ebay_order_sync_mode == 'modified' \
+            else 'CreateTime'
+        time_to = datetime.utcnow()
+        response = self.call_ebay_api(
             'GetOrders', {
-                'CreateTimeFrom': last_import_time,
-                'CreateTimeTo': now
+                prefix + 'From': self.last_order_import_time,
+                prefix + 'To': time_to,
+                'Pagination': {
+                    'EntriesPerPage': 1,
+                    'PageNumber': 1,
+                },
             }
-        ).dict()
-        if not response.get('OrderArray'):
-            self.raise_user_error(
-                'no_orders', (last_import_time, )
-            )
+        )
+        order_count = int(
+            response.get('PaginationResult', {}).get(
+                'TotalNumberOfEntries'
+            ) or 0
+        )
+        if order_count == 0:
+            self.write([self], {'last_order_import_time': time_to})
+        return order_count
+
+    def get_next_ebay_poll_interval(self, order_count):
+        """
+        Return the number of minutes until the next scheduled import, from
+        the number of orders found by the last one.
 
-        # Orders are returned as dictionary for single order and as
-        # list for multiple orders.
-        # Convert to list if dictionary is returned
-        if isinstance(response['OrderArray']['Order'], dict):
-            orders = [response['OrderArray']['Order']]
+        The interval is doubled when there was no order, reset to the
+        minimum when there was more than a page of orders and halved
+        otherwise.
+
+        :param order_count: Number of orders found, None if unknown
+        """
+        minimum = self.ebay_min_poll_interval or EBAY_MIN_POLL_INTERVAL
+        maximum = max(
+            self.ebay_max_poll_interval or EBAY_MAX_POLL_INTERVAL, minimum
+        )
+        interval = self.ebay_poll_interval or minimum
+
+        if order_count is None:
+            pass
+        elif order_count == 0:
+            interval *= 2
+        elif order_count >= self.get_ebay_orders_per_page():
+            interval = minimum
         else:
-            orders = response['OrderArray']['Order']
+            interval //= 2
+
+        return min(max(interval, minimum), maximum)
+
+    def get_ebay_orders_per_page(self):
+        """
+        Return the number of orders to be fetched per GetOrders call, within
+        the limits allowed by eBay
+        """
+        return min(
+            max(self.ebay_orders_per_page or EBAY_MAX_ORDERS_PER_PAGE, 1),
+            EBAY_MAX_ORDERS_PER_PAGE
+        )
+
+    @instrumented('import_page')
+    def import_ebay_order_page(self, orders):
+        """
+        Import a page of orders fetched from eBay.
+
+        The orders which are not imported yet are created, and the ones
+        whose payload changed since their sale was synchronised are
+        updated, see `sale.sale.update_many_using_ebay_data`. The sales
+        imported before their payload hash was stored get the hash of their
+        order as a baseline and are skipped.
+
+        :param orders: List of order data from eBay
+        :return: Tuple of lists of eBay order IDs created, updated and
+                 skipped
+        """
+        Sale = Pool().get('sale.sale')
+
+        # Resolve the orders already imported with a single query so that
+        # the unchanged ones are skipped before any party, product or
+        # address lookup.
+        payload_hashes = Sale.get_ebay_payload_hashes([
+            order_data['OrderID'] for order_data in orders
+        ])
+
+        new_orders, changed_orders, skipped = [], [], []
+        baseline_hashes = {}
+        seen_order_ids = set()
+        for order_data in orders:
+            order_id = order_data['OrderID']
+            # Same order could be repeated in a page
+            if order_id in seen_order_ids:
+                skipped.append(order_id)
+                continue
+            seen_order_ids.add(order_id)
+
+            if order_id not in payload_hashes:
+                new_orders.append(order_data)
+                continue
 
-        with Transaction().set_context({'current_channel': self.id}):
-            for order_data in orders:
-                sales.append(self.import_order(order_data))
+            payload_hash = \
+                EbayOrder.from_ebay_data(order_data).get_payload_hash()
+            if payload_hashes[order_id] is None:
+                # Nothing is known of the order the sale was imported from
+                baseline_hashes[order_id] = payload_hash
+                skipped.append(order_id)
+            elif payload_hashes[order_id] == payload_hash:
+                skipped.append(order_id)
+            else:
+                changed_orders.append(order_data)
 
-        return sales
+        Sale.set_ebay_payload_hashes(baseline_hashes)
+        Sale.create_many_using_ebay_data(new_orders)
+        Sale.update_many_using_ebay_data(changed_orders)
+
+        return (
+            [order['OrderID'] for order in new_orders],
+            [order['OrderID'] for order in changed_orders],
+            skipped,
+        )
 
     def import_order(self, order_data):
         "Downstream implementation of channel.import_order from sale channel"
@@ -214,38 +1177,618 @@ class SaleChannel:
         sales = Sale.search([
             ('ebay_order_id', '=', order_data['OrderID']),
         ])
-        if sales:
-            return sales[0]
+        if not sales:
+            return Sale.create_using_ebay_data(order_data)
+
+        sale, = sales
+        payload_hash = EbayOrder.from_ebay_data(order_data).get_payload_hash()
+        if sale.ebay_payload_hash is None:
+            Sale.set_ebay_payload_hashes({sale.ebay_order_id: payload_hash})
+        elif sale.ebay_payload_hash != payload_hash:
+            sale, = Sale.update_many_using_ebay_data([order_data])
+        return sale
+
+    def import_products(self):
+        """
+        Downstream implementation of channel.import_products
+
+        :return: List of active records of products of the listings
+        """
+        if self.source != 'ebay':
+            return super(SaleChannel, self).import_products()
+
+        return self.sync_ebay_catalog()
+
+    @classmethod
+    def sync_ebay_catalogs(cls):
+        """
+        Cron method to sync the catalog of the eBay channels.
+
+        Each channel is committed once synced, and a channel which fails
+        is logged without stopping the sync of the other ones. The channels
+        whose orders are being imported are skipped.
+        """
+        for channel in cls.search([('source', '=', 'ebay')]):
+            if not channel.acquire_ebay_import_lease():
+                continue
+            try:
+                with Transaction().set_context(ebay_import_lease_held=True):
+                    channel.sync_ebay_catalog()
+            except Exception:
+                channel.rollback_ebay_order_import()
+                logger.exception(
+                    'Sync of the eBay catalog failed for channel %s',
+                    channel.id
+                )
+            channel.release_ebay_import_lease()
+
+    def sync_ebay_catalog(self):
+        """
+        Find or create the products of the active and recently ended
+        listings of the seller, so that the orders imported later do not
+        have to fetch their items from eBay.
+
+        The sync holds the lease of the channel, see
+        `acquire_ebay_import_lease`, so it does not create the same
+        listings and products as an order import running at the same time.
+
+        :return: List of active records of products of the listings
+        """
+        if Transaction().context.get('ebay_import_lease_held'):
+            return self.import_ebay_catalog()
+
+        if not self.acquire_ebay_import_lease():
+            self.raise_user_error('import_running')
+        try:
+            products = self.import_ebay_catalog()
+        except Exception:
+            self.rollback_ebay_order_import()
+            self.release_ebay_import_lease()
+            raise
+        self.release_ebay_import_lease()
+        return products
+
+    def import_ebay_catalog(self):
+        """
+        Find or create the products of the listings of the seller, see
+        `sync_ebay_catalog`. The caller must hold the lease of the channel.
+
+        The listings are the ones ending in the next 119 days and the ones
+        which ended in the last `ebay_catalog_ended_days` days. They are
+        fetched page by page, in windows of at most 119 days, within the
+        120 days GetSellerList accepts as a range, and the products of a
+        page are looked up and created together.
+
+        :return: List of active records of products of the listings
+        """
+        now = datetime.utcnow()
+        end_time_from = now - timedelta(days=self.ebay_catalog_ended_days or 0)
+        end_time_to = now + EBAY_SELLER_LIST_RANGE
 
-        return Sale.create_using_ebay_data(order_data)
+        products = []
+        with Transaction().set_context(current_channel=self.id):
+            while end_time_from < end_time_to:
+                window_end = min(
+                    end_time_from + EBAY_SELLER_LIST_RANGE, end_time_to
+                )
+                for items in self.iter_ebay_listings(
+                    end_time_from, window_end
+                ):
+                    products.extend(self.import_ebay_listings(items))
+                    self.renew_ebay_import_lease()
+                end_time_from = window_end
+
+        self.write([self], {'ebay_last_catalog_sync': now})
+        return products
+
+    def iter_ebay_listings(self, end_time_from, end_time_to):
+        """
+        Fetch the listings of the seller which end in the given window,
+        page by page. The next page is fetched while the current one is
+        consumed.
+
+        :param end_time_from: Datetime from which the listings end
+        :param end_time_to: Datetime upto which the listings end
+        :return: Generator yielding the list of item data of each page
+        """
+        def submit(page_number):
+            return self.submit_ebay_call('GetSellerList', {
+                'EndTimeFrom': end_time_from,
+                'EndTimeTo': end_time_to,
+                'DetailLevel': 'ReturnAll',
+                'Pagination': {
+                    'EntriesPerPage': EBAY_MAX_ITEMS_PER_PAGE,
+                    'PageNumber': page_number,
+                },
+            })
+
+        page_number = 1
+        future = submit(page_number)
+        while True:
+            response = future.result()
+            has_more = response.get('HasMoreItems') == 'true'
+            if has_more:
+                page_number += 1
+                future = submit(page_number)
+
+            yield as_list((response.get('ItemArray') or {}).get('Item'))
+
+            if not has_more:
+                break
+
+    def import_ebay_listings(self, items):
+        """
+        Find or create the products of listings of the seller
+
+        :param items: List of item data from GetSellerList
+        :return: List of active records of products of the listings and of
+                 their variations, in the same order as `items`
+        """
+        keys, skus = [], {}
+        for item in items:
+            variations = as_list(
+                (item.get('Variations') or {}).get('Variation')
+            )
+            variation_skus = [
+                variation['SKU'] for variation in variations
+                if variation.get('SKU')
+            ]
+            if variation_skus:
+                keys.extend((item['ItemID'], sku) for sku in variation_skus)
+            else:
+                keys.append((item['ItemID'], None))
+                skus[(item['ItemID'], None)] = item.get('SKU')
+
+        products, = run_coroutines([self.resolve_ebay_products(
+            keys, skus, dict((item['ItemID'], item) for item in items)
+        )])
+        return [products[key] for key in keys]
 
     def import_product(self, ebay_id):
         """
         Import specific product for this ebay channel
         Downstream implementation for channel.import_product
+
+        :param ebay_id: eBay item ID of a listing without variations
+        """
+        if self.source != 'ebay':
+            return super(SaleChannel, self).import_product(ebay_id)
+
+        return self.import_ebay_products([ebay_id])[ebay_id]
+
+    def import_ebay_products(self, ebay_ids):
+        """
+        Find or import the products for the given eBay item IDs, see
+        `resolve_ebay_products`.
+
+        :param ebay_ids: List of eBay item IDs
+        :return: Dictionary of eBay item ID to active record of product
+        """
+        products, = run_coroutines([self.resolve_ebay_products([
+            (ebay_id, None) for ebay_id in ebay_ids
+        ])])
+        return dict((key[0], product) for key, product in products.iteritems())
+
+    @instrumented_coroutine('resolve_products')
+    def resolve_ebay_products(self, keys, skus=None, items=None):
+        """
+        Coroutine finding or importing the products of listings of eBay, see
+        `api.run_coroutines`.
+
+        A listing is resolved from the product it is mapped to, else from
+        the product whose code is the SKU of the listing, else from the
+        product with the eBay item ID of the listing. The items of the
+        listings still missing are fetched from eBay concurrently, or from
+        the response cache of the channel, their SKU is looked up and the
+        products still missing are created together. The listings resolved
+        are mapped to their product, so that relisted items and listings of
+        the same SKU are resolved with a single query.
+
+        :param keys: List of tuples of eBay item ID and variation SKU, None
+                     for the listings without variations
+        :param skus: Dictionary of key to SKU of the listing, when known
+        :param items: Dictionary of eBay item ID to item data already
+                      fetched from eBay
+        :return: Dictionary of key to active record of product
         """
         Product = Pool().get('product.product')
+        Listing = Pool().get('sale.channel.ebay.listing')
+
+        keys = set(keys)
+        if not keys:
+            raise Return({})
+        skus = dict(skus or {})
+        skus.update(
+            (key, key[1]) for key in keys if key[1] is not None
+        )
+        items = dict(items or {})
+
+        products = Listing.get_products(self, keys)
+        mapped = set(products)
+
+        def get_missing():
+            return [key for key in keys if key not in products]
+
+        def match_skus():
+            missing = [key for key in get_missing() if skus.get(key)]
+            if missing:
+                by_sku = Product.get_by_ebay_skus([
+                    skus[key] for key in missing
+                ])
+                products.update(
+                    (key, by_sku[skus[key]]) for key in missing
+                    if skus[key] in by_sku
+                )
+
+        match_skus()
+
+        # Products imported before the listings were mapped
+        missing = get_missing()
+        if missing:
+            by_item_id = {}
+            for item_ids in grouped_slice(set(key[0] for key in missing)):
+                by_item_id.update(
+                    (product.ebay_item_id, product)
+                    for product in Product.search([
+                        ('ebay_item_id', 'in', list(item_ids)),
+                    ])
+                )
+            products.update(
+                (key, by_item_id[key[0]]) for key in missing
+                if key[0] in by_item_id
+            )
+
+        missing_ids = set(key[0] for key in get_missing()) - set(items)
+        if missing_ids:
+            responses = yield self.fetch_ebay_cached_responses(
+                'GetItem', dict(
+                    (id, {'ItemID': id, 'DetailLevel': 'ReturnAll'})
+                    for id in missing_ids
+                )
+            )
+            items.update(
+                (id, response['Item'])
+                for id, response in responses.iteritems()
+            )
+
+        for key in get_missing():
+            if not skus.get(key):
+                skus[key] = items[key[0]].get('SKU')
+        match_skus()
 
-        # TODO: Products need to be searched using SKU instead of ebay ID
+        # Create the products still missing, once for each SKU
+        to_create, variations = {}, {}
+        for key in sorted(get_missing()):
+            item_id, variation_sku = key
+            if variation_sku is None:
+                to_create.setdefault(skus[key] or item_id, []).append(key)
+            else:
+                variations.setdefault(item_id, []).append(key)
+        created = Product.create_many_using_ebay_data([
+            {'Item': items[group[0][0]]} for group in to_create.values()
+        ])
+        for group, product in zip(to_create.values(), created):
+            products.update((key, product) for key in group)
+        for item_id, group in variations.iteritems():
+            by_sku = Product.create_variations_using_ebay_data(
+                {'Item': items[item_id]}, [key[1] for key in group]
+            )
+            products.update((key, by_sku[key[1]]) for key in group)
 
+        Listing.create_many(self, dict(
+            (key, product) for key, product in products.iteritems()
+            if key not in mapped
+        ))
+        raise Return(products)
+
+    def export_product_prices(self):
+        """
+        Downstream implementation of channel.export_product_prices
+
+        The prices are exported with the quantities, see
+        `export_ebay_inventory`.
+
+        :return: List of active records of products for which prices are
+                 exported
+        """
         if self.source != 'ebay':
-            return super(SaleChannel, self).import_product(ebay_id)
+            return super(SaleChannel, self).export_product_prices()
+
+        return self.export_ebay_inventory()['exported']
 
-        products = Product.search([('ebay_item_id', '=', ebay_id)])
+    def export_ebay_inventory(self, products=None):
+        """
+        Push the quantities and the prices of products to their listings on
+        eBay.
 
-        if products:
-            return products[0]
+        The listings are revised with ReviseInventoryStatus calls of
+        `EBAY_MAX_INVENTORY_PER_CALL` listings each. The calls are made
+        concurrently by the call executor of the channel, so they are within
+        the call limits of the channel. A listing which eBay fails to revise,
+        or whose call fails, does not stop the export, it is reported with
+        its error. The products given which are not listed on eBay are
+        reported too.
 
-        # If product is not found get the info from ebay and
-        # delegate to create_using_ebay_data
+        :param products: List of active records of products to export, all
+                         the products listed on the channel if not given
+        :return: Dictionary with the list of active records of products
+                 `exported` and the list of tuples of product and error
+                 message of the products which `failed`
+        """
         self.validate_ebay_channel()
-        api = self.get_ebay_trading_api()
 
-        product_data = api.execute(
-            'GetItem', {'ItemID': ebay_id, 'DetailLevel': 'ReturnAll'}
-        ).dict()
+        statuses = self.get_ebay_inventory_statuses(products)
+        calls = [
+            statuses[i:i + EBAY_MAX_INVENTORY_PER_CALL]
+            for i in range(0, len(statuses), EBAY_MAX_INVENTORY_PER_CALL)
+        ]
+        futures = [
+            self.submit_ebay_call('ReviseInventoryStatus', {
+                'InventoryStatus': [status for _, status in call],
+            }) for call in calls
+        ]
+
+        summary = {
+            'exported': [],
+            'failed': [],
+        }
+        listed = set(product for product, _ in statuses)
+        for product in products or []:
+            if product not in listed:
+                logger.warning(
+                    'Inventory of product %s not exported to eBay for '
+                    'channel %s: no listing, eBay item ID or code',
+                    product.id, self.id
+                )
+                summary['failed'].append(
+                    (product, 'Product is not listed on eBay')
+                )
+
+        for call, future in zip(calls, futures):
+            try:
+                errors = self.get_ebay_inventory_errors(
+                    [status for _, status in call], future.result()
+                )
+            except ConnectionError as error:
+                errors = [str(error)] * len(call)
+            except Exception as error:
+                # e.g. a timeout, which only fails the listings of the call
+                logger.exception(
+                    'ReviseInventoryStatus call failed for channel %s',
+                    self.id
+                )
+                errors = [str(error) or error.__class__.__name__] * len(call)
+
+            for (product, status), error in zip(call, errors):
+                if error is None:
+                    summary['exported'].append(product)
+                    continue
+                logger.warning(
+                    'Inventory of product %s not exported to eBay for '
+                    'channel %s: %s', product.id, self.id, error
+                )
+                summary['failed'].append((product, error))
+        return summary
+
+    def get_ebay_inventory_statuses(self, products=None):
+        """
+        Return the inventory status of the listings of products, as expected
+        by ReviseInventoryStatus.
+
+        A product is exported to the listing of the channel it was last
+        mapped to, see `sale.channel.ebay.listing`, so the listings ended
+        since the item was relisted are not revised. A product which is not
+        mapped to a listing is exported with its eBay item ID, else with its
+        code if the listing is tracked by SKU.
+
+        The quantity is the forecast quantity of the warehouse of the
+        channel and the price is the price of the price list of the channel.
+
+        :param products: List of active records of products, all the
+                         products listed on the channel if not given
+        :return: List of tuples of product and inventory status
+        """
+        Product = Pool().get('product.product')
+        Listing = Pool().get('sale.channel.ebay.listing')
+
+        listings = {}
+        if products is None:
+            found = Listing.search([
+                ('channel', '=', self.id),
+            ], order=[('id', 'ASC')])
+        else:
+            found = []
+            for sub_products in grouped_slice(products):
+                found.extend(Listing.search([
+                    ('channel', '=', self.id),
+                    ('product', 'in', [p.id for p in sub_products]),
+                ], order=[('id', 'ASC')]))
+        for listing in found:
+            listings[(listing.product, listing.variation_sku or None)] = \
+                listing.item_id
 
-        return Product.create_using_ebay_data(product_data)
+        statuses = []
+        for (product, variation_sku), item_id in sorted(
+            listings.iteritems(), key=lambda item: (item[0][0].id, item[0][1])
+        ):
+            status = {'ItemID': item_id}
+            if variation_sku:
+                status['SKU'] = variation_sku
+            statuses.append((product, status))
+
+        listed = set(product for product, _ in listings)
+        for product in products or []:
+            if product in listed:
+                continue
+            if product.ebay_item_id:
+                statuses.append((product, {'ItemID': product.ebay_item_id}))
+            elif product.code:
+                statuses.append((product, {'SKU': product.code}))
+
+        if not statuses:
+            return []
+
+        quantities = {}
+        with Transaction().set_context(locations=[self.warehouse.id]):
+            for sub_statuses in grouped_slice(statuses):
+                quantities.update(Product.get_quantity(
+                    list(set(product for product, _ in sub_statuses)),
+                    'forecast_quantity'
+                ))
+
+        for product, status in statuses:
+            status['Quantity'] = max(int(quantities[product.id]), 0)
+            status['StartPrice'] = self.get_ebay_price(product)
+        return statuses
+
+    def get_ebay_price(self, product):
+        """
+        Return the price of a product on eBay, from the price list of the
+        channel
+
+        :param product: Active record of the product
+        :return: Decimal price with the 2 digits of eBay
+        """
+        price = self.price_list.compute(
+            None, product, product.list_price, 1, product.default_uom
+        )
+        return price.quantize(Decimal('0.01'))
+
+    @staticmethod
+    def get_ebay_inventory_errors(statuses, response):
+        """
+        Return the errors of the listings of a ReviseInventoryStatus call.
+
+        eBay returns the inventory status of the listings revised, the other
+        ones failed with the errors of the response which refer to them,
+        or all the errors of the response if none does.
+
+        :param statuses: List of the inventory status sent in the call
+        :param response: Response dictionary of the call
+        :return: List of error messages, None for the listings revised, in
+                 the same order as `statuses`
+        """
+        revised = as_list(response.get('InventoryStatus'))
+        errors = as_list(response.get('Errors'))
+
+        def matches(status, data):
+            return all(
+                data.get(name) == status[name] for name in ('ItemID', 'SKU')
+                if name in status
+            )
+
+        def get_message(error):
+            return error.get('LongMessage') or error.get('ShortMessage')
+
+        result = []
+        for status in statuses:
+            if any(matches(status, data) for data in revised):
+                result.append(None)
+                continue
+            identifiers = set(
+                status[name] for name in ('ItemID', 'SKU') if name in status
+            )
+            messages = [
+                get_message(error) for error in errors
+                if identifiers & set(
+                    (parameter.get('Value') or '').strip()
+                    for parameter in as_list(error.get('ErrorParameters'))
+                )
+            ] or map(get_message, errors)
+            result.append(
+                '\n'.join(filter(None, messages)) or 'Listing not revised'
+            )
+        return result
+
+
+class EbayOrderCheckpoint(ModelSQL, ModelView):
+    """
+    eBay Order Import Checkpoint
+
+    Progress of an order import of a channel, which is resumed by the next
+    import if the current one does not complete.
+    """
+    __name__ = 'sale.channel.ebay.checkpoint'
+
+    channel = fields.Many2One(
+        'sale.channel', 'Channel', required=True, readonly=True, select=True,
+        ondelete='CASCADE',
+    )
+    time_from = fields.DateTime('Time From', readonly=True)
+    time_to = fields.DateTime('Time To', required=True, readonly=True)
+    time_filter = fields.Selection([
+        ('create', 'Creation Time'),
+        ('modified', 'Modification Time'),
+    ], 'Time Filter', required=True, readonly=True)
+    entries_per_page = fields.Integer(
+        'Entries Per Page', readonly=True, help="Number of orders of the "
+        "pages of the import, kept so a resumed import fetches the same pages"
+    )
+    last_page = fields.Integer('Last Page', required=True, readonly=True)
+    last_order_id = fields.Char('Last eBay Order ID', readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        """
+        Setup the class before adding to pool
+        """
+        super(EbayOrderCheckpoint, cls).__setup__()
+        cls._sql_constraints += [
+            (
+                'channel_uniq', 'UNIQUE(channel)',
+                'Only one order import can be in progress for a channel',
+            )
+        ]
+
+    @staticmethod
+    def default_last_page():
+        return 0
+
+    @classmethod
+    def get_or_create(cls, channel):
+        """
+        Return the checkpoint of the import in progress for the channel, or
+        start a new import from the last order import time upto now
+
+        :param channel: Active record of the sale channel
+        """
+        checkpoints = cls.search([('channel', '=', channel.id)], limit=1)
+        if checkpoints:
+            return checkpoints[0]
+
+        checkpoint, = cls.create([{
+            'channel': channel.id,
+            'time_from': channel.last_order_import_time,
+            'time_to': datetime.utcnow(),
+            'time_filter': channel.ebay_order_sync_mode or 'create',
+            'entries_per_page': channel.get_ebay_orders_per_page(),
+        }])
+        return checkpoint
+
+    def get_first_page(self):
+        """
+        Return the number of the page the import starts or resumes from.
+
+        The orders modified on eBay while the window is imported leave the
+        window and shift the later orders onto the pages already imported,
+        so an import of the modified orders restarts from the first page.
+        The orders already imported are skipped by their payload hash.
+        """
+        if self.time_filter == 'modified':
+            return 1
+        return self.last_page + 1
+
+    def page_done(self, page_number, orders):
+        """
+        Record that a page of orders is imported
+
+        :param page_number: Number of the page
+        :param orders: List of order data of the page
+        """
+        values = {'last_page': page_number}
+        if orders:
+            values['last_order_id'] = orders[-1]['OrderID']
+        self.write([self], values)
 
 
 class CheckEbayTokenStatusView(ModelView):
@@ -282,8 +1825,7 @@ class CheckEbayTokenStatus(Wizard):
 
         ebay_channel = SaleChannel(Transaction().context.get('active_id'))
 
-        api = ebay_channel.get_ebay_trading_api()
-        response = api.execute('GetTokenStatus').dict()
+        response = ebay_channel.call_ebay_api('GetTokenStatus')
 
         return {
             'status': response['TokenStatus']['Status'],
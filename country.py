@@ -7,17 +7,66 @@
     :copyright: (c) 2013 by Openlabs Technologies & Consulting (P) Limited
     :license: GPLv3, see LICENSE for more details.
 """
+import unicodedata
+
+from trytond.cache import Cache
 from trytond.pool import PoolMeta
 
+from .utils import LookupCacheMixin
+
 
-__all__ = ['Subdivision']
+__all__ = ['Country', 'Subdivision']
 __metaclass__ = PoolMeta
 
+# Names and old codes used on eBay for some states, by country code.
+# Maps the normalized alias to the code of the state without country prefix.
+EBAY_STATE_ALIASES = {
+    'US': {
+        'WASHINGTON DC': 'DC',
+        'WASHINGTON DISTRICT OF COLUMBIA': 'DC',
+    },
+    'CA': {
+        'PQ': 'QC',
+        'NF': 'NL',
+        'NEWFOUNDLAND': 'NL',
+        'YUKON TERRITORY': 'YT',
+    },
+    'IN': {
+        'NEW DELHI': 'DL',
+        'ORISSA': 'OR',
+        'PONDICHERRY': 'PY',
+        'UTTARANCHAL': 'UT',
+    },
+}
+
+
+class Country(LookupCacheMixin):
+    "Country"
+    __name__ = 'country.country'
+
+    _lookup_cache = Cache('country_country.get_by_code', context=False)
+    _lookup_field = 'code'
+
+    @classmethod
+    def get_by_code(cls, code):
+        """
+        Return the country with the given code. The result is cached until
+        a country is created, written or deleted.
+
+        :param code: ISO code of the country
+        :return: Active record of country
+        """
+        return cls.get_by_lookup(code)
+
 
 class Subdivision:
     "Subdivision"
     __name__ = 'country.subdivision'
 
+    _ebay_state_cache = Cache(
+        'country_subdivision.ebay_state_index', context=False
+    )
+
     @classmethod
     def __setup__(cls):
         """
@@ -28,29 +77,90 @@ class Subdivision:
             'state_not_found': 'State %s does not exist in country %s.',
         })
 
+    @staticmethod
+    def normalize_ebay_state(value):
+        """
+        Normalize a state code or name so that differences in case, accents,
+        dots and spacing do not matter while matching.
+
+        :param value: Code or Name of state
+        :return: Normalized value
+        """
+        if not isinstance(value, unicode):
+            value = value.decode('utf-8')
+        value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore')
+        return ' '.join(value.replace('.', '').upper().split())
+
     @classmethod
-    def search_using_ebay_state(cls, value, country):
+    def get_ebay_state_index(cls, country):
+        """
+        Return the index used to match eBay states of a country. It is built
+        once and kept until a subdivision is created, written or deleted.
+
+        The index is keyed by normalized full code (US-FL), code without the
+        country prefix (FL), name (FLORIDA) and known eBay aliases.
+
+        :param country: Active record of country
+        :return: Dictionary of normalized key to subdivision ID
+        """
+        index = cls._ebay_state_cache.get(country.id)
+        if index is not None:
+            return index
+
+        subdivisions = cls.search_read([
+            ('country', '=', country.id),
+        ], fields_names=['code', 'name'])
+
+        index = {}
+        for subdivision in subdivisions:
+            index[cls.normalize_ebay_state(subdivision['name'])] = \
+                subdivision['id']
+        # Codes take precedence over names
+        for subdivision in subdivisions:
+            code = cls.normalize_ebay_state(subdivision['code'])
+            index[code] = subdivision['id']
+            index[code.split('-', 1)[-1]] = subdivision['id']
+        for alias, code in EBAY_STATE_ALIASES.get(country.code, {}).items():
+            if code in index:
+                index.setdefault(alias, index[code])
+
+        return cls._ebay_state_cache.set(country.id, index)
+
+    @classmethod
+    def search_using_ebay_state(cls, value, country, silent=False):
         """
         Searches for state with given ebay StateOrProvince value.
 
         :param value: Code or Name of state from ebay
         :param country: Active record of country
+        :param silent: Return None instead of raising an error if the state
+                       is not found
         :return: Active record of state if found else raises error
         """
-        subdivisions = cls.search([
-            ('country', '=', country.id),
-            ('code', '=', country.code + '-' + value)
-        ])
-
-        if not subdivisions:
-            subdivisions = cls.search([
-                ('country', '=', country.id),
-                ('name', 'ilike', value),
-            ], limit=1)
+        subdivision_id = value and cls.get_ebay_state_index(country).get(
+            cls.normalize_ebay_state(value)
+        )
 
-        if not subdivisions:
+        if not subdivision_id:
+            if silent:
+                return None
             return cls.raise_user_error(
                 "state_not_found", error_args=(value, country.name)
             )
 
-        return subdivisions[0]
+        return cls(subdivision_id)
+
+    @classmethod
+    def create(cls, vlist):
+        cls._ebay_state_cache.clear()
+        return super(Subdivision, cls).create(vlist)
+
+    @classmethod
+    def write(cls, *args):
+        cls._ebay_state_cache.clear()
+        super(Subdivision, cls).write(*args)
+
+    @classmethod
+    def delete(cls, subdivisions):
+        cls._ebay_state_cache.clear()
+        super(Subdivision, cls).delete(subdivisions)
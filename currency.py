@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+    currency
+
+    Currency
+
+    :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
+    :license: GPLv3, see LICENSE for more details.
+"""
+from trytond.cache import Cache
+from trytond.pool import PoolMeta
+
+from .utils import LookupCacheMixin
+
+
+__all__ = ['Currency']
+__metaclass__ = PoolMeta
+
+
+class Currency(LookupCacheMixin):
+    "Currency"
+    __name__ = 'currency.currency'
+
+    _lookup_cache = Cache('currency_currency.get_by_code', context=False)
+    _lookup_field = 'code'
+
+    @classmethod
+    def get_by_code(cls, code):
+        """
+        Return the currency with the given code. The result is cached until
+        a currency is created, written or deleted.
+
+        :param code: ISO code of the currency
+        :return: Active record of currency
+        """
+        return cls.get_by_lookup(code)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+    import_run
+
+    Summary of the imports of orders from eBay
+
+    :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
+    :license: GPLv3, see LICENSE for more details.
+"""
+from datetime import datetime
+
+from trytond.model import ModelView, ModelSQL, fields
+
+
+__all__ = ['EbayImportRun', 'EbayImportRunStage']
+
+# Number of the most recent import runs kept for each channel
+EBAY_IMPORT_RUNS_KEPT = 100
+
+
+class EbayImportRun(ModelSQL, ModelView):
+    "eBay Import Run"
+    __name__ = 'sale.channel.ebay.import_run'
+
+    channel = fields.Many2One(
+        'sale.channel', 'Channel', required=True, readonly=True, select=True,
+        ondelete='CASCADE',
+    )
+    start_time = fields.DateTime('Start Time', readonly=True)
+    seconds = fields.Float('Seconds', digits=(16, 3), readonly=True)
+    orders_created = fields.Integer('Orders Created', readonly=True)
+    orders_updated = fields.Integer('Orders Updated', readonly=True)
+    orders_skipped = fields.Integer('Orders Skipped', readonly=True)
+    orders_failed = fields.Integer('Orders Failed', readonly=True)
+    queries = fields.Integer('SQL Queries', readonly=True)
+    api_calls = fields.Integer('eBay API Calls', readonly=True)
+    stages = fields.One2Many(
+        'sale.channel.ebay.import_run.stage', 'run', 'Stages', readonly=True
+    )
+
+    @classmethod
+    def __setup__(cls):
+        super(EbayImportRun, cls).__setup__()
+        cls._order.insert(0, ('start_time', 'DESC'))
+        cls._order.insert(1, ('id', 'DESC'))
+
+    @classmethod
+    def create_from_recorder(cls, channel, recorder, summary):
+        """
+        Store the measures of an import, and remove the oldest runs of the
+        channel, see `clean`
+
+        :param channel: Active record of the channel
+        :param recorder: ImportRecorder of the import
+        :param summary: Dictionary of the eBay order IDs `created`,
+                        `updated`, `skipped` and `failed` by the import
+        :return: Active record of the import run
+        """
+        run, = cls.create([{
+            'channel': channel.id,
+            'start_time': datetime.utcfromtimestamp(recorder.start_time),
+            'seconds': round(recorder.seconds, 3),
+            'orders_created': len(summary['created']),
+            'orders_updated': len(summary['updated']),
+            'orders_skipped': len(summary['skipped']),
+            'orders_failed': len(summary['failed']),
+            'queries': recorder.queries,
+            'api_calls': recorder.api_calls,
+            'stages': [('create', [{
+                'sequence': sequence,
+                'name': name,
+                'count': measure.count,
+                'seconds': round(measure.seconds, 3),
+                'queries': measure.queries,
+                'api_calls': measure.api_calls,
+            } for sequence, (name, measure) in enumerate(
+                recorder.stages.iteritems()
+            )])],
+        }])
+        cls.clean(channel)
+        return run
+
+    @classmethod
+    def clean(cls, channel, keep=EBAY_IMPORT_RUNS_KEPT):
+        """
+        Remove the runs of a channel except the `keep` most recent ones
+
+        :param channel: Active record of the channel
+        :param keep: Number of runs kept
+        """
+        runs = cls.search([('channel', '=', channel.id)], offset=keep)
+        if runs:
+            cls.delete(runs)
+
+
+class EbayImportRunStage(ModelSQL, ModelView):
+    "eBay Import Run Stage"
+    __name__ = 'sale.channel.ebay.import_run.stage'
+
+    run = fields.Many2One(
+        'sale.channel.ebay.import_run', 'Import Run', required=True,
+        readonly=True, select=True, ondelete='CASCADE',
+    )
+    sequence = fields.Integer('Sequence', readonly=True)
+    name = fields.Char('Stage', readonly=True)
+    count = fields.Integer('Count', readonly=True)
+    seconds = fields.Float('Seconds', digits=(16, 3), readonly=True)
+    queries = fields.Integer('SQL Queries', readonly=True)
+    api_calls = fields.Integer('eBay API Calls', readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(EbayImportRunStage, cls).__setup__()
+        cls._order.insert(0, ('sequence', 'ASC'))
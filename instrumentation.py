@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+    instrumentation
+
+    Measures of the stages of an import from eBay
+
+    :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
+    :license: GPLv3, see LICENSE for more details.
+"""
+import time
+import types
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from trytond.transaction import Transaction
+
+from .api import Return
+
+_local = threading.local()
+
+
+class StageMeasure(object):
+    "Measures of a stage, summed over all its runs"
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.api_calls = 0
+
+
+class ImportRecorder(object):
+    """
+    Record the wall time, the number of SQL queries and the number of calls
+    to eBay of each stage of an import.
+
+    Stages can be nested, the measures of a stage include the ones of the
+    stages it contains. The queries are counted on the cursor of the
+    transaction and the calls are counted when they are submitted, so
+    responses served by the response cache are not counted.
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.queries = 0
+        self.api_calls = 0
+        self.start_time = None
+        self.seconds = 0.0
+
+    @contextmanager
+    def record(self):
+        """
+        Make the recorder the current one of the thread while the block runs
+        """
+        cursor = Transaction().cursor
+        execute = cursor.execute
+
+        def count_execute(*args, **kwargs):
+            self.queries += 1
+            return execute(*args, **kwargs)
+
+        previous = getattr(_local, 'recorder', None)
+        _local.recorder = self
+        cursor.execute = count_execute
+        self.start_time = time.time()
+        try:
+            yield self
+        finally:
+            self.seconds += time.time() - self.start_time
+            cursor.execute = execute
+            _local.recorder = previous
+
+    def get_measure(self, name):
+        """
+        Return the measure of the stage `name`
+        """
+        measure = self.stages.get(name)
+        if measure is None:
+            measure = self.stages[name] = StageMeasure()
+        return measure
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measure a run of the stage `name`
+        """
+        measure = self.get_measure(name)
+
+        start, queries, api_calls = time.time(), self.queries, self.api_calls
+        try:
+            yield
+        finally:
+            measure.count += 1
+            measure.seconds += time.time() - start
+            measure.queries += self.queries - queries
+            measure.api_calls += self.api_calls - api_calls
+
+
+def get_recorder():
+    """
+    Return the recorder of the current thread, None if no import is recorded
+    """
+    return getattr(_local, 'recorder', None)
+
+
+@contextmanager
+def stage(name):
+    """
+    Measure the block as a run of the stage `name` of the current recorder
+    """
+    recorder = get_recorder()
+    if recorder is None:
+        yield
+        return
+    with recorder.stage(name):
+        yield
+
+
+def instrumented(name):
+    """
+    Decorator measuring each call of the function as a run of the stage
+    `name`
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_api_call():
+    """
+    Count a call to eBay in the current recorder
+    """
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.api_calls += 1
+
+
+def _measure_steps(recorder, measure, coroutine):
+    """
+    Run a coroutine, see `api.run_coroutines`, counting in `measure` the
+    queries and the calls to eBay of its steps and of the steps of the
+    coroutines it waits for
+    """
+    value, exception = None, None
+    while True:
+        queries, api_calls = recorder.queries, recorder.api_calls
+        try:
+            if exception is not None:
+                yielded = coroutine.throw(exception)
+            else:
+                yielded = coroutine.send(value)
+        finally:
+            measure.queries += recorder.queries - queries
+            measure.api_calls += recorder.api_calls - api_calls
+
+        if isinstance(yielded, types.GeneratorType):
+            yielded = _measure_steps(recorder, measure, yielded)
+        try:
+            value, exception = (yield yielded), None
+        except Exception as error:
+            value, exception = None, error
+
+
+def _measure_run(recorder, name, coroutine):
+    """
+    Run a coroutine as a run of the stage `name` of `recorder`
+    """
+    measure = recorder.get_measure(name)
+    start = time.time()
+    try:
+        result = yield _measure_steps(recorder, measure, coroutine)
+    finally:
+        measure.count += 1
+        measure.seconds += time.time() - start
+    raise Return(result)
+
+
+def instrumented_coroutine(name):
+    """
+    Decorator measuring each coroutine returned by the function, see
+    `api.run_coroutines`, as a run of the stage `name`.
+
+    Other coroutines run while a coroutine waits for its calls, so the
+    stage only counts the queries and the calls of the steps of the
+    coroutine, while its time goes from its start to its end, including
+    the calls it waits for.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            coroutine = func(*args, **kwargs)
+            recorder = get_recorder()
+            if recorder is None:
+                return coroutine
+            return _measure_run(recorder, name, coroutine)
+        return wrapper
+    return decorator
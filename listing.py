@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+    listing
+
+    Products of the listings of eBay
+
+    :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
+    :license: GPLv3, see LICENSE for more details.
+"""
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.tools import grouped_slice
+
+
+__all__ = ['EbayListing']
+
+
+class EbayListing(ModelSQL, ModelView):
+    """
+    eBay Listing
+
+    Product sold by a listing of a channel, or by a variation of the
+    listing. An item relisted on eBay gets a new item ID, so the same
+    product can have several listings.
+    """
+    __name__ = 'sale.channel.ebay.listing'
+
+    channel = fields.Many2One(
+        'sale.channel', 'Channel', required=True, readonly=True, select=True,
+        ondelete='CASCADE',
+    )
+    item_id = fields.Char(
+        'eBay Item ID', required=True, readonly=True, select=True
+    )
+    variation_sku = fields.Char(
+        'Variation SKU', readonly=True, help="SKU of the variation of the "
+        "listing, empty if the listing has no variations"
+    )
+    product = fields.Many2One(
+        'product.product', 'Product', required=True, select=True,
+        ondelete='CASCADE',
+    )
+
+    @classmethod
+    def __setup__(cls):
+        """
+        Setup the class before adding to pool
+        """
+        super(EbayListing, cls).__setup__()
+        cls._sql_constraints += [
+            (
+                'item_uniq', 'UNIQUE(channel, item_id, variation_sku)',
+                'A listing of eBay can only be mapped once to a product',
+            )
+        ]
+
+    @staticmethod
+    def default_variation_sku():
+        return ''
+
+    @classmethod
+    def get_products(cls, channel, keys):
+        """
+        Return the products of listings of a channel
+
+        :param channel: Active record of the sale channel
+        :param keys: List of tuples of eBay item ID and variation SKU, None
+                     for the listings without variations
+        :return: Dictionary of the keys of the listings found to active
+                 record of product
+        """
+        keys = set(keys)
+        products = {}
+        for item_ids in grouped_slice(set(key[0] for key in keys)):
+            for listing in cls.search([
+                ('channel', '=', channel.id),
+                ('item_id', 'in', list(item_ids)),
+            ]):
+                key = (listing.item_id, listing.variation_sku or None)
+                if key in keys:
+                    products[key] = listing.product
+        return products
+
+    @classmethod
+    def create_many(cls, channel, products):
+        """
+        Record the products of listings of a channel
+
+        :param channel: Active record of the sale channel
+        :param products: Dictionary of tuples of eBay item ID and variation
+                         SKU to active record of product
+        """
+        if not products:
+            return []
+        return cls.create([{
+            'channel': channel.id,
+            'item_id': item_id,
+            'variation_sku': variation_sku or '',
+            'product': product.id,
+        } for (item_id, variation_sku), product in products.iteritems()])
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+    order_stream
+
+    Incremental parsing of the GetOrders responses of eBay
+
+    :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
+    :license: GPLv3, see LICENSE for more details.
+"""
+from collections import defaultdict
+
+from lxml import etree
+from ebaysdk.exception import ConnectionError
+
+
+def get_tag(element):
+    """
+    Return the tag of an element without its namespace
+    """
+    return etree.QName(element).localname
+
+
+def element_to_dict(element):
+    """
+    Convert an element to the value ebaysdk gives it in `Response.dict()`.
+
+    Attributes are prefixed with an underscore, the text of an element
+    with attributes or children is its `value` and repeated children are
+    turned into a list.
+    """
+    children = [child for child in element if isinstance(child.tag, basestring)]
+    if not children and not element.attrib:
+        text = (element.text or '').strip()
+        return text or None
+
+    value = {}
+    if children:
+        grouped = defaultdict(list)
+        for child in children:
+            grouped[get_tag(child)].append(element_to_dict(child))
+        value = dict(
+            (tag, values[0] if len(values) == 1 else values)
+            for tag, values in grouped.iteritems()
+        )
+    value.update(('_' + key, val) for key, val in element.attrib.items())
+    text = (element.text or '').strip()
+    if text:
+        value['value'] = text
+    return value
+
+
+def normalize_order(order):
+    """
+    Turn the transactions of an order into a list, even when the order
+    has a single transaction.
+
+    :param order: Order dictionary, in the format of `Response.dict()`
+    :return: The same order
+    """
+    transaction_array = order.get('TransactionArray') or {}
+    transactions = transaction_array.get('Transaction') or []
+    if isinstance(transactions, dict):
+        transactions = [transactions]
+    order['TransactionArray'] = {'Transaction': transactions}
+    return order
+
+
+class OrderStream(object):
+    """
+    Iterate over the orders of a GetOrders response while it is read.
+
+    The response is parsed with a pull parser and each order is yielded as
+    soon as it is read, as a normalized dictionary (see `normalize_order`).
+    The elements of an order are dropped once it is yielded, so the whole
+    response is never held in memory.
+
+    The other elements of the response, e.g. `HasMoreOrders` or
+    `PaginationResult`, are available in `response` once the orders have
+    been consumed.
+
+    :param source: File object of the raw XML response
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.response = {}
+
+    def __iter__(self):
+        depth = 0
+        for event, element in etree.iterparse(
+            self.source, events=('start', 'end')
+        ):
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+
+            if depth == 2 and get_tag(element) == 'Order':
+                order = normalize_order(element_to_dict(element))
+                element.clear()
+                element.getparent().remove(element)
+                yield order
+            elif depth == 1 and get_tag(element) != 'OrderArray':
+                value = element_to_dict(element)
+                tag = get_tag(element)
+                if tag in self.response:
+                    if not isinstance(self.response[tag], list):
+                        self.response[tag] = [self.response[tag]]
+                    self.response[tag].append(value)
+                else:
+                    self.response[tag] = value
+                element.clear()
+            elif depth == 0:
+                self.check_errors()
+
+    def check_errors(self):
+        """
+        Raise a ConnectionError, like ebaysdk does, if eBay failed the call
+        """
+        if self.response.get('Ack') != 'Failure':
+            return
+
+        errors = self.response.get('Errors') or []
+        if isinstance(errors, dict):
+            errors = [errors]
+        raise ConnectionError('GetOrders: %s' % ', '.join(
+            'Code: %s, %s %s' % (
+                error.get('ErrorCode'), error.get('ShortMessage'),
+                error.get('LongMessage'),
+            ) for error in errors
+        ), self.response)
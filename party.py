@@ -7,21 +7,37 @@
     :copyright: (c) 2013-2015 by Openlabs Technologies & Consulting (P) Limited
     :license: GPLv3, see LICENSE for more details.
 """
+import hashlib
+
+from trytond import backend
 from trytond.model import fields
 from trytond.pool import PoolMeta, Pool
+from trytond.tools import grouped_slice
 from trytond.transaction import Transaction
 
+from .api import Return, run_coroutines
+from .instrumentation import instrumented, instrumented_coroutine
+from .records import EbayAddress
+from .utils import (
+    add_unique_index_where_set, get_duplicate_values, get_unique_index_name
+)
+
 
 __all__ = ['Party', 'Address']
 __metaclass__ = PoolMeta
 
+# Fields of the address used to match addresses from eBay
+FINGERPRINT_FIELDS = [
+    'name', 'street', 'streetbis', 'zip', 'city', 'country', 'subdivision',
+]
+
 
 class Party:
     "Party"
     __name__ = 'party.party'
 
     ebay_user_id = fields.Char(
-        'eBay User ID',
+        'eBay User ID', select=True,
         help="This is global and unique ID given to a user across whole ebay. "
         "Warning: Editing this might result in duplication of parties on next"
         " import"
@@ -34,20 +50,27 @@ class Party:
         """
         super(Party, cls).validate(parties)
 
-        for party in parties:
-            party.check_unique_ebay_user_id()
+        cls.check_unique_ebay_user_ids(parties)
 
     def check_unique_ebay_user_id(self):
         """
         Check if ebay user id is unique for each party
         """
-        if not self.ebay_user_id:
-            return
-        if self.search([
-            ('ebay_user_id', '=', self.ebay_user_id),
-            ('id', '!=', self.id)
-        ]):
-            self.raise_user_error('unique_ebay_user_id')
+        self.check_unique_ebay_user_ids([self])
+
+    @classmethod
+    def check_unique_ebay_user_ids(cls, parties):
+        """
+        Check if ebay user ids are unique for all the parties with one
+        grouped query
+        """
+        duplicates = get_duplicate_values(
+            cls, 'ebay_user_id', [party.ebay_user_id for party in parties]
+        )
+        if duplicates:
+            cls.raise_user_error(
+                'unique_ebay_user_id', (', '.join(duplicates),)
+            )
 
     @classmethod
     def __setup__(cls):
@@ -57,9 +80,22 @@ class Party:
         super(Party, cls).__setup__()
         cls._error_messages.update({
             'account_not_found': 'eBay Account does not exist in context',
-            'unique_ebay_user_id': 'eBay User ID must be unique for party',
+            'unique_ebay_user_id':
+                'eBay User ID must be unique for party. '
+                'Duplicated eBay User IDs: %s',
+        })
+        cls._sql_error_messages.update({
+            get_unique_index_name(cls, 'ebay_user_id'):
+                'eBay User ID must be unique for party',
         })
 
+    @classmethod
+    def __register__(cls, module_name):
+        super(Party, cls).__register__(module_name)
+
+        # Migration: Add unique index on eBay user ID
+        add_unique_index_where_set(cls, module_name, 'ebay_user_id')
+
     @classmethod
     def find_or_create_using_ebay_id(cls, ebay_user_id, item_id=None):
         """
@@ -76,26 +112,79 @@ class Party:
             informations like eMail etc.
         :return: Active record of record created/found
         """
-        SaleChannel = Pool().get('sale.channel')
+        return cls.find_or_create_many_using_ebay_ids(
+            [(ebay_user_id, item_id)]
+        )[ebay_user_id]
 
-        ebay_parties = cls.search([
-            ('ebay_user_id', '=', ebay_user_id),
-        ])
-
-        if ebay_parties:
-            return ebay_parties[0]
+    @classmethod
+    def find_or_create_many_using_ebay_ids(cls, buyers):
+        """
+        Find or create the parties for many ebay users at once.
 
-        ebay_channel = SaleChannel(Transaction().context['current_channel'])
-        ebay_channel.validate_ebay_channel()
+        The known users are found with a single query, the unknown ones are
+        fetched from ebay concurrently, or from the response cache of the
+        channel, and created together. Each user is
+        resolved only once, however many times it appears in `buyers`.
 
-        api = ebay_channel.get_ebay_trading_api()
+        :param buyers: List of tuples of ebay user ID and item ID, see
+                       `find_or_create_using_ebay_id`
+        :return: Dictionary of ebay user ID to active record of party
+        """
+        return run_coroutines([cls.resolve_ebay_ids(buyers)])[0]
 
-        filters = {'UserID': ebay_user_id}
-        if item_id:
-            filters['ItemID'] = item_id
-        user_data = api.execute('GetUser', filters).dict()
+    @classmethod
+    @instrumented_coroutine('resolve_parties')
+    def resolve_ebay_ids(cls, buyers):
+        """
+        Coroutine of `find_or_create_many_using_ebay_ids`, see
+        `api.run_coroutines`
+        """
+        SaleChannel = Pool().get('sale.channel')
 
-        return cls.create_using_ebay_data(user_data)
+        item_ids = {}
+        for ebay_user_id, item_id in buyers:
+            if not item_ids.get(ebay_user_id):
+                item_ids[ebay_user_id] = item_id
+        if not item_ids:
+            raise Return({})
+
+        parties = {}
+        for ebay_user_ids in grouped_slice(item_ids.keys()):
+            parties.update(
+                (party.ebay_user_id, party) for party in cls.search([
+                    ('ebay_user_id', 'in', list(ebay_user_ids)),
+                ])
+            )
+
+        missing_ids = [id for id in item_ids if id not in parties]
+        if missing_ids:
+            ebay_channel = SaleChannel(
+                Transaction().context['current_channel']
+            )
+
+            # The item decides whether eBay returns the email of the user,
+            # so the responses are cached for the user and the item
+            calls, keys = {}, {}
+            for ebay_user_id in missing_ids:
+                filters = {'UserID': ebay_user_id}
+                if item_ids[ebay_user_id]:
+                    filters['ItemID'] = item_ids[ebay_user_id]
+                keys[ebay_user_id] = '%s:%s' % (
+                    ebay_user_id, item_ids[ebay_user_id] or ''
+                )
+                calls[keys[ebay_user_id]] = filters
+            responses = yield ebay_channel.fetch_ebay_cached_responses(
+                'GetUser', calls
+            )
+
+            parties.update(zip(
+                missing_ids,
+                cls.create_many_using_ebay_data([
+                    responses[keys[id]] for id in missing_ids
+                ])
+            ))
+
+        raise Return(parties)
 
     @classmethod
     def create_using_ebay_data(cls, ebay_data):
@@ -107,6 +196,21 @@ class Party:
                                   Reference/eBay/GetUser.html#Response
         :return: Active record of record created
         """
+        return cls.create_many_using_ebay_data([ebay_data])[0]
+
+    @classmethod
+    def create_many_using_ebay_data(cls, users_data):
+        """
+        Creates records of customers for a list of values sent by ebay
+
+        :param users_data: List of dictionaries of values for customers sent
+                           by ebay
+        :return: List of active records created, in the same order as
+                 `users_data`
+        """
+        if not users_data:
+            return []
+
         return cls.create([{
             # eBay wont expose the name of the buyer to the seller.
             # What we get is the name in the shipping address in the sale order
@@ -122,52 +226,89 @@ class Party:
                     'email': ebay_data['User']['Email']
                 }])
             ]
-        }])[0]
+        } for ebay_data in users_data])
 
     def add_phone_using_ebay_data(self, ebay_phone):
         """
-        Add contact mechanism for party
+        Add contact mechanism for party, if eBay gives a phone
+        """
+        self.add_phones_using_ebay_data([(self, ebay_phone)])
+
+    @classmethod
+    def add_phones_using_ebay_data(cls, phones):
+        """
+        Add contact mechanisms for the phones given by eBay to parties which
+        do not have them yet. The existing phones are looked up with a
+        query per slice of phones and the missing ones are created together.
+
+        :param phones: List of tuples of party and phone from eBay
         """
         ContactMechanism = Pool().get('party.contact_mechanism')
 
-        # Create phone as contact mechanism
-        if not ContactMechanism.search([
-            ('party', '=', self.id),
-            ('type', 'in', ['phone', 'mobile']),
-            ('value', '=', ebay_phone),
-        ]):
+        phones = set(
+            (party.id, phone) for party, phone in phones if phone
+        )
+        if not phones:
+            return
+
+        existing = set()
+        for sub_phones in grouped_slice(list(phones)):
+            sub_phones = list(sub_phones)
+            existing.update(
+                (mechanism.party.id, mechanism.value)
+                for mechanism in ContactMechanism.search([
+                    ('party', 'in', list(set(p for p, _ in sub_phones))),
+                    ('type', 'in', ['phone', 'mobile']),
+                    ('value', 'in', list(set(v for _, v in sub_phones))),
+                ])
+            )
+
+        # Create phones as contact mechanisms
+        missing = sorted(phones - existing)
+        if missing:
             ContactMechanism.create([{
-                'party': self.id,
+                'party': party_id,
                 'type': 'phone',
-                'value': ebay_phone,
-            }])
+                'value': phone,
+            } for party_id, phone in missing])
 
     def get_address_from_ebay_data(self, address_data):
         """
         Return address instance for data fetched from ebay
         """
+        return self.get_address_from_ebay_address(
+            EbayAddress.from_ebay_data(address_data)
+        )
+
+    def get_address_from_ebay_address(self, ebay_address):
+        """
+        Return address instance for an address of an eBay order
+
+        :param ebay_address: EbayAddress record
+        """
         Address = Pool().get('party.address')
         Country = Pool().get('country.country')
         Subdivision = Pool().get('country.subdivision')
+        SaleChannel = Pool().get('sale.channel')
 
-        country, = Country.search([
-            ('code', '=', address_data['Country'])
-        ], limit=1)
+        channel_id = Transaction().context.get('current_channel')
+        silent = channel_id is not None and \
+            SaleChannel(channel_id).ebay_unknown_state == 'empty'
+
+        country = Country.get_by_code(ebay_address.country_code)
         subdivision = Subdivision.search_using_ebay_state(
-            address_data['StateOrProvince'], country
+            ebay_address.state, country, silent=silent
         )
 
         return Address(
             party=self.id,
-            name=address_data['Name'],
-            street=address_data['Street1'],
-            streetbis=(
-                address_data.get('Street2') or None
-            ),
-            zip=address_data['PostalCode'],
-            city=address_data['CityName'],
+            name=ebay_address.name,
+            street=ebay_address.street,
+            streetbis=ebay_address.streetbis,
+            zip=ebay_address.zip,
+            city=ebay_address.city,
             country=country.id,
-            subdivision=subdivision.id,
+            subdivision=subdivision and subdivision.id,
         )
 
     def find_or_create_address_using_ebay_data(self, address_data):
@@ -179,38 +320,187 @@ class Party:
         :param address_data: Dictionary of address data from ebay
         :return: Active record of address created/found
         """
-        ebay_address = self.get_address_from_ebay_data(address_data)
+        return self.find_or_create_address_using_ebay_address(
+            EbayAddress.from_ebay_data(address_data)
+        )
+
+    def find_or_create_address_using_ebay_address(self, ebay_address):
+        """
+        Look for the address in tryton corresponding to an address of an
+        eBay order. If found, return the same else create a new one and
+        return that.
+
+        :param ebay_address: EbayAddress record
+        :return: Active record of address created/found
+        """
+        return self.find_or_create_addresses_using_ebay_addresses([
+            (self, ebay_address)
+        ])[0]
 
-        for address in self.addresses:
-            if address.is_match_found(ebay_address):
-                return address
+    @classmethod
+    @instrumented('match_address')
+    def find_or_create_addresses_using_ebay_addresses(cls, addresses):
+        """
+        Look for the addresses in tryton corresponding to addresses of eBay
+        orders, see `find_or_create_address_using_ebay_address`.
 
-        # No match found. Create new one.
-        ebay_address.save()
-        return ebay_address
+        The addresses are matched by fingerprint with a query per slice of
+        addresses, and the ones not found are created together. An address
+        repeated in the list is created once.
+
+        :param addresses: List of tuples of party and EbayAddress record
+        :return: List of active records of addresses created/found, in the
+                 same order as `addresses`
+        """
+        Address = Pool().get('party.address')
+
+        keys, new_addresses = [], {}
+        for party, ebay_address in addresses:
+            address = party.get_address_from_ebay_address(ebay_address)
+            key = (party.id, address.get_ebay_fingerprint())
+            keys.append(key)
+            new_addresses.setdefault(key, address)
+
+        found = {}
+        for sub_keys in grouped_slice(list(new_addresses)):
+            sub_keys = list(sub_keys)
+            for address in Address.search([
+                ('party', 'in', list(set(p for p, _ in sub_keys))),
+                ('ebay_fingerprint', 'in', list(set(f for _, f in sub_keys))),
+            ]):
+                found.setdefault(
+                    (address.party.id, address.ebay_fingerprint), address
+                )
+
+        # No match found. Create new ones.
+        missing = [key for key in new_addresses if key not in found]
+        if missing:
+            found.update(zip(missing, Address.create([
+                new_addresses[key]._save_values for key in missing
+            ])))
+
+        return [found[key] for key in keys]
 
 
 class Address:
     "Address"
     __name__ = 'party.address'
 
+    ebay_fingerprint = fields.Char(
+        'eBay Fingerprint', readonly=True,
+        help="Hash of the normalized address, used to find the address "
+        "matching an address from eBay"
+    )
+
+    @classmethod
+    def __register__(cls, module_name):
+        TableHandler = backend.get('TableHandler')
+        cursor = Transaction().cursor
+        table = TableHandler(cursor, cls, module_name)
+
+        fingerprint_exist = table.column_exist('ebay_fingerprint')
+
+        super(Address, cls).__register__(module_name)
+
+        table = TableHandler(cursor, cls, module_name)
+        table.index_action(['party', 'ebay_fingerprint'], 'add')
+
+        # Migration: Compute fingerprint of existing addresses
+        if not fingerprint_exist:
+            address = cls.__table__()
+            last_id = 0
+            while True:
+                cursor.execute(*address.select(
+                    address.id, *[
+                        getattr(address, field)
+                        for field in FINGERPRINT_FIELDS
+                    ],
+                    where=address.id > last_id,
+                    order_by=address.id, limit=1000
+                ))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                for row in rows:
+                    cursor.execute(*address.update(
+                        [address.ebay_fingerprint],
+                        [cls.compute_ebay_fingerprint(
+                            dict(zip(FINGERPRINT_FIELDS, row[1:]))
+                        )],
+                        where=address.id == row[0]
+                    ))
+                last_id = rows[-1][0]
+
+    @staticmethod
+    def compute_ebay_fingerprint(values):
+        """
+        Compute the fingerprint of an address from its values. Text is
+        compared irrespective of case and spacing.
+
+        :param values: Dictionary of values of address with IDs for country
+                       and subdivision
+        :return: Fingerprint of the address
+        """
+        parts = []
+        for field in FINGERPRINT_FIELDS:
+            value = values.get(field)
+            if value is None:
+                value = u''
+            elif not isinstance(value, unicode):
+                value = unicode(value)
+            parts.append(u' '.join(value.lower().split()))
+        return hashlib.sha1(u'\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    def get_ebay_fingerprint(self):
+        """
+        Return the fingerprint of the current address
+        """
+        return self.compute_ebay_fingerprint({
+            'name': self.name,
+            'street': self.street,
+            'streetbis': self.streetbis,
+            'zip': self.zip,
+            'city': self.city,
+            'country': self.country and self.country.id,
+            'subdivision': self.subdivision and self.subdivision.id,
+        })
+
+    @classmethod
+    def create(cls, vlist):
+        vlist = [x.copy() for x in vlist]
+        for values in vlist:
+            values['ebay_fingerprint'] = cls.compute_ebay_fingerprint(values)
+        return super(Address, cls).create(vlist)
+
+    @classmethod
+    def write(cls, *args):
+        super(Address, cls).write(*args)
+
+        actions = iter(args)
+        to_update = []
+        for addresses, values in zip(actions, actions):
+            if set(values) & set(FINGERPRINT_FIELDS):
+                to_update.extend(addresses)
+
+        if to_update:
+            fingerprints = {}
+            for address in cls.browse([a.id for a in to_update]):
+                fingerprints.setdefault(
+                    address.get_ebay_fingerprint(), []
+                ).append(address)
+            args = []
+            for fingerprint, addresses in fingerprints.iteritems():
+                args.extend((addresses, {'ebay_fingerprint': fingerprint}))
+            super(Address, cls).write(*args)
+
     def is_match_found(self, ebay_address):
         """
-        Match the current address with the ebay address.
-        Match all the fields of the address, i.e., streets, city, subdivision
-        and country. For any deviation in any field, returns False.
+        Match the current address with an address from ebay, by comparing
+        their fingerprints, see `compute_ebay_fingerprint`.
 
-        :param address_data: Dictionary of address data from ebay
-                             Ref: http://developer.ebay.com/DevZone/XML/docs/
-                                     Reference/eBay/GetUser.html#Response
+        :param ebay_address: Address instance for the address data from
+                             ebay, see `party.party.get_address_from_ebay_data`
         :return: True if address matches else False
         """
-        return all([
-            self.name == ebay_address.name,
-            self.street == ebay_address.street,
-            self.streetbis == ebay_address.streetbis,
-            self.zip == ebay_address.zip,
-            self.city == ebay_address.city,
-            self.country == ebay_address.country,
-            self.subdivision == ebay_address.subdivision,
-        ])
+        return self.get_ebay_fingerprint() == \
+            ebay_address.get_ebay_fingerprint()
@@ -5,18 +5,30 @@
     :copyright: (c) 2013-2015 by Openlabs Technologies & Consulting (P) Limited
     :license: GPLv3, see LICENSE for more details.
 '''
+import logging
+
 from trytond import backend
+from trytond.cache import Cache
 from trytond.model import fields
 from trytond.transaction import Transaction
 from trytond.pool import PoolMeta, Pool
+from trytond.tools import grouped_slice
 from decimal import Decimal
 
+from .records import as_list
+from .utils import (
+    LookupCacheMixin, add_unique_index_where_set, get_duplicate_values,
+    get_unique_index_name
+)
+
 
 __all__ = [
-    'Product',
+    'Product', 'Uom',
 ]
 __metaclass__ = PoolMeta
 
+logger = logging.getLogger(__name__)
+
 
 class Product:
     "Product"
@@ -24,7 +36,7 @@ class Product:
     __name__ = "product.product"
 
     ebay_item_id = fields.Char(
-        'eBay Item ID',
+        'eBay Item ID', select=True,
         help="This is global and unique ID given to an item across whole ebay."
         " Warning: Editing this might result in duplicate products on next"
         " import"
@@ -37,20 +49,27 @@ class Product:
         """
         super(Product, cls).validate(products)
 
-        for product in products:
-            product.check_unique_ebay_item_id()
+        cls.check_unique_ebay_item_ids(products)
 
     def check_unique_ebay_item_id(self):
         """
-        Check if ebay user id is unique for each product
+        Check if ebay item id is unique for each product
         """
-        if not self.ebay_item_id:
-            return
-        if self.search([
-            ('ebay_item_id', '=', self.ebay_item_id),
-            ('id', '!=', self.id)
-        ]):
-            self.raise_user_error('unique_ebay_item_id')
+        self.check_unique_ebay_item_ids([self])
+
+    @classmethod
+    def check_unique_ebay_item_ids(cls, products):
+        """
+        Check if ebay item ids are unique for all the products with one
+        grouped query
+        """
+        duplicates = get_duplicate_values(
+            cls, 'ebay_item_id', [product.ebay_item_id for product in products]
+        )
+        if duplicates:
+            cls.raise_user_error(
+                'unique_ebay_item_id', (', '.join(duplicates),)
+            )
 
     @classmethod
     def __register__(cls, module_name):
@@ -63,6 +82,10 @@ class Product:
         # Migration
         table.drop_constraint('unique_product_ebay_item_id')
 
+        # Migration: Unique constraint replaced by a unique index which
+        # ignores products without eBay item ID
+        add_unique_index_where_set(cls, module_name, 'ebay_item_id')
+
     @classmethod
     def __setup__(cls):
         """
@@ -71,7 +94,13 @@ class Product:
         super(Product, cls).__setup__()
         cls._error_messages.update({
             "missing_product_code": 'Product "%s" has a missing code.',
-            'unique_ebay_item_id': 'eBay Item ID must be unique for product',
+            'unique_ebay_item_id':
+                'eBay Item ID must be unique for product. '
+                'Duplicated eBay Item IDs: %s',
+        })
+        cls._sql_error_messages.update({
+            get_unique_index_name(cls, 'ebay_item_id'):
+                'eBay Item ID must be unique for product',
         })
 
     @classmethod
@@ -103,28 +132,129 @@ class Product:
         :param product_data: Product Data from eBay
         :returns: Browse record of product created
         """
+        return cls.create_many_using_ebay_data([product_data])[0]
+
+    @classmethod
+    def create_many_using_ebay_data(cls, products_data):
+        """
+        Create new products with the list of `products_data` from ebay,
+        using a single create of templates.
+
+        :param products_data: List of product data from eBay
+        :returns: List of browse records of products created, in the same
+                  order as `products_data`
+        """
         Template = Pool().get('product.template')
 
-        product_values = cls.extract_product_values_from_ebay_data(
+        if not products_data:
+            return []
+
+        vlist = []
+        for product_data in products_data:
+            product_values = cls.extract_product_values_from_ebay_data(
+                product_data
+            )
+
+            product_values.update({
+                'products': [('create', [{
+                    'ebay_item_id': product_data['Item']['ItemID'],
+                    'description': product_data['Item']['Description'],
+                    'list_price': Decimal(
+                        product_data['Item']['BuyItNowPrice']['value'] or
+                        product_data['Item']['StartPrice']['value']
+                    ),
+                    'cost_price':
+                        Decimal(product_data['Item']['StartPrice']['value']),
+                    'code':
+                        product_data['Item'].get('SKU', None) and
+                        product_data['Item']['SKU'] or None,
+                }])],
+            })
+            vlist.append(product_values)
+
+        return [template.products[0] for template in Template.create(vlist)]
+
+    @classmethod
+    def create_variations_using_ebay_data(cls, product_data, skus):
+        """
+        Create a product for each variation of an item of eBay, as the
+        variants of a single template.
+
+        :param product_data: Product Data from eBay
+        :param skus: List of SKUs of the variations to create
+        :returns: Dictionary of SKU to browse record of product created
+        """
+        Template = Pool().get('product.template')
+
+        item = product_data['Item']
+        variations = dict(
+            (variation['SKU'], variation) for variation in as_list(
+                (item.get('Variations') or {}).get('Variation')
+            ) if variation.get('SKU')
+        )
+
+        template_values = cls.extract_product_values_from_ebay_data(
             product_data
         )
+        product_values = []
+        for sku in skus:
+            price = Decimal(
+                (variations.get(sku) or item)['StartPrice']['value']
+            )
+            product_values.append({
+                'description': item.get('Description'),
+                'list_price': price,
+                'cost_price': price,
+                'code': sku,
+            })
+        template_values['products'] = [('create', product_values)]
+
+        template, = Template.create([template_values])
+        return dict(
+            (product.code, product) for product in template.products
+        )
+
+    @classmethod
+    def get_by_ebay_skus(cls, skus):
+        """
+        Return the products whose code is one of the SKUs of eBay. When
+        several products have the same code, the oldest one is returned.
+
+        :param skus: List of SKUs
+        :returns: Dictionary of SKU to browse record of product
+        """
+        products = {}
+        duplicates = set()
+        for sub_skus in grouped_slice(set(skus)):
+            for product in cls.search([
+                ('code', 'in', list(sub_skus)),
+            ], order=[('id', 'ASC')]):
+                if product.code in products:
+                    duplicates.add(product.code)
+                    continue
+                products[product.code] = product
+        if duplicates:
+            logger.warning(
+                'Several products have the code of eBay SKU(s) %s, the '
+                'oldest one is used', ', '.join(sorted(duplicates))
+            )
+        return products
 
-        product_values.update({
-            'products': [('create', [{
-                'ebay_item_id': product_data['Item']['ItemID'],
-                'description': product_data['Item']['Description'],
-                'list_price': Decimal(
-                    product_data['Item']['BuyItNowPrice']['value'] or
-                    product_data['Item']['StartPrice']['value']
-                ),
-                'cost_price':
-                    Decimal(product_data['Item']['StartPrice']['value']),
-                'code':
-                    product_data['Item'].get('SKU', None) and
-                    product_data['Item']['SKU'] or None,
-            }])],
-        })
 
-        product_template, = Template.create([product_values])
+class Uom(LookupCacheMixin):
+    "UOM"
+    __name__ = 'product.uom'
 
-        return product_template.products[0]
+    _lookup_cache = Cache('product_uom.get_by_name', context=False)
+    _lookup_field = 'name'
+
+    @classmethod
+    def get_by_name(cls, name):
+        """
+        Return the unit of measure with the given name. The result is cached
+        until a unit of measure is created, written or deleted.
+
+        :param name: Name of the unit of measure
+        :return: Active record of unit of measure
+        """
+        return cls.get_by_lookup(name)
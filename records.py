@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+    records
+
+    Compact records of the orders fetched from eBay
+
+    :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
+    :license: GPLv3, see LICENSE for more details.
+"""
+import json
+import hashlib
+from datetime import datetime
+from decimal import Decimal
+
+
+__all__ = ['EbayAddress', 'EbayOrderLine', 'EbayShipping', 'EbayOrder']
+
+
+def as_list(value):
+    """
+    Return the value of a repeated element of a response as a list. ebaysdk
+    gives a dictionary when the element is there once and a list when it is
+    repeated.
+    """
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        return [value]
+    return value
+
+
+def dump_amount(amount):
+    """
+    Return an amount as text which does not depend on its trailing zeros
+    """
+    return str(amount.normalize())
+
+
+def get_amount(value):
+    """
+    Return the amount of an amount element, e.g. `{'_currencyID': 'USD',
+    'value': '10.0'}`, as a Decimal
+    """
+    return Decimal((value or {}).get('value') or 0)
+
+
+class EbayAddress(object):
+    """
+    Address of an eBay order
+    """
+    __slots__ = (
+        'name', 'street', 'streetbis', 'zip', 'city', 'state', 'country_code',
+        'phone',
+    )
+
+    def __init__(
+        self, name, street, streetbis, zip, city, state, country_code,
+        phone=None
+    ):
+        self.name = name
+        self.street = street
+        self.streetbis = streetbis
+        self.zip = zip
+        self.city = city
+        self.state = state
+        self.country_code = country_code
+        self.phone = phone
+
+    @classmethod
+    def from_ebay_data(cls, address_data):
+        """
+        Build the record from the `ShippingAddress` of an order
+        """
+        return cls(
+            name=address_data['Name'],
+            street=address_data['Street1'],
+            streetbis=address_data.get('Street2') or None,
+            zip=address_data['PostalCode'],
+            city=address_data['CityName'],
+            state=address_data.get('StateOrProvince'),
+            country_code=address_data['Country'],
+            phone=address_data.get('Phone') or None,
+        )
+
+
+class EbayOrderLine(object):
+    """
+    Line of an eBay order, from a transaction of the order.
+
+    The SKU is the one of the variation bought if the listing has
+    variations, else the one of the listing.
+    """
+    __slots__ = (
+        'item_id', 'variation_sku', 'sku', 'title', 'unit_price', 'quantity',
+    )
+
+    def __init__(
+        self, item_id, title, unit_price, quantity, sku=None,
+        variation_sku=None
+    ):
+        self.item_id = item_id
+        self.variation_sku = variation_sku
+        self.sku = sku
+        self.title = title
+        self.unit_price = unit_price
+        self.quantity = quantity
+
+    @property
+    def listing_key(self):
+        """
+        Key of the listing of the line, as expected by
+        `sale.channel.resolve_ebay_products`
+        """
+        return (self.item_id, self.variation_sku)
+
+    @classmethod
+    def from_ebay_data(cls, transaction_data):
+        """
+        Build the record from a `Transaction` of an order
+        """
+        item = transaction_data['Item']
+        variation = transaction_data.get('Variation') or {}
+        return cls(
+            item_id=item['ItemID'],
+            title=variation.get('VariationTitle') or item['Title'],
+            unit_price=get_amount(transaction_data['TransactionPrice']),
+            quantity=Decimal(transaction_data['QuantityPurchased']),
+            sku=variation.get('SKU') or item.get('SKU'),
+            variation_sku=variation.get('SKU'),
+        )
+
+
+class EbayShipping(object):
+    """
+    Shipping service selected by the buyer of an eBay order
+    """
+    __slots__ = ('service', 'cost')
+
+    def __init__(self, service, cost):
+        self.service = service
+        self.cost = cost
+
+    @classmethod
+    def from_ebay_data(cls, shipping_data):
+        """
+        Build the record from the `ShippingServiceSelected` of an order
+        """
+        shipping_data = shipping_data or {}
+        return cls(
+            service=shipping_data.get('ShippingService'),
+            cost=get_amount(shipping_data.get('ShippingServiceCost')),
+        )
+
+
+class EbayOrder(object):
+    """
+    Order fetched from eBay.
+
+    The record is built once from the order data of eBay, so the amounts
+    and dates are parsed once and the lines are always a list.
+    """
+    __slots__ = (
+        'order_id', 'status', 'buyer_user_id', 'created_date',
+        'currency_code', 'total', 'lines', 'shipping', 'address',
+    )
+
+    def __init__(
+        self, order_id, buyer_user_id, created_date, currency_code, total,
+        lines, shipping, address, status=None
+    ):
+        self.order_id = order_id
+        self.status = status
+        self.buyer_user_id = buyer_user_id
+        self.created_date = created_date
+        self.currency_code = currency_code
+        self.total = total
+        self.lines = lines
+        self.shipping = shipping
+        self.address = address
+
+    def get_payload_hash(self):
+        """
+        Return a hash of the parts of the order imported in a sale, which
+        changes when any of them is changed on eBay
+        """
+        payload = [
+            self.status, self.buyer_user_id, self.currency_code,
+            dump_amount(self.total),
+            [
+                [
+                    line.item_id, line.variation_sku, line.sku, line.title,
+                    dump_amount(line.unit_price), dump_amount(line.quantity),
+                ] for line in self.lines
+            ],
+            [self.shipping.service, dump_amount(self.shipping.cost)],
+            [getattr(self.address, name) for name in EbayAddress.__slots__],
+        ]
+        return hashlib.sha256(json.dumps(payload)).hexdigest()
+
+    @classmethod
+    def from_ebay_data(cls, order_data):
+        """
+        Build the record from the order data of eBay
+
+        :param order_data: Order data from ebay
+                           Ref: http://developer.ebay.com/DevZone/XML/docs/\
+                                   Reference/eBay/GetOrders.html#Response
+        """
+        # The date is the start of the timestamp in both the ISO format of
+        # eBay and the format of the datetime nodes of ebaysdk
+        created_date = datetime.strptime(
+            order_data['CreatedTime'][:10], '%Y-%m-%d'
+        ).date()
+        return cls(
+            order_id=order_data['OrderID'],
+            status=order_data.get('OrderStatus'),
+            buyer_user_id=order_data['BuyerUserID'],
+            created_date=created_date,
+            currency_code=order_data['Total']['_currencyID'],
+            total=get_amount(order_data['Total']),
+            lines=[
+                EbayOrderLine.from_ebay_data(transaction)
+                for transaction in as_list(
+                    order_data['TransactionArray']['Transaction']
+                )
+            ],
+            shipping=EbayShipping.from_ebay_data(
+                order_data.get('ShippingServiceSelected')
+            ),
+            address=EbayAddress.from_ebay_data(order_data['ShippingAddress']),
+        )
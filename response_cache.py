@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+    response_cache
+
+    Persistent cache of the responses of eBay
+
+    :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
+    :license: GPLv3, see LICENSE for more details.
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+
+from trytond.config import config
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of variables in a query on SQLite
+SQLITE_MAX_VARIABLES = 500
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class ResponseCache(object):
+    """
+    Cache of eBay responses stored in a local SQLite database.
+
+    The cache is kept outside of the Tryton database, so the responses
+    survive the rollback of the transaction which fetched them and are
+    shared by all the processes of the host. Each entry expires after its
+    time to live and the least recently used entries of a scope are evicted
+    when the scope exceeds its size.
+
+    Entries are grouped by scope, e.g. a channel, by call name and by key,
+    e.g. the ID of the item. Hits and misses are counted per scope and call.
+
+    :param path: Path of the SQLite database
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        """
+        Connection of the current thread, as SQLite connections can not be
+        shared between threads
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = sqlite3.connect(
+                self.path, timeout=30
+            )
+            with connection:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS response ('
+                    'scope TEXT, call TEXT, key TEXT, response TEXT, '
+                    'expires REAL, last_used REAL, '
+                    'PRIMARY KEY (scope, call, key))'
+                )
+                connection.execute(
+                    'CREATE INDEX IF NOT EXISTS response_last_used '
+                    'ON response (scope, last_used)'
+                )
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS stats ('
+                    'scope TEXT, call TEXT, hits INTEGER, misses INTEGER, '
+                    'PRIMARY KEY (scope, call))'
+                )
+        return connection
+
+    def get_many(self, scope, call, keys):
+        """
+        Return the cached responses of a call for the given keys
+
+        :param scope: Scope of the entries
+        :param call: Name of the API call
+        :param keys: List of keys
+        :return: Dictionary of key to response, for the keys which have an
+                 entry which has not expired
+        """
+        keys = list(set(keys))
+        if not keys:
+            return {}
+
+        now = time.time()
+        responses = {}
+        with self.connection as connection:
+            for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+                sub_keys = keys[i:i + SQLITE_MAX_VARIABLES]
+                placeholders = ', '.join('?' * len(sub_keys))
+                for key, response in connection.execute(
+                    'SELECT key, response FROM response '
+                    'WHERE scope = ? AND call = ? AND expires > ? '
+                    'AND key IN (' + placeholders + ')',
+                    [scope, call, now] + sub_keys
+                ):
+                    responses[key] = json.loads(response)
+                if responses:
+                    connection.execute(
+                        'UPDATE response SET last_used = ? '
+                        'WHERE scope = ? AND call = ? '
+                        'AND key IN (' + placeholders + ')',
+                        [now, scope, call] + sub_keys
+                    )
+
+            connection.execute(
+                'INSERT OR IGNORE INTO stats VALUES (?, ?, 0, 0)',
+                (scope, call)
+            )
+            connection.execute(
+                'UPDATE stats SET hits = hits + ?, misses = misses + ? '
+                'WHERE scope = ? AND call = ?',
+                (len(responses), len(keys) - len(responses), scope, call)
+            )
+        return responses
+
+    def set_many(self, scope, call, responses, ttl, max_size=None):
+        """
+        Store responses of a call
+
+        :param scope: Scope of the entries
+        :param call: Name of the API call
+        :param responses: Dictionary of key to response
+        :param ttl: Number of seconds the responses are kept
+        :param max_size: Maximum number of entries of the scope
+        """
+        if not responses or not ttl:
+            return
+
+        now = time.time()
+        with self.connection as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?, ?)', [
+                    (scope, call, key, json.dumps(response), now + ttl, now)
+                    for key, response in responses.iteritems()
+                ]
+            )
+            connection.execute(
+                'DELETE FROM response WHERE scope = ? AND expires <= ?',
+                (scope, now)
+            )
+            if max_size:
+                connection.execute(
+                    'DELETE FROM response WHERE scope = ? AND rowid IN ('
+                    'SELECT rowid FROM response WHERE scope = ? '
+                    'ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                    (scope, scope, max_size)
+                )
+
+    def get_stats(self, scope):
+        """
+        Return the hits and misses of the scope
+
+        :return: Tuple of number of hits and number of misses
+        """
+        hits, misses = self.connection.execute(
+            'SELECT SUM(hits), SUM(misses) FROM stats WHERE scope = ?',
+            (scope,)
+        ).fetchone()
+        return hits or 0, misses or 0
+
+    def clear(self, scope):
+        """
+        Remove the entries and the counters of the scope
+        """
+        with self.connection as connection:
+            connection.execute(
+                'DELETE FROM response WHERE scope = ?', (scope,)
+            )
+            connection.execute('DELETE FROM stats WHERE scope = ?', (scope,))
+
+
+def get_response_cache():
+    """
+    Return the response cache of the process, or None if it can not be used.
+
+    The path of the cache is read from the `response_cache` option of the
+    `ebay` section of the configuration. It defaults to a file in the
+    database path.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            path = config.get('ebay', 'response_cache')
+            if not path:
+                path = os.path.join(
+                    config.get('database', 'path'),
+                    'ebay_response_cache.sqlite'
+                )
+            cache = ResponseCache(path)
+            try:
+                cache.connection
+            except sqlite3.Error:
+                logger.warning(
+                    'eBay response cache disabled, %s can not be opened', path,
+                    exc_info=True
+                )
+                cache = False
+            _cache = cache
+        return _cache or None
+
+
+def set_response_cache(cache):
+    """
+    Replace the response cache of the process
+
+    :param cache: Instance of ResponseCache, or None to use the configured
+                  one
+    """
+    global _cache
+    with _cache_lock:
+        _cache = cache
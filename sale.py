@@ -7,29 +7,42 @@
     :copyright: (c) 2013-2015 by Openlabs Technologies & Consulting (P) Limited
     :license: GPLv3, see LICENSE for more details.
 """
-import dateutil.parser
-from decimal import Decimal
-
 from trytond.model import fields
+from trytond.tools import grouped_slice
 from trytond.transaction import Transaction
 from trytond.pool import PoolMeta, Pool
 
+from .api import run_coroutines
+from .instrumentation import instrumented, stage
+from .records import EbayOrder
+from .utils import (
+    add_unique_index_where_set, get_duplicate_values, get_unique_index_name
+)
+
 
 __all__ = ['Sale']
 
 __metaclass__ = PoolMeta
 
+# Number of sales of eBay orders quoted and confirmed together
+EBAY_CONFIRM_GROUP_SIZE = 10
+
 
 class Sale:
     "Sale"
     __name__ = 'sale.sale'
 
     ebay_order_id = fields.Char(
-        'eBay Order ID',
+        'eBay Order ID', select=True,
         help="This is global and unique ID given to an order across whole ebay"
         " Warning: Editing this might result in duplicate orders on next"
         " import"
     )
+    ebay_payload_hash = fields.Char(
+        'eBay Payload Hash', readonly=True,
+        help="Hash of the order data of eBay the sale was last synchronised "
+        "with"
+    )
 
     @classmethod
     def __setup__(cls):
@@ -38,24 +51,83 @@ class Sale:
         """
         super(Sale, cls).__setup__()
         cls._error_messages.update({
-            "invalid_sale": 'Sale with eBay Order ID "%s" already exists',
+            "invalid_sale": 'Sale with eBay Order ID(s) "%s" already exists',
         })
+        cls._sql_error_messages.update({
+            get_unique_index_name(cls, 'ebay_order_id'):
+                'eBay Order ID must be unique for sale',
+        })
+
+    @classmethod
+    def __register__(cls, module_name):
+        super(Sale, cls).__register__(module_name)
+
+        # Migration: Add unique index on eBay order ID
+        add_unique_index_where_set(cls, module_name, 'ebay_order_id')
 
     @classmethod
     def validate(cls, sales):
         super(Sale, cls).validate(sales)
-        for sale in sales:
-            sale.check_ebay_order_id()
+        cls.check_ebay_order_ids(sales)
 
     def check_ebay_order_id(self):
         "Check the eBay Order ID for duplicates"
-        if self.ebay_order_id and self.search([
-            ('ebay_order_id', '=', self.ebay_order_id),
-            ('id', '!=', self.id),
+        self.check_ebay_order_ids([self])
+
+    @classmethod
+    def check_ebay_order_ids(cls, sales):
+        "Check the eBay Order IDs for duplicates with one grouped query"
+        duplicates = get_duplicate_values(
+            cls, 'ebay_order_id', [sale.ebay_order_id for sale in sales]
+        )
+        if duplicates:
+            cls.raise_user_error('invalid_sale', (', '.join(duplicates),))
+
+    @classmethod
+    def get_ebay_payload_hashes(cls, order_ids):
+        """
+        Return the payload hashes of the sales of the eBay orders among
+        `order_ids` which are already imported
+
+        :param order_ids: List of eBay order IDs
+        :return: Dictionary of eBay order ID to the payload hash of its sale
+        """
+        if not order_ids:
+            return {}
+        return dict(
+            (sale['ebay_order_id'], sale['ebay_payload_hash'])
+            for sale in cls.search_read([
+                ('ebay_order_id', 'in', list(set(order_ids))),
+            ], fields_names=['ebay_order_id', 'ebay_payload_hash'])
+        )
+
+    @classmethod
+    def set_ebay_payload_hashes(cls, payload_hashes):
+        """
+        Store the payload hashes of the sales of eBay orders, without
+        comparing the sales with the orders.
+
+        This sets the baseline of the sales imported before their payload
+        hash was stored, so they are only updated once their order changes
+        again.
+
+        :param payload_hashes: Dictionary of eBay order ID to payload hash
+        """
+        if not payload_hashes:
+            return
+        args = []
+        for sale in cls.search([
+            ('ebay_order_id', 'in', payload_hashes.keys()),
         ]):
-            self.raise_user_error('invalid_sale', (self.ebay_order_id,))
+            args.extend((
+                [sale],
+                {'ebay_payload_hash': payload_hashes[sale.ebay_order_id]},
+            ))
+        if args:
+            cls.write(*args)
 
     @classmethod
+    @instrumented('find_or_create_sale')
     def find_or_create_using_ebay_id(cls, order_id):
         """
         This method tries to find the sale with the order ID
@@ -76,19 +148,14 @@ class Sale:
             return sales[0]
 
         ebay_channel = SaleChannel(Transaction().context['current_channel'])
-        ebay_channel.validate_ebay_channel()
+        with ebay_channel.stream_ebay_orders({
+            'OrderIDArray': {
+                'OrderID': order_id
+            }, 'DetailLevel': 'ReturnAll'
+        }) as orders:
+            order_data, = orders
 
-        api = ebay_channel.get_ebay_trading_api()
-
-        order_data = api.execute(
-            'GetOrders', {
-                'OrderIDArray': {
-                    'OrderID': order_id
-                }, 'DetailLevel': 'ReturnAll'
-            }
-        ).dict()
-
-        return cls.create_using_ebay_data(order_data['OrderArray']['Order'])
+        return cls.create_using_ebay_data(order_data)
 
     @classmethod
     def create_using_ebay_data(cls, order_data):
@@ -100,32 +167,328 @@ class Sale:
                                    Reference/eBay/GetOrders.html#Response
         :return: Active record of record created
         """
-        Party = Pool().get('party.party')
-        Currency = Pool().get('currency.currency')
+        return cls.create_many_using_ebay_data([order_data])[0]
+
+    @classmethod
+    def create_many_using_ebay_data(cls, orders):
+        """
+        Create sales from a list of ebay orders.
+
+        All the sales are created together and the ones whose total
+        matches the total on eBay are quoted and confirmed together.
+
+        The order data is turned into `EbayOrder` records once, and the
+        records are given to the methods building the sales.
+
+        :param orders: List of order data from ebay
+        :return: List of active records of sales created, in the same order
+                 as `orders`
+        """
+        ChannelException = Pool().get('channel.exception')
         SaleChannel = Pool().get('sale.channel')
-        Uom = Pool().get('product.uom')
+        Party = Pool().get('party.party')
+
+        if not orders:
+            return []
+
+        ebay_channel = SaleChannel(Transaction().context['current_channel'])
+
+        orders = map(EbayOrder.from_ebay_data, orders)
+
+        # Resolve the buyers and the products of all the order lines at
+        # once, the calls to eBay for both are in flight together
+        parties, products = run_coroutines([
+            Party.resolve_ebay_ids([
+                cls.get_ebay_buyer(order) for order in orders
+            ]),
+            ebay_channel.resolve_ebay_products(
+                *cls.get_ebay_listing_keys(orders)
+            ),
+        ])
+
+        with stage('sale_values'):
+            # Add the phones and find the addresses of all the buyers at once
+            Party.add_phones_using_ebay_data([
+                (parties[order.buyer_user_id], order.address.phone)
+                for order in orders
+            ])
+            addresses = Party.find_or_create_addresses_using_ebay_addresses([
+                (parties[order.buyer_user_id], order.address)
+                for order in orders
+            ])
+
+            vlist = [
+                cls.get_sale_values_using_ebay_data(
+                    order, products, parties, address
+                ) for order, address in zip(orders, addresses)
+            ]
+        with stage('create_sales'):
+            sales = cls.create(vlist)
+
+        exceptions = []
+        sales_to_confirm = []
+        with stage('check_totals'):
+            for sale, order in zip(sales, orders):
+                # Create channel exception if order total does not match
+                if sale.total_amount != order.total:
+                    exceptions.append({
+                        'origin': '%s,%s' % (sale.__name__, sale.id),
+                        'log': 'Order total does not match.',
+                        'channel': sale.channel.id,
+                    })
+                else:
+                    sales_to_confirm.append(sale)
+
+            if exceptions:
+                ChannelException.create(exceptions)
+
+        # We import only completed orders, so we can confirm them all
+        cls.confirm_ebay_sales(sales_to_confirm)
+
+        # TODO: Process the order for invoice as the payment info is received
+
+        return sales
+
+    @classmethod
+    def update_many_using_ebay_data(cls, orders):
+        """
+        Update the sales of ebay orders which changed on eBay since they
+        were imported.
+
+        Only the parts of an order which changed are applied to its sale,
+        and only if the sale is still draft or quotation: the addresses are
+        replaced when the shipping address changed, the lines are replaced
+        when the lines or the shipping changed and the sale is cancelled
+        when the order is. The changes of the other sales are reported as
+        channel exceptions. The sales whose lines are replaced are quoted
+        and confirmed if their total now matches the total on eBay, like
+        in `create_many_using_ebay_data`.
+
+        The payload hash of the order is stored on every sale, so the order
+        is skipped by the next imports until it changes again.
+
+        :param orders: List of order data from ebay of orders which are
+                       already imported
+        :return: List of active records of sales updated, in the same order
+                 as `orders`
+        """
         ChannelException = Pool().get('channel.exception')
+        SaleChannel = Pool().get('sale.channel')
+        Listing = Pool().get('sale.channel.ebay.listing')
+
+        if not orders:
+            return []
 
         ebay_channel = SaleChannel(Transaction().context['current_channel'])
 
-        ebay_channel.validate_ebay_channel()
+        orders = map(EbayOrder.from_ebay_data, orders)
+        sales = {}
+        for order_ids in grouped_slice([order.order_id for order in orders]):
+            sales.update(
+                (sale.ebay_order_id, sale) for sale in cls.search([
+                    ('ebay_order_id', 'in', list(order_ids)),
+                ])
+            )
 
-        currency, = Currency.search([
-            ('code', '=', order_data['Total']['_currencyID'])
-        ], limit=1)
-
-        # Transaction is similar to order lines
-        # In the if..else below we fetch the first item from the array to
-        # get the item which will be used to establish a relationship
-        # between seller and buyer.
-        transaction = order_data['TransactionArray']['Transaction']
-        if isinstance(transaction, dict):
-            # If its a single line order, then the array will be dict
-            item = transaction
-        else:
-            # In case of multi line orders, the transaction array will be
-            # a list of dictionaries
-            item = transaction[0]
+        with stage('diff_sales'):
+            # The products of the listings already mapped, the products of
+            # the other listings are only resolved for the lines replaced
+            mapped_products = Listing.get_products(
+                ebay_channel, cls.get_ebay_listing_keys(orders)[0]
+            )
+            changes = dict(
+                (order.order_id, cls.get_ebay_order_changes(
+                    sales[order.order_id], order, mapped_products
+                )) for order in orders
+            )
+
+        # Only the products of the lines which are replaced are resolved
+        orders_to_relist = [
+            order for order in orders
+            if 'lines' in changes[order.order_id] and
+            sales[order.order_id].state in ('draft', 'quotation')
+        ]
+        products = {}
+        if orders_to_relist:
+            products, = run_coroutines([
+                ebay_channel.resolve_ebay_products(
+                    *cls.get_ebay_listing_keys(orders_to_relist)
+                )
+            ])
+
+        exceptions = []
+        sales_to_cancel = []
+        sales_to_check = []
+        sales_to_confirm = []
+        with stage('update_sales'):
+            for order in orders:
+                sale = sales[order.order_id]
+                order_changes = changes[order.order_id]
+                values = {'ebay_payload_hash': order.get_payload_hash()}
+
+                if order_changes and \
+                        sale.state not in ('draft', 'quotation'):
+                    exceptions.append({
+                        'origin': '%s,%s' % (sale.__name__, sale.id),
+                        'log': 'Order changed on eBay: %s' % (
+                            ', '.join(order_changes)
+                        ),
+                        'channel': sale.channel.id,
+                    })
+                    order_changes = []
+
+                if 'address' in order_changes:
+                    sale.party.add_phone_using_ebay_data(order.address.phone)
+                    address = sale.party. \
+                        find_or_create_address_using_ebay_address(
+                            order.address
+                        )
+                    values['invoice_address'] = address.id
+                    values['shipment_address'] = address.id
+                if 'lines' in order_changes:
+                    values['lines'] = [
+                        ('delete', [line.id for line in sale.lines])
+                    ] + cls.get_item_line_data_using_ebay_data(
+                        order, products
+                    ) + [cls.get_shipping_line_data_using_ebay_data(order)]
+                    sales_to_check.append((sale, order))
+                if 'status' in order_changes:
+                    sales_to_cancel.append(sale)
+
+                cls.write([sale], values)
+
+            for sale, order in sales_to_check:
+                if sale in sales_to_cancel:
+                    continue
+                # Read the total of the new lines
+                sale = cls(sale.id)
+                if sale.total_amount != order.total:
+                    exceptions.append({
+                        'origin': '%s,%s' % (sale.__name__, sale.id),
+                        'log': 'Order total does not match.',
+                        'channel': sale.channel.id,
+                    })
+                else:
+                    sales_to_confirm.append(sale)
+
+            if exceptions:
+                ChannelException.create(exceptions)
+            if sales_to_cancel:
+                cls.cancel(sales_to_cancel)
+
+        cls.confirm_ebay_sales(sales_to_confirm)
+
+        return [sales[order.order_id] for order in orders]
+
+    @classmethod
+    def confirm_ebay_sales(cls, sales):
+        """
+        Quote and confirm the sales of eBay orders.
+
+        The workflow of the sales reads and writes them one after the other,
+        and each read of a sale fetches the fields of all the sales it was
+        browsed with, again after every write. The sales are confirmed in
+        groups of `EBAY_CONFIRM_GROUP_SIZE` browsed on their own, so that
+        the queries per sale do not grow with the number of sales.
+
+        :param sales: List of active records of sales
+        """
+        if not sales:
+            return
+
+        with stage('confirm_sales'):
+            for sub_ids in grouped_slice(
+                [sale.id for sale in sales], EBAY_CONFIRM_GROUP_SIZE
+            ):
+                sub_sales = cls.browse(list(sub_ids))
+                cls.quote(sub_sales)
+                cls.confirm(sub_sales)
+
+    @classmethod
+    def get_ebay_order_changes(cls, sale, order, products=None):
+        """
+        Return the parts of an ebay order which differ from the sale
+        imported from it
+
+        :param sale: Active record of the sale of the order
+        :param order: EbayOrder record
+        :param products: Dictionary of listing key to product of the
+                         listings already mapped, see
+                         `sale.channel.ebay.listing.get_products`
+        :return: List of the parts changed among `status`, `address` and
+                 `lines`
+        """
+        changes = []
+
+        if order.status == 'Cancelled' and sale.state != 'cancel':
+            changes.append('status')
+
+        address = sale.party.get_address_from_ebay_address(order.address)
+        if sale.shipment_address.ebay_fingerprint != \
+                address.get_ebay_fingerprint():
+            changes.append('address')
+
+        # The item lines are compared by product, quantity and price, not
+        # by description: the lines of variations imported earlier have the
+        # title of the item. The products are only compared when all the
+        # listings of the order are mapped.
+        products = products or {}
+        compare_products = all(
+            line.listing_key in products for line in order.lines
+        )
+
+        def get_product_id(product):
+            return product.id if compare_products and product else None
+
+        shipping_values, = cls.get_shipping_line_data_using_ebay_data(
+            order
+        )[1]
+        order_lines = [(
+            get_product_id(products.get(line.listing_key)),
+            float(line.quantity), line.unit_price, None, None,
+        ) for line in order.lines] + [(
+            None, float(shipping_values['quantity']),
+            shipping_values['unit_price'], shipping_values['description'],
+            shipping_values['note'],
+        )]
+        sale_lines = [(
+            get_product_id(line.product), line.quantity, line.unit_price,
+            None if line.product else line.description, line.note or None,
+        ) for line in sale.lines]
+        if sorted(order_lines) != sorted(sale_lines):
+            changes.append('lines')
+
+        return changes
+
+    @classmethod
+    def get_ebay_listing_keys(cls, orders):
+        """
+        Return the listings of the lines of ebay orders as expected by
+        `sale.channel.resolve_ebay_products`
+
+        :param orders: List of EbayOrder records
+        :return: Tuple of list of listing keys and dictionary of listing key
+                 to SKU
+        """
+        keys, skus = [], {}
+        for order in orders:
+            for line in order.lines:
+                keys.append(line.listing_key)
+                if line.sku:
+                    skus[line.listing_key] = line.sku
+        return keys, skus
+
+    @classmethod
+    def get_ebay_buyer(cls, order):
+        """
+        Return the buyer of an ebay order as a tuple of ebay user ID and
+        item ID, as expected by `party.party.find_or_create_using_ebay_id`
+
+        :param order: EbayOrder record
+        """
+        # We fetch the first line of the order to get the item which will
+        # be used to establish a relationship between seller and buyer.
+        line = order.lines[0]
 
         # Get an item ID so that ebay can establish a relationship between
         # seller and buyer.
@@ -134,130 +497,127 @@ class Sale:
         # a seller-buyer relationship between both via some item.
         # If this item is not passed, then ebay would not return important
         # informations like eMail etc.
-        item_id = item['Item']['ItemID']
-        party = Party.find_or_create_using_ebay_id(
-            order_data['BuyerUserID'], item_id=item_id
-        )
+        return order.buyer_user_id, line.item_id
 
-        party.add_phone_using_ebay_data(
-            order_data['ShippingAddress']['Phone']
-        )
+    @classmethod
+    def get_sale_values_using_ebay_data(
+        cls, order, products=None, parties=None, address=None
+    ):
+        """
+        Return the values to create a sale from ebay data
+
+        :param order: EbayOrder record
+        :param products: Dictionary of listing key to product, as returned
+                         by `sale.channel.resolve_ebay_products`
+        :param parties: Dictionary of eBay user ID to party, as returned by
+                        `party.party.find_or_create_many_using_ebay_ids`
+        :param address: Active record of the address of the order, as
+                        returned by `party.party.\
+                        find_or_create_addresses_using_ebay_addresses`. If
+                        not given the phone and the address of the order
+                        are added to the party
+        :return: Dictionary of values for the sale
+        """
+        Party = Pool().get('party.party')
+        Currency = Pool().get('currency.currency')
+        SaleChannel = Pool().get('sale.channel')
+
+        ebay_channel = SaleChannel(Transaction().context['current_channel'])
+
+        ebay_channel.validate_ebay_channel()
 
-        party_invoice_address = party_shipping_address = \
-            party.find_or_create_address_using_ebay_data(
-                order_data['ShippingAddress']
+        currency = Currency.get_by_code(order.currency_code)
+
+        if parties is None:
+            ebay_user_id, item_id = cls.get_ebay_buyer(order)
+            party = Party.find_or_create_using_ebay_id(
+                ebay_user_id, item_id=item_id
+            )
+        else:
+            party = parties[order.buyer_user_id]
+
+        if address is None:
+            party.add_phone_using_ebay_data(order.address.phone)
+            address = party.find_or_create_address_using_ebay_address(
+                order.address
             )
-        unit, = Uom.search([('name', '=', 'Unit')])
+        party_invoice_address = party_shipping_address = address
 
         sale_data = {
-            'reference': order_data['OrderID'],
-            'sale_date': dateutil.parser.parse(
-                order_data['CreatedTime'].split()[0]
-            ).date(),
+            'reference': order.order_id,
+            'sale_date': order.created_date,
             'party': party.id,
             'currency': currency.id,
             'invoice_address': party_invoice_address.id,
             'shipment_address': party_shipping_address.id,
-            'ebay_order_id': order_data['OrderID'],
-            'lines': cls.get_item_line_data_using_ebay_data(order_data),
+            'ebay_order_id': order.order_id,
+            'ebay_payload_hash': order.get_payload_hash(),
+            'lines': cls.get_item_line_data_using_ebay_data(order, products),
             'channel': ebay_channel.id,
         }
 
         sale_data['lines'].append(
-            cls.get_shipping_line_data_using_ebay_data(order_data)
+            cls.get_shipping_line_data_using_ebay_data(order)
         )
 
         # TODO: Handle Discounts
         # TODO: Handle Taxes
 
-        sale, = cls.create([sale_data])
-
-        # Create channel exception if order total does not match
-        if sale.total_amount != Decimal(order_data['Total']['value']):
-            ChannelException.create([{
-                'origin': '%s,%s' % (sale.__name__, sale.id),
-                'log': 'Order total does not match.',
-                'channel': sale.channel.id,
-            }])
-
-            return sale
-
-        # We import only completed orders, so we can confirm them all
-        cls.quote([sale])
-        cls.confirm([sale])
-
-        # TODO: Process the order for invoice as the payment info is received
-
-        return sale
+        return sale_data
 
     @classmethod
-    def get_item_line_data_using_ebay_data(cls, order_data):
+    def get_item_line_data_using_ebay_data(cls, order, products=None):
         """
         Make data for an item line from the ebay data.
 
-        :param order_data: Order Data from ebay
+        :param order: EbayOrder record
+        :param products: Dictionary of listing key to product, see
+                         `get_ebay_listing_keys`. If not given the products
+                         are imported for this order
         :return: List of data of order lines in required format
         """
         Uom = Pool().get('product.uom')
         SaleChannel = Pool().get('sale.channel')
 
-        unit, = Uom.search([('name', '=', 'Unit')])
+        unit = Uom.get_by_name('Unit')
 
         ebay_channel = SaleChannel(Transaction().context['current_channel'])
 
         ebay_channel.validate_ebay_channel()
 
+        if products is None:
+            products, = run_coroutines([ebay_channel.resolve_ebay_products(
+                *cls.get_ebay_listing_keys([order])
+            )])
+
         line_data = []
-        transaction = order_data['TransactionArray']['Transaction']
-        if isinstance(transaction, dict):
-            # If its a single line order, then the transaction will be dict
-            items = [transaction]
-        else:
-            # In case of multi line orders, the transaction will be
-            # a list of dictionaries
-            items = transaction
-        for item in items:
+        for line in order.lines:
             values = {
-                'description': item['Item']['Title'],
-                'unit_price': Decimal(
-                    item['TransactionPrice']['value']
-                ),
+                'description': line.title,
+                'unit_price': line.unit_price,
                 'unit': unit.id,
-                'quantity': Decimal(
-                    item['QuantityPurchased']
-                ),
-                'product': ebay_channel.import_product(
-                    item['Item']['ItemID'],
-                ).id
+                'quantity': line.quantity,
+                'product': products[line.listing_key].id,
             }
             line_data.append(('create', [values]))
 
         return line_data
 
     @classmethod
-    def get_shipping_line_data_using_ebay_data(cls, order_data):
+    def get_shipping_line_data_using_ebay_data(cls, order):
         """
         Create a shipping line for the given sale using ebay data
 
-        :param order_data: Order Data from ebay
+        :param order: EbayOrder record
         """
         Uom = Pool().get('product.uom')
 
-        unit, = Uom.search([('name', '=', 'Unit')])
+        unit = Uom.get_by_name('Unit')
 
         return ('create', [{
             'description': 'eBay Shipping and Handling',
-            'unit_price': Decimal(
-                order_data['ShippingServiceSelected'].get(
-                    'ShippingServiceCost', 0.00
-                ) and order_data[
-                    'ShippingServiceSelected'
-                ]['ShippingServiceCost']['value']
-            ),
+            'unit_price': order.shipping.cost,
             'unit': unit.id,
-            'note': order_data['ShippingServiceSelected'].get(
-                'ShippingService', None
-            ) and order_data[
-                'ShippingServiceSelected']['ShippingService'],
+            'note': order.shipping.service,
             'quantity': 1,
         }])
@@ -81,6 +81,8 @@ minor_version = int(minor_version)
 
 requires = [
     'ebaysdk>=2.1',
+    'futures',
+    'lxml',
 ]
 MODULE2PREFIX = {
     'sale_channel': 'fio',
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+    benchmark
+
+    Throughput benchmark of the import of orders from eBay.
+
+    Synthetic orders, buyers and items are generated from the shapes of the
+    fixtures in `tests/json` and served by a stand-in of the trading API, so
+    no call is made to eBay. Run it like the tests, e.g.:
+
+        python tests/benchmark.py --orders 200 --lines 2 --buyers 50 \\
+            --items 20
+
+    :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
+    :license: GPLv3, see LICENSE for more details.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import resource
+import argparse
+import threading
+from io import BytesIO
+from collections import Counter
+from contextlib import contextmanager
+DIR = os.path.abspath(os.path.normpath(
+    os.path.join(
+        __file__,
+        '..', '..', '..', '..', '..', 'trytond'
+    )
+))
+if os.path.isdir(DIR):
+    sys.path.insert(0, os.path.dirname(DIR))
+
+import trytond.tests.test_tryton
+from trytond.tests.test_tryton import POOL, USER, DB_NAME, CONTEXT
+from trytond.transaction import Transaction
+from trytond.modules.ebay.response_cache import ResponseCache, \
+    set_response_cache
+from test_base import TestBase, FakeResponse, load_json, dict_to_xml
+
+
+class PayloadGenerator(object):
+    """
+    Generate eBay responses for `orders` orders of `lines` lines each,
+    bought by `buyers` distinct buyers among `items` distinct items.
+
+    The payloads are copies of the fixtures with new IDs, and the same
+    arguments always generate the same payloads.
+    """
+
+    def __init__(self, orders, lines, buyers, items, seed=0):
+        self.orders = orders
+        self.lines = lines
+        self.buyers = buyers
+        self.items = items
+        self.random = random.Random(seed)
+
+        order_data = load_json('orders', '283054010')['OrderArray']['Order']
+        self.order_template = order_data[0]
+        self.line_template = self.order_template[
+            'TransactionArray']['Transaction'][0]
+        self.user_template = load_json('users', 'testuser_ritu123')
+        self.item_template = load_json('products', '110162956809')
+
+        self.order_list = [self.make_order(i) for i in range(orders)]
+
+    @staticmethod
+    def get_user_id(index):
+        return 'bench_buyer_%d' % index
+
+    @staticmethod
+    def get_item_id(index):
+        return str(900000000000 + index)
+
+    def get_price(self, item_id):
+        return '%d.0' % (int(item_id) % 50 + 1)
+
+    def make_order(self, index):
+        order = copy.deepcopy(self.order_template)
+        order['OrderID'] = 'BENCH-%d' % index
+        order['BuyerUserID'] = self.get_user_id(
+            self.random.randrange(self.buyers)
+        )
+
+        transactions = []
+        total = 0
+        for line in range(self.lines):
+            item_id = self.get_item_id(self.random.randrange(self.items))
+            transaction = copy.deepcopy(self.line_template)
+            transaction['Item']['ItemID'] = item_id
+            transaction['Item']['Title'] = 'Item %s' % item_id
+            transaction['TransactionPrice']['value'] = \
+                self.get_price(item_id)
+            transaction['QuantityPurchased'] = '1'
+            transactions.append(transaction)
+            total += float(self.get_price(item_id))
+
+        order['TransactionArray']['Transaction'] = transactions
+        order['ShippingServiceSelected']['ShippingServiceCost']['value'] = \
+            '0.0'
+        order['Total']['value'] = '%.1f' % total
+        return order
+
+    def get_user(self, user_id):
+        user = copy.deepcopy(self.user_template)
+        user['User']['UserID'] = user_id
+        return user
+
+    def get_item(self, item_id):
+        item = copy.deepcopy(self.item_template)
+        item['Item']['ItemID'] = item_id
+        item['Item']['Title'] = 'Item %s' % item_id
+        item['Item']['SKU'] = 'BENCH-%s' % item_id
+        item['Item']['StartPrice']['value'] = self.get_price(item_id)
+        item['Item']['BuyItNowPrice']['value'] = self.get_price(item_id)
+        return item
+
+
+class StandInApi(object):
+    """
+    Stand-in of the trading API serving the payloads of a generator.
+
+    The calls are counted by call name. The stand-in is shared by all the
+    connections, so it is safe to call from several threads.
+    """
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def execute(self, verb, data=None):
+        with self.lock:
+            self.calls[verb] += 1
+        return FakeResponse(getattr(self, 'get_%s' % verb)(data or {}))
+
+    @contextmanager
+    def stream(self, verb, data=None):
+        with self.lock:
+            self.calls[verb] += 1
+        response = getattr(self, 'get_%s' % verb)(data or {})
+        yield BytesIO(dict_to_xml(verb, response))
+
+    def get_GetOrders(self, data):
+        orders = self.generator.order_list
+        per_page = data['Pagination']['EntriesPerPage']
+        page = data['Pagination']['PageNumber']
+        page_orders = orders[(page - 1) * per_page:page * per_page]
+        response = {
+            'HasMoreOrders': 'true' if page * per_page < len(orders)
+            else 'false',
+            'PaginationResult': {
+                'TotalNumberOfEntries': str(len(orders)),
+            },
+        }
+        if page_orders:
+            response['OrderArray'] = {'Order': page_orders}
+        return response
+
+    def get_GetUser(self, data):
+        return self.generator.get_user(data['UserID'])
+
+    def get_GetItem(self, data):
+        return self.generator.get_item(data['ItemID'])
+
+
+class Benchmark(TestBase):
+    """
+    Benchmark of the order import, using the setup of the tests
+    """
+
+    def runTest(self):
+        pass
+
+    def run_benchmark(self, generator, mode='import_orders', cache=False):
+        """
+        Import the orders of the generator and return the measures
+
+        :param mode: `import_orders` to import the orders page by page,
+                     `import_order` to import them one by one
+        :param cache: Use an empty response cache
+        """
+        Sale = POOL.get('sale.sale')
+
+        self.setUp()
+        set_response_cache(ResponseCache(':memory:') if cache else False)
+
+        with Transaction().start(DB_NAME, USER, CONTEXT) as transaction:
+            self.setup_defaults()
+            self.SaleChannel.write([self.ebay_channel], {
+                'ebay_daily_call_limit': None,
+            })
+            channel = self.SaleChannel(self.ebay_channel.id)
+
+            api = StandInApi(generator)
+
+            # Count the queries of the import
+            queries = [0]
+            cursor = transaction.cursor
+            execute = cursor.execute
+
+            def count_execute(*args, **kwargs):
+                queries[0] += 1
+                return execute(*args, **kwargs)
+
+            cursor.execute = count_execute
+            start = time.time()
+            try:
+                with self.fake_ebay_api(api=api), Transaction().set_context(
+                    ebay_order_import_commit=False,
+                    current_channel=channel.id,
+                    company=self.company.id,
+                ):
+                    if mode == 'import_orders':
+                        channel.import_orders()
+                    else:
+                        for order_data in generator.order_list:
+                            channel.import_order(order_data)
+                elapsed = time.time() - start
+            finally:
+                cursor.execute = execute
+
+            imported = Sale.search([
+                ('ebay_order_id', 'like', 'BENCH-%'),
+            ], count=True)
+            stages = {}
+            for run in self.SaleChannel(channel.id).ebay_import_runs:
+                for stage in run.stages:
+                    stages[stage.name] = {
+                        'count': stage.count,
+                        'seconds': round(stage.seconds, 3),
+                        'queries': stage.queries,
+                        'api_calls': stage.api_calls,
+                    }
+            transaction.cursor.rollback()
+
+        orders = len(generator.order_list)
+        return {
+            'mode': mode,
+            'orders': orders,
+            'imported': imported,
+            'seconds': round(elapsed, 3),
+            'orders_per_second': round(orders / elapsed, 2),
+            'queries_per_order': round(queries[0] / float(orders), 2),
+            'api_calls_per_order': round(
+                sum(api.calls.values()) / float(orders), 3
+            ),
+            'api_calls': dict(api.calls),
+            'stages': stages,
+            'peak_rss_mb': round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1
+            ),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the import of orders from eBay'
+    )
+    parser.add_argument('--orders', type=int, default=100, help='N orders')
+    parser.add_argument(
+        '--lines', type=int, default=2, help='M lines per order'
+    )
+    parser.add_argument(
+        '--buyers', type=int, default=20, help='K distinct buyers'
+    )
+    parser.add_argument(
+        '--items', type=int, default=10, help='P distinct items'
+    )
+    parser.add_argument(
+        '--mode', choices=['import_orders', 'import_order'],
+        default='import_orders',
+    )
+    parser.add_argument(
+        '--cache', action='store_true', help='Use the response cache'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--json', action='store_true', help='Print the measures as JSON'
+    )
+    args = parser.parse_args()
+
+    generator = PayloadGenerator(
+        args.orders, args.lines, args.buyers, args.items, seed=args.seed
+    )
+    result = Benchmark().run_benchmark(
+        generator, mode=args.mode, cache=args.cache
+    )
+
+    if args.json:
+        print json.dumps(result, sort_keys=True)
+    else:
+        for key in sorted(result):
+            print '%-20s %s' % (key, result[key])
+
+
+if __name__ == '__main__':
+    trytond.tests.test_tryton.install_module('ebay')
+    main()
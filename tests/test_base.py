@@ -8,13 +8,19 @@
 import os
 import json
 import unittest
+from io import BytesIO
+from contextlib import contextmanager
 from decimal import Decimal
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
+from lxml import etree
 
 import trytond.tests.test_tryton
 from trytond.tests.test_tryton import POOL, USER
 from trytond.transaction import Transaction
+from trytond.modules.ebay.api import clear_call_executors
+from trytond.modules.ebay.response_cache import ResponseCache, \
+    set_response_cache
 
 
 ROOT_JSON_FOLDER = os.path.join(
@@ -47,6 +53,67 @@ def load_json(resource, filename):
     return json.loads(open(file_path).read())
 
 
+def dict_to_xml(verb, data):
+    """
+    Return the raw XML response of eBay for a response dictionary, in the
+    format of ebaysdk `Response.dict()`
+    """
+    def fill(element, value):
+        if isinstance(value, dict):
+            for key, child in sorted(value.items()):
+                if key == 'value':
+                    element.text = child
+                elif key.startswith('_'):
+                    element.set(key[1:], child)
+                else:
+                    for item in (child if isinstance(child, list) else [child]):
+                        fill(etree.SubElement(element, key), item)
+        elif value is not None:
+            element.text = value
+
+    namespace = 'urn:ebay:apis:eBLBaseComponents'
+    root = etree.Element(
+        '{%s}%sResponse' % (namespace, verb), nsmap={None: namespace}
+    )
+    fill(root, data)
+    return etree.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+
+class FakeResponse(object):
+    """
+    Response returned by the fake trading api
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def dict(self):
+        return self.data
+
+
+class FakeTradingApi(object):
+    """
+    Stand-in for the eBay trading api which serves canned responses instead
+    of calling eBay.
+
+    :param responses: Dictionary of API call name to a list of responses,
+                      which are returned in order
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def execute(self, verb, data=None):
+        self.calls.append((verb, data))
+        return FakeResponse(self.responses[verb].pop(0))
+
+    @contextmanager
+    def stream(self, verb, data=None):
+        self.calls.append((verb, data))
+        yield BytesIO(dict_to_xml(verb, self.responses[verb].pop(0)))
+
+
 class TestBase(unittest.TestCase):
     """
     Setup basic defaults
@@ -59,6 +126,39 @@ class TestBase(unittest.TestCase):
         """
         trytond.tests.test_tryton.install_module('ebay')
 
+        # Connections and responses of the previous tests must not be reused
+        clear_call_executors()
+        set_response_cache(ResponseCache(':memory:'))
+
+    @contextmanager
+    def fake_ebay_api(self, responses=None, api=None, factory=None):
+        """
+        Serve the calls of the channels to eBay from a fake trading api
+        while the block runs.
+
+        :param responses: Responses of the FakeTradingApi used, see
+                          `FakeTradingApi`
+        :param api: Api used instead of a FakeTradingApi of `responses`
+        :param factory: Callable returning a new api for each connection,
+                        used instead of a single api
+        :return: The api used, None if `factory` is given
+        """
+        SaleChannel = POOL.get('sale.channel')
+
+        if factory is None:
+            if api is None:
+                api = FakeTradingApi(responses or {})
+
+            def factory():
+                return api
+
+        get_api_factory = SaleChannel.get_ebay_api_factory
+        SaleChannel.get_ebay_api_factory = lambda channel: factory
+        try:
+            yield api
+        finally:
+            SaleChannel.get_ebay_api_factory = get_api_factory
+
     def setup_defaults(self):
         """
         Setup default data
@@ -5,13 +5,34 @@
     :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
     :license: GPLv3, see LICENSE for more details.
 """
+import os
+import json
+import time
+import shutil
+import socket
+import threading
+import tempfile
 import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
 
 import trytond.tests.test_tryton
-from trytond.tests.test_tryton import USER, DB_NAME, CONTEXT
-from test_base import TestBase
+from trytond.tests.test_tryton import POOL, USER, DB_NAME, CONTEXT
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from ebaysdk.exception import ConnectionError
+from ebaysdk.response import Response, ResponseDataObject
+from test_base import TestBase, FakeTradingApi, FakeResponse, load_json, \
+    dict_to_xml
 from trytond.transaction import Transaction
 from trytond.exceptions import UserError
+from trytond.modules.ebay.api import TokenBucket, TradingConnection, \
+    Return, gather, run_coroutines
+from trytond.modules.ebay.cassette import Cassette, set_cassette
+from trytond.modules.ebay.response_cache import ResponseCache
+from trytond.modules.ebay.order_stream import OrderStream
+from trytond.modules.ebay.instrumentation import ImportRecorder, \
+    count_api_call, instrumented_coroutine
 
 
 class TestChannel(TestBase):
@@ -70,7 +91,7 @@ class TestChannel(TestBase):
             }])
 
             # eBay channel with credentials
-            self.SaleChannel.create([{
+            channel, = self.SaleChannel.create([{
                 'name': 'eBay Account',
                 'warehouse': warehouse.id,
                 'company': self.company.id,
@@ -108,6 +129,1020 @@ class TestChannel(TestBase):
                     'default_uom': self.uom.id,
                 }])
 
+            # Tokens are compared using their hash
+            self.assertEqual(
+                channel.ebay_token_hash,
+                self.SaleChannel.get_ebay_token_hash('a long test token')
+            )
+            self.SaleChannel.write([channel], {
+                'ebay_token': 'another test token',
+            })
+            self.assertEqual(
+                channel.ebay_token_hash,
+                self.SaleChannel.get_ebay_token_hash('another test token')
+            )
+
+    def test_0020_import_orders_paginated(self):
+        """
+        Tests if orders are imported from all the pages returned by eBay
+        """
+        Sale = POOL.get('sale.sale')
+        Party = POOL.get('party.party')
+        Product = POOL.get('product.product')
+        ImportRun = POOL.get('sale.channel.ebay.import_run')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            with Transaction().set_context({
+                'current_channel': self.ebay_channel.id,
+                'company': self.company
+            }):
+                Party.create_using_ebay_data(
+                    load_json('users', 'testuser_ritu123')
+                )
+                Product.create_using_ebay_data(
+                    load_json('products', '110162956809')
+                )
+                Product.create_using_ebay_data(
+                    load_json('products', '110162957156')
+                )
+
+            order1 = load_json('orders', '283054010')['OrderArray']['Order'][0]
+            order2 = load_json('orders', '283054010')['OrderArray']['Order'][0]
+            order2['OrderID'] = '283054011'
+
+            api = FakeTradingApi({
+                'GetOrders': [{
+                    'OrderArray': {'Order': order1},
+                    'HasMoreOrders': 'true',
+                }, {
+                    'OrderArray': {'Order': [order1, order2]},
+                    'HasMoreOrders': 'false',
+                }],
+            })
+            self.SaleChannel.write([self.ebay_channel], {
+                'ebay_orders_per_page': 1,
+            })
+            with self.fake_ebay_api(api=api):
+                with Transaction().set_context(ebay_order_import_commit=False):
+                    summary = self.ebay_channel.import_orders()
+
+            self.assertEqual(
+                summary['created'], [order1['OrderID'], order2['OrderID']]
+            )
+            self.assertEqual(summary['skipped'], [order1['OrderID']])
+            self.assertEqual(Sale.search([], count=True), 2)
+
+            self.assertEqual(len(api.calls), 2)
+            self.assertEqual(
+                [data['Pagination'] for _, data in api.calls], [
+                    {'EntriesPerPage': 1, 'PageNumber': 1},
+                    {'EntriesPerPage': 1, 'PageNumber': 2},
+                ]
+            )
+
+            # The measures of the import are stored
+            run, = self.ebay_channel.ebay_import_runs
+            self.assertEqual(run.orders_created, 2)
+            self.assertEqual(run.orders_skipped, 1)
+            self.assertEqual(run.api_calls, 2)
+            self.assertTrue(run.queries > 0)
+            stages = dict((stage.name, stage) for stage in run.stages)
+            self.assertEqual(stages['fetch_orders'].count, 2)
+            self.assertEqual(stages['fetch_orders'].api_calls, 2)
+            self.assertEqual(stages['import_page'].count, 2)
+            self.assertEqual(stages['match_address'].count, 2)
+            self.assertEqual(stages['resolve_parties'].count, 2)
+            self.assertEqual(stages['resolve_products'].count, 2)
+            self.assertTrue(stages['resolve_products'].queries > 0)
+            self.assertEqual(stages['confirm_sales'].count, 2)
+
+            # Only the most recent runs are kept
+            ImportRun.create([{
+                'channel': self.ebay_channel.id,
+                'start_time': run.start_time - timedelta(minutes=5),
+            }])
+            ImportRun.clean(self.ebay_channel, keep=1)
+            self.assertEqual(
+                ImportRun.search([('channel', '=', self.ebay_channel.id)]),
+                [run]
+            )
+
+    def test_0022_sync_catalog(self):
+        """
+        Tests if the products of the listings of the seller are created
+        ahead of the orders, page by page
+        """
+        Sale = POOL.get('sale.sale')
+        Party = POOL.get('party.party')
+        Product = POOL.get('product.product')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            with Transaction().set_context({
+                'current_channel': self.ebay_channel.id,
+                'company': self.company
+            }):
+                Party.create_using_ebay_data(
+                    load_json('users', 'testuser_ritu123')
+                )
+                product1 = Product.create_using_ebay_data(
+                    load_json('products', '110162956809')
+                )
+            item2 = load_json('products', '110162957156')['Item']
+
+            api = FakeTradingApi({
+                'GetSellerList': [{
+                    'ItemArray': {'Item': [
+                        load_json('products', '110162956809')['Item'], item2,
+                    ]},
+                    'HasMoreItems': 'true',
+                }, {
+                    'ItemArray': {'Item': item2},
+                    'HasMoreItems': 'false',
+                }, {
+                    'HasMoreItems': 'false',
+                }],
+                'GetOrders': [{
+                    'OrderArray': {'Order': load_json(
+                        'orders', '283054010'
+                    )['OrderArray']['Order'][0]},
+                    'HasMoreOrders': 'false',
+                }],
+            })
+            with self.fake_ebay_api(api=api), \
+                    Transaction().set_context(ebay_order_import_commit=False):
+                products = self.ebay_channel.import_products()
+
+                # The known product is mapped and the new one created once
+                self.assertEqual(len(products), 3)
+                self.assertEqual(products[0], product1)
+                self.assertEqual(products[1], products[2])
+                self.assertEqual(products[1].ebay_item_id, item2['ItemID'])
+                self.assertEqual(Product.search([], count=True), 2)
+                self.assertEqual(
+                    [data['Pagination']['PageNumber']
+                     for _, data in api.calls], [1, 2, 1]
+                )
+                self.assertTrue(self.ebay_channel.ebay_last_catalog_sync)
+
+                # The listings ending in the next 119 days and the ones
+                # which ended in the last 30 days are fetched, in windows
+                # of at most 119 days
+                windows = [
+                    (data['EndTimeFrom'], data['EndTimeTo'])
+                    for _, data in api.calls
+                ]
+                self.assertEqual(windows[0], windows[1])
+                self.assertEqual(
+                    windows[0][1] - windows[0][0], timedelta(days=119)
+                )
+                self.assertEqual(windows[2][0], windows[0][1])
+                self.assertEqual(
+                    windows[2][1] - windows[0][0], timedelta(days=149)
+                )
+
+                # A channel which fails does not stop the cron
+                self.SaleChannel.sync_ebay_catalogs()
+                self.assertFalse(
+                    self.SaleChannel(
+                        self.ebay_channel.id
+                    ).ebay_import_lease_until
+                )
+
+                # The catalog is not synced while the orders are imported
+                self.assertTrue(self.ebay_channel.acquire_ebay_import_lease())
+                self.assertRaises(UserError, self.ebay_channel.import_products)
+                self.SaleChannel.sync_ebay_catalogs()
+                self.ebay_channel.release_ebay_import_lease()
+
+                # Orders of the listings do not fetch the items
+                self.ebay_channel.import_orders()
+
+            self.assertEqual(Sale.search([], count=True), 1)
+            self.assertEqual(
+                [verb for verb, _ in api.calls],
+                ['GetSellerList'] * 4 + ['GetOrders']
+            )
+
+    def test_0023_resolve_listings(self):
+        """
+        Tests if the products of listings and variations are found by SKU
+        and mapped to the listings
+        """
+        Product = POOL.get('product.product')
+        Listing = POOL.get('sale.channel.ebay.listing')
+
+        item = load_json('products', '110162956809')
+        item['Item']['SKU'] = 'IPHONE-1'
+        variations_item = load_json('products', '110162957156')
+        variations_item['Item']['Variations'] = {'Variation': [{
+            'SKU': 'IPHONE-RED',
+            'StartPrice': {'_currencyID': 'USD', 'value': '3.0'},
+        }, {
+            'SKU': 'IPHONE-BLUE',
+            'StartPrice': {'_currencyID': 'USD', 'value': '4.0'},
+        }]}
+        items = {
+            item['Item']['ItemID']: item,
+            variations_item['Item']['ItemID']: variations_item,
+        }
+
+        class ItemApi(FakeTradingApi):
+            def execute(self, verb, data=None):
+                self.calls.append((verb, data))
+                return FakeResponse(items[data['ItemID']])
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            api = ItemApi({})
+
+            def resolve(keys, skus=None):
+                return run_coroutines([
+                    self.ebay_channel.resolve_ebay_products(keys, skus)
+                ])[0]
+
+            with self.fake_ebay_api(api=api):
+                with Transaction().set_context({
+                    'current_channel': self.ebay_channel.id,
+                    'company': self.company
+                }):
+                    item_key = ('110162956809', None)
+                    red_key = ('110162957156', 'IPHONE-RED')
+                    blue_key = ('110162957156', 'IPHONE-BLUE')
+                    products = resolve([item_key, red_key, blue_key])
+                    self.assertEqual(len(api.calls), 2)
+
+                    self.assertEqual(products[item_key].code, 'IPHONE-1')
+                    self.assertEqual(products[red_key].code, 'IPHONE-RED')
+                    self.assertEqual(products[red_key].list_price, 3)
+                    self.assertEqual(products[blue_key].list_price, 4)
+                    self.assertEqual(
+                        products[red_key].template,
+                        products[blue_key].template
+                    )
+
+                    # A relisted item is found by its SKU
+                    relist_key = ('110162999999', None)
+                    self.assertEqual(
+                        resolve([relist_key], {relist_key: 'IPHONE-1'}),
+                        {relist_key: products[item_key]}
+                    )
+
+                    # The listings resolved are mapped
+                    self.assertEqual(
+                        resolve([relist_key, red_key]), {
+                            relist_key: products[item_key],
+                            red_key: products[red_key],
+                        }
+                    )
+                    self.assertEqual(len(api.calls), 2)
+                    self.assertEqual(Listing.search([], count=True), 4)
+                    self.assertEqual(Product.search([], count=True), 3)
+
+                    # The oldest product of a duplicated code is used
+                    Product.create([{
+                        'template': products[red_key].template.id,
+                        'code': 'IPHONE-RED',
+                    }])
+                    self.assertEqual(
+                        Product.get_by_ebay_skus(['IPHONE-RED']),
+                        {'IPHONE-RED': products[red_key]}
+                    )
+
+    def test_0024_sync_catalog_windows(self):
+        """
+        Tests if a catalog range longer than GetSellerList accepts is
+        fetched in consecutive windows each within the limit of eBay
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            self.SaleChannel.write([self.ebay_channel], {
+                'ebay_catalog_ended_days': 300,
+            })
+            api = FakeTradingApi({
+                'GetSellerList': [{'HasMoreItems': 'false'}] * 4,
+            })
+            with self.fake_ebay_api(api=api), \
+                    Transaction().set_context(ebay_order_import_commit=False):
+                self.assertEqual(self.ebay_channel.import_products(), [])
+
+            windows = [
+                (data['EndTimeFrom'], data['EndTimeTo'])
+                for _, data in api.calls
+            ]
+            self.assertEqual(len(windows), 4)
+            for end_time_from, end_time_to in windows:
+                self.assertTrue(
+                    end_time_to - end_time_from < timedelta(days=120)
+                )
+            for (_, end_time_to), (end_time_from, _) in zip(
+                windows, windows[1:]
+            ):
+                self.assertEqual(end_time_from, end_time_to)
+            self.assertEqual(
+                windows[-1][1] - windows[0][0], timedelta(days=300 + 119)
+            )
+
+    def test_0025_import_orders_resume(self):
+        """
+        Tests if an order import which fails resumes from the page after the
+        last imported one, in the same window
+        """
+        Sale = POOL.get('sale.sale')
+        Party = POOL.get('party.party')
+        Product = POOL.get('product.product')
+        Checkpoint = POOL.get('sale.channel.ebay.checkpoint')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            with Transaction().set_context({
+                'current_channel': self.ebay_channel.id,
+                'company': self.company
+            }):
+                Party.create_using_ebay_data(
+                    load_json('users', 'testuser_ritu123')
+                )
+                Product.create_using_ebay_data(
+                    load_json('products', '110162956809')
+                )
+                Product.create_using_ebay_data(
+                    load_json('products', '110162957156')
+                )
+
+            order1 = load_json('orders', '283054010')['OrderArray']['Order'][0]
+            order2 = load_json('orders', '283054010')['OrderArray']['Order'][0]
+            order2['OrderID'] = '283054011'
+
+            # Second page can not be fetched
+            api = FakeTradingApi({
+                'GetOrders': [{
+                    'OrderArray': {'Order': order1},
+                    'HasMoreOrders': 'true',
+                }],
+            })
+            last_import_time = self.ebay_channel.last_order_import_time
+
+            with self.fake_ebay_api(api=api):
+                with Transaction().set_context(ebay_order_import_commit=False):
+                    with self.assertRaises(IndexError):
+                        self.ebay_channel.import_orders()
+                    # The lease is released when the import fails
+                    self.assertFalse(
+                        self.SaleChannel(
+                            self.ebay_channel.id
+                        ).ebay_import_lease_until
+                    )
+
+                    checkpoint, = Checkpoint.search([
+                        ('channel', '=', self.ebay_channel.id),
+                    ])
+                    self.assertEqual(checkpoint.time_from, last_import_time)
+                    self.assertEqual(checkpoint.last_page, 1)
+                    self.assertEqual(checkpoint.last_order_id, '283054010')
+                    time_to = checkpoint.time_to
+                    self.assertEqual(
+                        self.ebay_channel.last_order_import_time,
+                        last_import_time
+                    )
+
+                    api.responses['GetOrders'].append({
+                        'OrderArray': {'Order': order2},
+                        'HasMoreOrders': 'false',
+                    })
+                    # The pages are not moved by a change of their size
+                    self.SaleChannel.write([self.ebay_channel], {
+                        'ebay_orders_per_page': 10,
+                    })
+                    summary = self.ebay_channel.import_orders()
+
+            self.assertEqual(summary['created'], [order2['OrderID']])
+            self.assertEqual(Sale.search([], count=True), 2)
+
+            verb, data = api.calls[-1]
+            self.assertEqual(data['Pagination'], {
+                'EntriesPerPage': 100, 'PageNumber': 2,
+            })
+            self.assertEqual(data['CreateTimeFrom'], last_import_time)
+            self.assertEqual(data['CreateTimeTo'], time_to)
+
+            self.assertFalse(Checkpoint.search([]))
+            self.assertEqual(
+                self.ebay_channel.last_order_import_time, time_to
+            )
+
+            # An import of the modified orders restarts from the first page
+            checkpoint = Checkpoint.get_or_create(self.ebay_channel)
+            self.assertEqual(checkpoint.entries_per_page, 10)
+            self.assertEqual(checkpoint.get_first_page(), 1)
+            Checkpoint.write([checkpoint], {'last_page': 3})
+            self.assertEqual(Checkpoint(checkpoint.id).get_first_page(), 4)
+            Checkpoint.write([checkpoint], {'time_filter': 'modified'})
+            self.assertEqual(Checkpoint(checkpoint.id).get_first_page(), 1)
+
+    def test_0027_import_orders_failing_order(self):
+        """
+        Tests if an order which can not be imported is reported without
+        blocking the import of the other orders of the channel
+        """
+        Sale = POOL.get('sale.sale')
+        Party = POOL.get('party.party')
+        Product = POOL.get('product.product')
+        Checkpoint = POOL.get('sale.channel.ebay.checkpoint')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            with Transaction().set_context({
+                'current_channel': self.ebay_channel.id,
+                'company': self.company
+            }):
+                Party.create_using_ebay_data(
+                    load_json('users', 'testuser_ritu123')
+                )
+                Product.create_using_ebay_data(
+                    load_json('products', '110162956809')
+                )
+                Product.create_using_ebay_data(
+                    load_json('products', '110162957156')
+                )
+
+            orders = []
+            for order_id in ['283054010', '283054011', '283054012']:
+                order_data = load_json(
+                    'orders', '283054010'
+                )['OrderArray']['Order'][0]
+                order_data['OrderID'] = order_id
+                orders.append(order_data)
+            # The country of the address is unknown
+            orders[1]['ShippingAddress']['Country'] = 'ZZ'
+
+            api = FakeTradingApi({
+                'GetOrders': [{
+                    'OrderArray': {'Order': orders[:2]},
+                    'HasMoreOrders': 'false',
+                }] * 2 + [{
+                    'OrderArray': {'Order': orders[1:]},
+                    'HasMoreOrders': 'false',
+                }],
+            })
+
+            with self.fake_ebay_api(api=api):
+                with Transaction().set_context(ebay_order_import_commit=False):
+                    summary = self.ebay_channel.import_orders()
+                    self.assertEqual(summary['created'], ['283054010'])
+                    failed_id, error = summary['failed'][0]
+                    self.assertEqual(len(summary['failed']), 1)
+                    self.assertEqual(failed_id, '283054011')
+                    self.assertTrue(error)
+                    self.assertFalse(Checkpoint.search([]))
+                    run = self.ebay_channel.ebay_import_runs[0]
+                    self.assertEqual(run.orders_failed, 1)
+
+                    # The failing order does not block the next imports
+                    summary = self.ebay_channel.import_orders()
+                    self.assertEqual(summary['skipped'], ['283054010'])
+                    self.assertEqual(
+                        [id for id, _ in summary['failed']], ['283054011']
+                    )
+                    summary = self.ebay_channel.import_orders()
+                    self.assertEqual(summary['created'], ['283054012'])
+                    self.assertEqual(
+                        [id for id, _ in summary['failed']], ['283054011']
+                    )
+
+            self.assertEqual(
+                sorted(sale.ebay_order_id for sale in Sale.search([])),
+                ['283054010', '283054012']
+            )
+
+    def test_0030_connection_pool(self):
+        """
+        Tests if connections to eBay are reused, until the credentials of
+        the channel change
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            connections = []
+
+            def factory():
+                connections.append(FakeTradingApi({
+                    'GetTokenStatus': [{}, {}],
+                }))
+                return connections[-1]
+
+            with self.fake_ebay_api(factory=factory):
+                self.ebay_channel.call_ebay_api('GetTokenStatus')
+                self.ebay_channel.call_ebay_api('GetTokenStatus')
+                self.assertEqual(len(connections), 1)
+                self.assertEqual(len(connections[0].calls), 2)
+
+                self.SaleChannel.write([self.ebay_channel], {
+                    'is_ebay_sandbox': not self.ebay_channel.is_ebay_sandbox,
+                })
+                self.ebay_channel.call_ebay_api('GetTokenStatus')
+                self.assertEqual(len(connections), 2)
+
+    def test_0040_call_executor(self):
+        """
+        Tests if calls submitted to the executor resolve to their responses
+        and are spread by the rate limiter
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            def factory():
+                return FakeTradingApi({
+                    'GetItem': [{'Item': i} for i in range(3)],
+                })
+
+            with self.fake_ebay_api(factory=factory):
+                futures = [
+                    self.ebay_channel.submit_ebay_call('GetItem', {})
+                    for i in range(3)
+                ]
+                for future in futures:
+                    self.assertEqual(future.result().keys(), ['Item'])
+
+            # A burst of one call at 100 calls per second
+            bucket = TokenBucket(100, 1)
+            start = time.time()
+            for i in range(4):
+                bucket.acquire()
+            self.assertTrue(time.time() - start >= 0.03)
+
+    def test_0045_coroutines(self):
+        """
+        Tests if the calls of several coroutines are in flight together and
+        the coroutines get their results
+        """
+        executor = ThreadPoolExecutor(max_workers=4)
+        lock = threading.Lock()
+        in_flight = []
+        most_in_flight = [0]
+
+        def call(value):
+            with lock:
+                in_flight.append(value)
+                most_in_flight[0] = max(most_in_flight[0], len(in_flight))
+            time.sleep(0.05)
+            with lock:
+                in_flight.remove(value)
+            return value
+
+        def double(value):
+            result, = yield gather([executor.submit(call, value)])
+            raise Return(result * 2)
+
+        def add(a, b):
+            first = yield double(a)
+            second = yield executor.submit(call, b)
+            raise Return(first + second)
+
+        def fail():
+            yield executor.submit(call, 0)
+            raise ValueError('Failed')
+
+        def catch():
+            try:
+                yield fail()
+            except ValueError:
+                raise Return('caught')
+
+        try:
+            self.assertEqual(
+                run_coroutines([add(1, 2), double(3), catch()]),
+                [4, 6, 'caught']
+            )
+            self.assertEqual(most_in_flight[0], 3)
+            self.assertRaises(ValueError, run_coroutines, [fail(), fail()])
+
+            # A measured coroutine counts the calls of its own steps and of
+            # the coroutines it waits for, not the ones of other coroutines
+            def counted(value):
+                count_api_call()
+                result = yield executor.submit(call, value)
+                raise Return(result)
+
+            @instrumented_coroutine('measured')
+            def measured(value):
+                first = yield counted(value)
+                second = yield counted(value)
+                raise Return(first + second)
+
+            with Transaction().start(DB_NAME, USER, CONTEXT):
+                recorder = ImportRecorder()
+                with recorder.record():
+                    self.assertEqual(
+                        run_coroutines([
+                            measured(1), measured(2), counted(3),
+                        ]), [2, 4, 3]
+                    )
+            measure = recorder.stages['measured']
+            self.assertEqual(measure.count, 2)
+            self.assertEqual(measure.api_calls, 4)
+            self.assertTrue(measure.seconds >= 0.1)
+            self.assertEqual(recorder.api_calls, 5)
+        finally:
+            executor.shutdown()
+
+    def test_0050_adaptive_poll_interval(self):
+        """
+        Tests if the interval between scheduled imports follows the number
+        of orders found
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            self.SaleChannel.write([self.ebay_channel], {
+                'ebay_min_poll_interval': 5,
+                'ebay_max_poll_interval': 40,
+                'ebay_poll_interval': 10,
+                'ebay_orders_per_page': 50,
+            })
+            channel = self.ebay_channel
+
+            self.assertEqual(channel.get_next_ebay_poll_interval(0), 20)
+            self.assertEqual(channel.get_next_ebay_poll_interval(1), 5)
+            self.assertEqual(channel.get_next_ebay_poll_interval(60), 5)
+            self.assertEqual(channel.get_next_ebay_poll_interval(None), 10)
+
+            self.SaleChannel.write([channel], {'ebay_poll_interval': 40})
+            self.assertEqual(channel.get_next_ebay_poll_interval(0), 40)
+            self.assertEqual(channel.get_next_ebay_poll_interval(10), 20)
+
+    def test_0055_scheduled_import(self):
+        """
+        Tests if a scheduled import probes eBay, reschedules the channel and
+        does not overlap with another run
+        """
+        Checkpoint = POOL.get('sale.channel.ebay.checkpoint')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            api = FakeTradingApi({
+                'GetOrders': [{
+                    'PaginationResult': {'TotalNumberOfEntries': '0'},
+                }],
+            })
+            self.SaleChannel.write([self.ebay_channel], {
+                'ebay_poll_interval': 10,
+            })
+            channel = self.ebay_channel
+            last_import_time = channel.last_order_import_time
+
+            with self.fake_ebay_api(api=api):
+                with Transaction().set_context(ebay_order_import_commit=False):
+                    channel.import_ebay_orders_if_due()
+
+                    # Only the probe is made as there are no orders
+                    verb, data = api.calls[0]
+                    self.assertEqual(len(api.calls), 1)
+                    self.assertEqual(data['Pagination']['EntriesPerPage'], 1)
+                    self.assertEqual(data['CreateTimeFrom'], last_import_time)
+                    self.assertEqual(channel.ebay_poll_interval, 20)
+                    # The next probe starts where this one ended
+                    self.assertTrue(
+                        last_import_time < channel.last_order_import_time <=
+                        data['CreateTimeTo']
+                    )
+                    self.assertTrue(channel.ebay_next_order_import)
+                    self.assertFalse(channel.ebay_import_lease_until)
+
+                    # Another run holds the lease
+                    self.assertTrue(channel.acquire_ebay_import_lease())
+                    self.assertFalse(channel.acquire_ebay_import_lease())
+
+                    channel = self.SaleChannel(channel.id)
+                    channel.import_ebay_orders_if_due()
+                    self.assertEqual(len(api.calls), 1)
+                    self.assertRaises(UserError, channel.import_orders)
+                    channel.release_ebay_import_lease()
+
+                    # A resumed window without orders is not an error
+                    checkpoint = Checkpoint.get_or_create(channel)
+                    Checkpoint.write([checkpoint], {'last_page': 1})
+                    api.responses['GetOrders'].append({
+                        'HasMoreOrders': 'false',
+                    })
+                    summary = channel.import_orders()
+                    self.assertTrue(summary['resumed'])
+                    self.assertEqual(summary['created'], [])
+                    self.assertFalse(
+                        self.SaleChannel(channel.id).ebay_import_lease_until
+                    )
+
+                    # The lease is renewed with each page imported
+                    self.assertTrue(channel.acquire_ebay_import_lease())
+                    self.SaleChannel.write([channel], {
+                        'ebay_import_lease_until': datetime.utcnow(),
+                    })
+                    api.responses['GetOrders'].append({
+                        'HasMoreOrders': 'false',
+                    })
+                    channel.import_ebay_order_window()
+                    self.assertTrue(
+                        self.SaleChannel(channel.id).ebay_import_lease_until >
+                        datetime.utcnow() + timedelta(hours=1)
+                    )
+                    channel.release_ebay_import_lease()
+
+    def test_0060_response_cache(self):
+        """
+        Tests if the responses of GetItem are served from the cache until
+        they expire or are evicted
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            api = FakeTradingApi({
+                'GetItem': [{'Item': {'ItemID': '1'}}] * 3,
+            })
+            channel = self.ebay_channel
+            calls = {'1': {'ItemID': '1'}}
+
+            with self.fake_ebay_api(api=api):
+                for i in range(2):
+                    self.assertEqual(
+                        channel.get_ebay_cached_responses('GetItem', calls),
+                        {'1': {'Item': {'ItemID': '1'}}}
+                    )
+                self.assertEqual(len(api.calls), 1)
+                self.assertEqual(channel.ebay_cache_hits, 1)
+                self.assertEqual(channel.ebay_cache_misses, 1)
+
+                # Items are not cached
+                self.SaleChannel.write([channel], {'ebay_item_cache_ttl': 0})
+                channel.get_ebay_cached_responses('GetItem', calls)
+                self.assertEqual(len(api.calls), 2)
+
+        # Least recently used entries are evicted
+        cache = ResponseCache(':memory:')
+        cache.set_many('scope', 'GetItem', {'1': {}, '2': {}}, 60)
+        cache.get_many('scope', 'GetItem', ['1'])
+        cache.set_many('scope', 'GetItem', {'3': {}}, 60, max_size=2)
+        self.assertEqual(
+            sorted(cache.get_many('scope', 'GetItem', ['1', '2', '3'])),
+            ['1', '3']
+        )
+
+        # Expired entries are not returned
+        cache.set_many('scope', 'GetUser', {'1': {}}, -1)
+        self.assertEqual(cache.get_many('scope', 'GetUser', ['1']), {})
+
+    def test_0070_record_and_replay(self):
+        """
+        Tests if calls to eBay are recorded to a cassette without the token
+        and replayed from it without network
+        """
+        response_xml = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<GetTokenStatusResponse xmlns="urn:ebay:apis:eBLBaseComponents">'
+            '<Ack>Success</Ack><TokenStatus><Status>Active</Status>'
+            '<ExpirationTime>2016-07-30T09:31:23.000Z</ExpirationTime>'
+            '</TokenStatus></GetTokenStatusResponse>'
+        )
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'cassette.jsonl')
+
+        def connection():
+            return TradingConnection(
+                appid='app', devid='dev', certid='cert', token='secret',
+                config_file=None,
+            )
+
+        try:
+            # Record the call, eBay is simulated by the session
+            cassette = Cassette(path, 'record')
+            with open(path, 'w') as cassette_file:
+                cassette_file.write(json.dumps({
+                    'verb': 'GetTokenStatus', 'request': '',
+                    'status_code': 200, 'reason': 'OK', 'headers': {},
+                    'response': response_xml,
+                }) + '\n')
+            response = Cassette(path).replay('GetTokenStatus', '')
+            open(path, 'w').close()
+
+            set_cassette(cassette)
+            api = connection()
+            api.session.send = lambda request, **kwargs: response
+            api.execute('GetTokenStatus')
+
+            with open(path) as cassette_file:
+                recording, = [json.loads(line) for line in cassette_file]
+            self.assertEqual(recording['verb'], 'GetTokenStatus')
+            self.assertEqual(recording['response'], response_xml)
+            self.assertIn('<eBayAuthToken>***', recording['request'])
+            self.assertNotIn('secret', recording['request'])
+
+            # Replay the call
+            set_cassette(Cassette(path, 'replay'))
+            api = connection()
+            api.session.send = None
+            self.assertEqual(
+                api.execute('GetTokenStatus').dict()['TokenStatus'],
+                {
+                    'Status': 'Active',
+                    'ExpirationTime': '2016-07-30T09:31:23.000Z',
+                }
+            )
+            self.assertRaises(LookupError, api.execute, 'GetTokenStatus')
+        finally:
+            set_cassette(None)
+            shutil.rmtree(directory)
+
+    def test_0080_order_stream(self):
+        """
+        Tests if the orders of a GetOrders response are parsed one by one
+        like ebaysdk parses the whole response
+        """
+        data = load_json('orders', '283054010')
+        data['OrderArray']['Order'] = [
+            data['OrderArray']['Order'][0],
+            load_json('orders', '110122281466-0')['OrderArray']['Order'],
+        ]
+        data['HasMoreOrders'] = 'false'
+        xml = dict_to_xml('GetOrders', data)
+
+        expected = Response(
+            ResponseDataObject({'content': xml}, []), verb='GetOrders'
+        ).dict()
+
+        stream = OrderStream(BytesIO(xml))
+        orders = list(stream)
+        self.assertEqual(len(orders), 2)
+        for order, expected_order in zip(
+            orders, expected['OrderArray']['Order']
+        ):
+            # Transactions are always a list
+            transactions = \
+                expected_order['TransactionArray']['Transaction']
+            if isinstance(transactions, dict):
+                expected_order['TransactionArray']['Transaction'] = \
+                    [transactions]
+            self.assertEqual(order, expected_order)
+        self.assertEqual(stream.response['HasMoreOrders'], 'false')
+        self.assertFalse('OrderArray' in stream.response)
+
+        # A failed call raises like ebaysdk
+        stream = OrderStream(BytesIO(dict_to_xml('GetOrders', {
+            'Ack': 'Failure',
+            'Errors': {
+                'ErrorCode': '931',
+                'ShortMessage': 'Auth token is invalid.',
+            },
+        })))
+        self.assertRaises(ConnectionError, list, stream)
+
+    def test_0090_export_inventory(self):
+        """
+        Tests if the quantities and prices of products are pushed to their
+        listings in batches of ReviseInventoryStatus calls
+        """
+        Product = POOL.get('product.product')
+        Listing = POOL.get('sale.channel.ebay.listing')
+        Location = POOL.get('stock.location')
+        Move = POOL.get('stock.move')
+
+        class InventoryApi(FakeTradingApi):
+            timeout = False
+
+            def execute(self, verb, data=None):
+                self.calls.append((verb, data))
+                if self.timeout:
+                    raise socket.timeout('Read timed out')
+                statuses = data['InventoryStatus']
+                if any(s.get('SKU') == 'SKU-5' for s in statuses):
+                    raise ConnectionError('Class: RequestError, Invalid SKU')
+                return FakeResponse({
+                    'Ack': 'Warning',
+                    'InventoryStatus': [
+                        status for status in statuses
+                        if status['ItemID'] != 'ITEM-3'
+                    ],
+                    'Errors': [{
+                        'ShortMessage': 'Item ended.',
+                        'LongMessage': 'The auction has been closed.',
+                        'ErrorParameters': {
+                            '_ParamID': '0', 'Value': status['ItemID'],
+                        },
+                    } for status in statuses if status['ItemID'] == 'ITEM-3'],
+                })
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            api = InventoryApi({})
+
+            with self.fake_ebay_api(api=api):
+                with Transaction().set_context({
+                    'current_channel': self.ebay_channel.id,
+                    'company': self.company.id,
+                }):
+                    items = []
+                    for index in range(6):
+                        item = load_json('products', '110162956809')
+                        item['Item']['ItemID'] = 'ITEM-%d' % index
+                        item['Item']['SKU'] = 'SKU-%d' % index
+                        item['Item']['BuyItNowPrice']['value'] = '10.0'
+                        items.append(item)
+                    products = Product.create_many_using_ebay_data(items)
+                    Product.write([products[5]], {'ebay_item_id': None})
+
+                    Listing.create_many(self.ebay_channel, dict(
+                        (('ITEM-%d' % index, None), product)
+                        for index, product in enumerate(products[:5])
+                    ))
+                    # The item of the first product is relisted
+                    Listing.create_many(self.ebay_channel, {
+                        ('RELIST-0', None): products[0],
+                    })
+
+                    supplier, = Location.search([('code', '=', 'SUP')])
+                    move, = Move.create([{
+                        'product': products[0].id,
+                        'uom': self.uom.id,
+                        'quantity': 5,
+                        'from_location': supplier.id,
+                        'to_location':
+                            self.ebay_channel.warehouse.storage_location.id,
+                        'unit_price': Decimal('1'),
+                        'currency': self.company.currency.id,
+                        'company': self.company.id,
+                    }])
+                    Move.do([move])
+
+                    summary = self.ebay_channel.export_ebay_inventory()
+
+                    # 5 listings in a call of 4 and a call of 1
+                    self.assertEqual(
+                        [len(data['InventoryStatus'])
+                            for verb, data in api.calls],
+                        [4, 1]
+                    )
+                    statuses = dict(
+                        (status['ItemID'], status) for verb, data in api.calls
+                        for status in data['InventoryStatus']
+                    )
+                    self.assertEqual(
+                        sorted(statuses),
+                        ['ITEM-1', 'ITEM-2', 'ITEM-3', 'ITEM-4', 'RELIST-0']
+                    )
+                    self.assertEqual(statuses['RELIST-0']['Quantity'], 5)
+                    self.assertEqual(statuses['ITEM-1']['Quantity'], 0)
+                    self.assertEqual(
+                        statuses['ITEM-1']['StartPrice'], Decimal('11.00')
+                    )
+
+                    self.assertEqual(
+                        sorted(summary['exported']),
+                        sorted([products[i] for i in (0, 1, 2, 4)])
+                    )
+                    self.assertEqual(summary['failed'], [
+                        (products[3], 'The auction has been closed.'),
+                    ])
+
+                    # The products without listing are exported with their
+                    # SKU, a failed call fails all its listings
+                    summary = self.ebay_channel.export_ebay_inventory(
+                        [products[0], products[5]]
+                    )
+                    verb, data = api.calls[-1]
+                    self.assertEqual(data['InventoryStatus'][1], {
+                        'SKU': 'SKU-5',
+                        'Quantity': 0,
+                        'StartPrice': Decimal('11.00'),
+                    })
+                    self.assertEqual(summary['exported'], [])
+                    self.assertEqual(
+                        [product for product, _ in summary['failed']],
+                        [products[0], products[5]]
+                    )
+
+                    self.assertEqual(
+                        len(self.ebay_channel.export_product_prices()), 4
+                    )
+
+                    # A product without listing, eBay item ID or code is
+                    # reported, any error of a call fails its listings only
+                    Product.write([products[5]], {'code': None})
+                    api.timeout = True
+                    summary = self.ebay_channel.export_ebay_inventory(
+                        [products[1], products[5]]
+                    )
+                    self.assertEqual(summary['exported'], [])
+                    self.assertEqual(summary['failed'], [
+                        (products[5], 'Product is not listed on eBay'),
+                        (products[1], 'Read timed out'),
+                    ])
+
 
 def suite():
     """
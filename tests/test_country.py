@@ -94,6 +94,73 @@ class TestCountry(TestBase):
                 self.Subdivision.search_using_ebay_state, code, country
             )
 
+    def test_0025_search_state_with_alias_and_fallback(self):
+        """
+        Tests if states are matched irrespective of case, accents and dots,
+        by eBay aliases, and if unknown states can be left empty
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            subdivision_dl, = self.Subdivision.search([
+                ('code', '=', 'IN-DL')
+            ])
+
+            for value in ['in-dl', 'D.L.', 'new delhi', u'N\xe9w  Delhi']:
+                self.assertEqual(
+                    self.Subdivision.search_using_ebay_state(
+                        value, self.country_in
+                    ),
+                    subdivision_dl
+                )
+
+            self.assertIsNone(
+                self.Subdivision.search_using_ebay_state(
+                    'abc', self.country_in, silent=True
+                )
+            )
+            self.assertIsNone(
+                self.Subdivision.search_using_ebay_state(
+                    None, self.country_in, silent=True
+                )
+            )
+
+            # Index is refreshed when subdivisions change
+            self.Subdivision.create([{
+                'name': 'Goa',
+                'code': 'IN-GA',
+                'type': 'state',
+                'country': self.country_in.id,
+            }])
+            self.assertEqual(
+                self.Subdivision.search_using_ebay_state(
+                    'GOA', self.country_in
+                ).code,
+                'IN-GA'
+            )
+
+    def test_0030_get_country_by_code(self):
+        """
+        Tests if countries are found by code and the cache is cleared when
+        countries are written
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            self.assertEqual(
+                self.Country.get_by_code('US'), self.country_us
+            )
+            self.assertEqual(
+                self.Country.get_by_code('US'), self.country_us
+            )
+
+            self.Country.write([self.country_us], {'code': 'UX'})
+
+            self.assertEqual(
+                self.Country.get_by_code('UX'), self.country_us
+            )
+            self.assertRaises(ValueError, self.Country.get_by_code, 'US')
+
 
 def suite():
     """
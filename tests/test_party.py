@@ -20,10 +20,13 @@ if os.path.isdir(DIR):
     sys.path.insert(0, os.path.dirname(DIR))
 
 import trytond.tests.test_tryton
-from trytond.tests.test_tryton import USER, DB_NAME, CONTEXT
+from trytond.tests.test_tryton import POOL, USER, DB_NAME, CONTEXT
 from test_base import TestBase, load_json
+from trytond import backend
 from trytond.transaction import Transaction
 from trytond.exceptions import UserError
+from trytond.modules.ebay.records import EbayAddress
+from trytond.modules.ebay.response_cache import get_response_cache
 
 
 class TestParty(TestBase):
@@ -135,6 +138,10 @@ class TestParty(TestBase):
             self.assertFalse(self.party.phone)
             self.assertEqual(len(self.party.contact_mechanisms), 0)
 
+            # No phone is added when eBay does not give one
+            self.party.add_phone_using_ebay_data(None)
+            self.assertEqual(len(self.party.contact_mechanisms), 0)
+
             # Add phone to party using ebay data
             self.party.add_phone_using_ebay_data(
                 address_data['Phone']
@@ -227,6 +234,52 @@ class TestParty(TestBase):
                 )
             )
 
+    def test0045_address_fingerprint(self):
+        """
+        Tests if the address fingerprint is kept up to date and used to find
+        the address
+        """
+        Address = POOL.get('party.address')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+
+            self.setup_defaults()
+
+            address_data = load_json('addresses', '1a')
+            address = self.party.find_or_create_address_using_ebay_data(
+                address_data
+            )
+            fingerprint = address.ebay_fingerprint
+            self.assertTrue(fingerprint)
+            self.assertEqual(
+                fingerprint,
+                self.party.get_address_from_ebay_data(
+                    address_data
+                ).get_ebay_fingerprint()
+            )
+
+            # Case and spacing does not matter
+            address_data['Street1'] = '  ' + address_data['Street1'].upper()
+            self.assertEqual(
+                self.party.find_or_create_address_using_ebay_data(
+                    address_data
+                ),
+                address
+            )
+
+            Address.write([address], {'street': 'Another Street'})
+            self.assertNotEqual(
+                Address(address.id).ebay_fingerprint, fingerprint
+            )
+
+            # Old address data does not match anymore
+            self.assertNotEqual(
+                self.party.find_or_create_address_using_ebay_data(
+                    load_json('addresses', '1a')
+                ),
+                address
+            )
+
     def test0050_check_unique_ebay_user_id(self):
         """
         Tests if error is raised for duplicate ebay user id for party
@@ -258,6 +311,9 @@ class TestParty(TestBase):
             }])
             self.assert_(party3)
 
+            # The single record check is still available on the instance
+            party3.check_unique_ebay_user_id()
+
             # Create party with same ebay user ID again
             # Should raise error
             with self.assertRaises(UserError):
@@ -266,6 +322,130 @@ class TestParty(TestBase):
                     'ebay_user_id': 'EBAYTEST',
                 }])
 
+            with self.assertRaises(UserError) as cm:
+                self.Party.create([{
+                    'name': 'Test Party %s' % ebay_user_id,
+                    'ebay_user_id': ebay_user_id,
+                } for ebay_user_id in ['EBAYTEST', 'EBAY1', 'EBAY1', 'EBAY2']])
+
+            # All the duplicates of a bulk create are reported at once, on
+            # PostgreSQL the unique index rejects them before the validation
+            if backend.name() != 'postgresql':
+                self.assertIn('EBAY1, EBAYTEST', cm.exception.message)
+                self.assertNotIn('EBAY2', cm.exception.message)
+
+    def test0060_find_or_create_many_parties(self):
+        """
+        Tests if parties for many eBay users are resolved together and only
+        the unknown users are fetched from eBay, once each
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+
+            self.setup_defaults()
+
+            party1 = self.Party.create_using_ebay_data(
+                load_json('users', 'testuser_ritu123')
+            )
+
+            user_data = load_json('users', 'testuser_ritu123')
+            user_data['User']['UserID'] = 'testuser_new'
+            with self.fake_ebay_api({'GetUser': [user_data]}) as api:
+                with Transaction().set_context(
+                    current_channel=self.ebay_channel.id
+                ):
+                    parties = self.Party.find_or_create_many_using_ebay_ids([
+                        ('testuser_ritu123', '110162956809'),
+                        ('testuser_new', None),
+                        ('testuser_new', '110162957156'),
+                    ])
+
+            self.assertEqual(len(parties), 2)
+            self.assertEqual(parties['testuser_ritu123'], party1)
+            self.assertEqual(parties['testuser_new'].name, 'testuser_new')
+            self.assertEqual(api.calls, [(
+                'GetUser', {
+                    'UserID': 'testuser_new', 'ItemID': '110162957156'
+                }
+            )])
+
+            # The response is cached for the user and the item of the call
+            self.assertEqual(
+                get_response_cache().get_many(
+                    self.ebay_channel.get_ebay_cache_scope(), 'GetUser',
+                    ['testuser_new', 'testuser_new:110162957156'],
+                ).keys(),
+                ['testuser_new:110162957156']
+            )
+
+    def test0065_find_or_create_many_addresses(self):
+        """
+        Tests if the phones and the addresses of many parties are added
+        together, once each
+        """
+        Address = POOL.get('party.address')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+
+            self.setup_defaults()
+
+            party2, = self.Party.create([{'name': 'Another Party'}])
+            address = self.party.find_or_create_address_using_ebay_data(
+                load_json('addresses', '1a')
+            )
+            ebay_address1 = EbayAddress.from_ebay_data(
+                load_json('addresses', '1a')
+            )
+            ebay_address2 = EbayAddress.from_ebay_data(
+                load_json('addresses', '1c')
+            )
+
+            addresses_count = Address.search([
+                ('party', '=', self.party.id),
+            ], count=True)
+
+            addresses = self.Party. \
+                find_or_create_addresses_using_ebay_addresses([
+                    (self.party, ebay_address1),
+                    (self.party, ebay_address2),
+                    (party2, ebay_address1),
+                    (party2, ebay_address1),
+                ])
+
+            self.assertEqual(len(addresses), 4)
+            self.assertEqual(addresses[0], address)
+            self.assertNotEqual(addresses[1], address)
+            self.assertEqual(addresses[1].party, self.party)
+            self.assertEqual(addresses[2].party, party2)
+            self.assertTrue(addresses[2].is_match_found(address))
+            # The address repeated for a party is created once
+            self.assertEqual(addresses[2], addresses[3])
+            self.assertEqual(
+                Address.search([
+                    ('party', '=', self.party.id),
+                ], count=True),
+                addresses_count + 1
+            )
+
+            phone = load_json(
+                'orders', '283054010'
+            )['OrderArray']['Order'][0]['ShippingAddress']['Phone']
+            self.party.add_phone_using_ebay_data(phone)
+
+            self.Party.add_phones_using_ebay_data([
+                (self.party, phone),
+                (party2, phone),
+                (party2, phone),
+                (party2, None),
+            ])
+
+            self.assertEqual(
+                len(self.Party(self.party.id).contact_mechanisms), 1
+            )
+            self.assertEqual(
+                [m.value for m in self.Party(party2.id).contact_mechanisms],
+                [phone]
+            )
+
 
 def suite():
     """
@@ -90,6 +90,43 @@ class TestProduct(TestBase):
                     ebay_data,
                 )
 
+    def test0030_import_many_products(self):
+        """
+        Tests if products for many eBay items are resolved together and only
+        the missing ones are fetched from eBay
+        """
+        Product = POOL.get('product.product')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT) as txn:
+
+            self.setup_defaults()
+
+            with txn.set_context({
+                'current_channel': self.ebay_channel.id,
+                'company': self.company,
+            }):
+                product1 = Product.create_using_ebay_data(
+                    load_json('products', '110162956809')
+                )
+
+                with self.fake_ebay_api({
+                    'GetItem': [load_json('products', '110162957156')],
+                }) as api:
+                    products = self.ebay_channel.import_ebay_products([
+                        '110162956809', '110162957156', '110162956809',
+                    ])
+
+                self.assertEqual(len(products), 2)
+                self.assertEqual(products['110162956809'], product1)
+                self.assertEqual(
+                    products['110162957156'].ebay_item_id, '110162957156'
+                )
+                self.assertEqual(api.calls, [(
+                    'GetItem', {
+                        'ItemID': '110162957156', 'DetailLevel': 'ReturnAll'
+                    }
+                )])
+
 
 def suite():
     """
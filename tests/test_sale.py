@@ -10,6 +10,8 @@
 import os
 import sys
 import unittest
+from decimal import Decimal
+from datetime import date
 DIR = os.path.abspath(os.path.normpath(
     os.path.join(
         __file__,
@@ -23,6 +25,7 @@ import trytond.tests.test_tryton
 from trytond.tests.test_tryton import POOL, USER, DB_NAME, CONTEXT
 from test_base import TestBase, load_json
 from trytond.transaction import Transaction
+from trytond.modules.ebay.records import EbayOrder
 
 
 class TestSale(TestBase):
@@ -136,6 +139,276 @@ class TestSale(TestBase):
                 # Item lines + shipping line should be equal to lines on tryton
                 self.assertEqual(len(order.lines), 3)
 
+    def test_0030_import_many_sale_orders(self):
+        """
+        Tests import of several sale orders in one batch
+        """
+        Sale = POOL.get('sale.sale')
+        Party = POOL.get('party.party')
+        Product = POOL.get('product.product')
+        ChannelException = POOL.get('channel.exception')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            with Transaction().set_context({
+                'current_channel': self.ebay_channel.id,
+                'company': self.company
+            }):
+
+                Party.create_using_ebay_data(
+                    load_json('users', 'testuser_ritu123')
+                )
+                Product.create_using_ebay_data(
+                    load_json('products', '110162956809')
+                )
+                Product.create_using_ebay_data(
+                    load_json('products', '110162957156')
+                )
+
+                orders = []
+                for order_id, total in [
+                    ('283054010', '4.0'),
+                    ('283054011', '8.5'),
+                    ('283054012', '4.0'),
+                ]:
+                    order_data = load_json(
+                        'orders', '283054010'
+                    )['OrderArray']['Order'][0]
+                    order_data['OrderID'] = order_id
+                    order_data['Total']['value'] = total
+                    orders.append(order_data)
+
+                sales = Sale.create_many_using_ebay_data(orders)
+
+                self.assertEqual(
+                    [sale.ebay_order_id for sale in sales],
+                    ['283054010', '283054011', '283054012']
+                )
+                self.assertEqual(
+                    [sale.state for sale in sales],
+                    ['confirmed', 'draft', 'confirmed']
+                )
+                exception, = ChannelException.search([])
+                self.assertEqual(exception.origin, sales[1])
+
+                # Item lines + shipping line for each sale
+                for sale in sales:
+                    self.assertEqual(len(sale.lines), 3)
+
+    def test_0040_order_record(self):
+        """
+        Tests if the order data of ebay is normalized into a record
+        """
+        order_data = load_json('orders', '283054010')['OrderArray']['Order'][0]
+        order_data['TransactionArray']['Transaction'] = \
+            order_data['TransactionArray']['Transaction'][0]
+        del order_data['ShippingServiceSelected']
+
+        order = EbayOrder.from_ebay_data(order_data)
+
+        self.assertEqual(order.order_id, order_data['OrderID'])
+        self.assertEqual(order.buyer_user_id, order_data['BuyerUserID'])
+        self.assertEqual(order.created_date, date(2015, 6, 4))
+        self.assertEqual(order.currency_code, 'USD')
+        self.assertEqual(order.total, Decimal(order_data['Total']['value']))
+
+        # A single transaction is a single line
+        line, = order.lines
+        self.assertEqual(line.unit_price, Decimal('2.0'))
+        self.assertEqual(line.quantity, Decimal('1'))
+
+        # No shipping service is a free shipping
+        self.assertEqual(order.shipping.cost, Decimal('0'))
+        self.assertEqual(order.shipping.service, None)
+
+        self.assertEqual(
+            order.address.phone, order_data['ShippingAddress']['Phone']
+        )
+        self.assertFalse(hasattr(order, '__dict__'))
+
+    def test_0050_resync_changed_orders(self):
+        """
+        Tests if the orders changed on eBay are applied to their sales
+        """
+        Sale = POOL.get('sale.sale')
+        Party = POOL.get('party.party')
+        Product = POOL.get('product.product')
+        ChannelException = POOL.get('channel.exception')
+        SaleLine = POOL.get('sale.line')
+        Listing = POOL.get('sale.channel.ebay.listing')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            with Transaction().set_context({
+                'current_channel': self.ebay_channel.id,
+                'company': self.company
+            }):
+
+                Party.create_using_ebay_data(
+                    load_json('users', 'testuser_ritu123')
+                )
+                Product.create_using_ebay_data(
+                    load_json('products', '110162956809')
+                )
+                Product.create_using_ebay_data(
+                    load_json('products', '110162957156')
+                )
+
+                orders = []
+                for order_id, total in [
+                    ('283054010', '4.0'),
+                    ('283054011', '8.5'),
+                    ('283054012', '9.5'),
+                ]:
+                    order_data = load_json(
+                        'orders', '283054010'
+                    )['OrderArray']['Order'][0]
+                    order_data['OrderID'] = order_id
+                    order_data['Total']['value'] = total
+                    orders.append(order_data)
+                confirmed_order, fixed_order, draft_order = orders
+
+                self.assertEqual(
+                    self.ebay_channel.import_ebay_order_page(orders),
+                    (['283054010', '283054011', '283054012'], [], [])
+                )
+                confirmed_sale, = Sale.search([
+                    ('ebay_order_id', '=', '283054010'),
+                ])
+                fixed_sale, = Sale.search([
+                    ('ebay_order_id', '=', '283054011'),
+                ])
+                draft_sale, = Sale.search([
+                    ('ebay_order_id', '=', '283054012'),
+                ])
+                self.assertEqual(confirmed_sale.state, 'confirmed')
+                self.assertEqual(fixed_sale.state, 'draft')
+                self.assertEqual(draft_sale.state, 'draft')
+                self.assertEqual(len(ChannelException.search([])), 2)
+
+                # Unchanged orders are skipped
+                self.assertEqual(
+                    self.ebay_channel.import_ebay_order_page(orders),
+                    ([], [], ['283054010', '283054011', '283054012'])
+                )
+
+                # The sales imported before their hash was stored get the
+                # hash of their order, without being compared to it
+                payload_hashes = Sale.get_ebay_payload_hashes(
+                    ['283054010', '283054011']
+                )
+                Sale.write([confirmed_sale, fixed_sale], {
+                    'ebay_payload_hash': None,
+                })
+                confirmed_order['ShippingAddress']['Phone'] = '1 800 222 2222'
+                self.assertEqual(
+                    self.ebay_channel.import_ebay_order_page(orders),
+                    ([], [], ['283054010', '283054011', '283054012'])
+                )
+                self.assertEqual(len(ChannelException.search([])), 2)
+                self.assertNotEqual(
+                    Sale.get_ebay_payload_hashes(['283054010']),
+                    {'283054010': payload_hashes['283054010']}
+                )
+                self.assertEqual(
+                    Sale.get_ebay_payload_hashes(['283054011']),
+                    {'283054011': payload_hashes['283054011']}
+                )
+
+                # The address and the lines of the draft sales are replaced,
+                # the change of the confirmed sale is reported
+                for order_data in orders:
+                    order_data['ShippingAddress']['Street1'] = 'new address'
+                fixed_order['TransactionArray']['Transaction'][1][
+                    'QuantityPurchased'] = '3'
+                fixed_order['Total']['value'] = '8.0'
+
+                self.assertEqual(
+                    self.ebay_channel.import_ebay_order_page(orders),
+                    ([], ['283054010', '283054011', '283054012'], [])
+                )
+
+                confirmed_sale = Sale(confirmed_sale.id)
+                self.assertEqual(
+                    confirmed_sale.shipment_address.street, 'address'
+                )
+                exception, = ChannelException.search([
+                    ('origin', '=', str(confirmed_sale)),
+                ])
+                self.assertEqual(
+                    exception.log, 'Order changed on eBay: address'
+                )
+
+                # The new total matches, the sale is confirmed without new
+                # exception
+                fixed_sale = Sale(fixed_sale.id)
+                self.assertEqual(fixed_sale.state, 'confirmed')
+                self.assertEqual(
+                    fixed_sale.shipment_address.street, 'new address'
+                )
+                self.assertEqual(
+                    fixed_sale.invoice_address, fixed_sale.shipment_address
+                )
+                self.assertEqual(len(fixed_sale.lines), 3)
+                self.assertEqual(
+                    sorted(line.quantity for line in fixed_sale.lines),
+                    [1, 1, 3]
+                )
+                self.assertEqual(fixed_sale.total_amount, Decimal('8.0'))
+                self.assertEqual(len(ChannelException.search([])), 3)
+
+                # Only the address of the other draft sale changed
+                draft_sale = Sale(draft_sale.id)
+                self.assertEqual(draft_sale.state, 'draft')
+                self.assertEqual(
+                    draft_sale.shipment_address.street, 'new address'
+                )
+
+                # The lines are not compared by description, which is the
+                # title of the item for variations imported earlier
+                SaleLine.write([draft_sale.lines[0]], {
+                    'description': 'Title of the item',
+                })
+                order = EbayOrder.from_ebay_data(draft_order)
+                self.assertEqual(
+                    Sale.get_ebay_order_changes(
+                        Sale(draft_sale.id), order, Listing.get_products(
+                            self.ebay_channel,
+                            Sale.get_ebay_listing_keys([order])[0]
+                        )
+                    ), []
+                )
+
+                # The cancellation is applied on the draft sale only, the
+                # changes of the confirmed sales are reported until fixed
+                for order_data in orders:
+                    order_data['OrderStatus'] = 'Cancelled'
+                self.assertEqual(
+                    self.ebay_channel.import_ebay_order_page(orders),
+                    ([], ['283054010', '283054011', '283054012'], [])
+                )
+                self.assertEqual(Sale(draft_sale.id).state, 'cancel')
+                self.assertEqual(Sale(fixed_sale.id).state, 'confirmed')
+                self.assertEqual(Sale(confirmed_sale.id).state, 'confirmed')
+                self.assertEqual(
+                    ChannelException.search([
+                        ('origin', '=', str(confirmed_sale)),
+                    ], order=[('id', 'DESC')])[0].log,
+                    'Order changed on eBay: status, address'
+                )
+                self.assertEqual(
+                    ChannelException.search([
+                        ('origin', '=', str(fixed_sale)),
+                    ], order=[('id', 'DESC')])[0].log,
+                    'Order changed on eBay: status'
+                )
+
+                # The sale is returned by the import of a single order
+                self.assertEqual(
+                    self.ebay_channel.import_order(draft_order), draft_sale
+                )
 
 def suite():
     """
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+    utils
+
+    :copyright: (c) 2015 by Openlabs Technologies & Consulting (P) Limited
+    :license: GPLv3, see LICENSE for more details.
+"""
+import logging
+
+from sql import Column, Literal, Null
+from sql.aggregate import Count
+
+from trytond import backend
+from trytond.tools import grouped_slice
+from trytond.transaction import Transaction
+
+logger = logging.getLogger(__name__)
+
+
+class LookupCacheMixin(object):
+    """
+    Mixin for models whose records are looked up by the value of a field,
+    like a country by its code. The IDs found are cached until a record of
+    the model is created, written or deleted.
+
+    The model sets `_lookup_cache` to a `trytond.cache.Cache` created with
+    `context=False` and `_lookup_field` to the name of the field.
+    """
+    _lookup_cache = None
+    _lookup_field = None
+
+    @classmethod
+    def get_by_lookup(cls, value):
+        """
+        Return the record whose lookup field has the given value
+
+        :param value: Value of the lookup field
+        :return: Active record
+        """
+        record_id = cls._lookup_cache.get(value)
+        if record_id is None:
+            record, = cls.search([(cls._lookup_field, '=', value)], limit=1)
+            record_id = cls._lookup_cache.set(value, record.id)
+        return cls(record_id)
+
+    @classmethod
+    def create(cls, vlist):
+        cls._lookup_cache.clear()
+        return super(LookupCacheMixin, cls).create(vlist)
+
+    @classmethod
+    def write(cls, *args):
+        cls._lookup_cache.clear()
+        super(LookupCacheMixin, cls).write(*args)
+
+    @classmethod
+    def delete(cls, records):
+        cls._lookup_cache.clear()
+        super(LookupCacheMixin, cls).delete(records)
+
+
+def get_unique_index_name(model, column_name):
+    """
+    Return the name of the unique index on `column_name` of `model`
+    """
+    return '%s_%s_unique_index' % (model._table, column_name)
+
+
+def get_duplicate_values(model, column_name, values):
+    """
+    Return the values among `values` which are set on more than one record
+    of `model`, with one grouped query.
+
+    :param model: Model class
+    :param column_name: Name of the column to check
+    :param values: List of values to check
+    :return: Sorted list of duplicated values
+    """
+    values = list(set(filter(None, values)))
+    if not values:
+        return []
+
+    table = model.__table__()
+    column = Column(table, column_name)
+    cursor = Transaction().cursor
+
+    duplicates = []
+    for sub_values in grouped_slice(values):
+        cursor.execute(*table.select(
+            column,
+            where=column.in_(list(sub_values)),
+            group_by=column, having=Count(Literal(1)) > 1
+        ))
+        duplicates.extend(value for value, in cursor.fetchall())
+    return sorted(duplicates)
+
+
+def add_unique_index_where_set(model, module_name, column_name):
+    """
+    Add a unique index on `column_name` of the table of `model`, restricted
+    to the rows where the column is set.
+
+    Partial indexes are only created on PostgreSQL. The index is not created
+    if the table already has duplicates, which must be fixed first.
+
+    :param model: Model class, to be called from its `__register__`
+    :param module_name: Name of the module registering the model
+    :param column_name: Name of the column to index
+    """
+    if backend.name() != 'postgresql':
+        return
+
+    TableHandler = backend.get('TableHandler')
+    cursor = Transaction().cursor
+    table_handler = TableHandler(cursor, model, module_name)
+
+    index_name = get_unique_index_name(model, column_name)
+    if index_name in table_handler._indexes:
+        return
+
+    table = model.__table__()
+    column = Column(table, column_name)
+    cursor.execute(*table.select(
+        column,
+        where=(column != Null) & (column != ''),
+        group_by=column, having=Count(Literal(1)) > 1, limit=1
+    ))
+    duplicate = cursor.fetchone()
+    if duplicate:
+        logger.warning(
+            'Unique index %s not created, duplicate value %r found in %s',
+            index_name, duplicate[0], column_name
+        )
+        return
+
+    cursor.execute(
+        'CREATE UNIQUE INDEX "' + index_name + '" '
+        'ON "' + model._table + '" ("' + column_name + '") '
+        'WHERE "' + column_name + '" IS NOT NULL '
+        'AND "' + column_name + '" != \'\''
+    )
+    table_handler._update_definitions()